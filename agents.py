@@ -1,50 +1,218 @@
 # agents.py
-from transformers import AutoTokenizer, AutoModelForCausalLM
+import re
+import time
+from contextlib import nullcontext
+from transformers import AutoModelForCausalLM, StoppingCriteria, StoppingCriteriaList
 import torch
-from retriever import retrieve
+from instrumentation import span, observe
+from retriever import run_retrieval
+from retrieval_plan import RetrievalPlan
+import case_digests
+import role_adapters
+from prompt_tokens import load_tokenizer, PromptEncoder
+from profiling import profile_request
 
 MODEL_DIR = "./moot_lora_simple"  # path to LoRA + base adapter or to base model with adapters applied
-tokenizer = AutoTokenizer.from_pretrained(MODEL_DIR, use_fast=False)
-model = AutoModelForCausalLM.from_pretrained(MODEL_DIR, device_map="auto", torch_dtype=torch.float16)
+if role_adapters.available(MODEL_DIR):
+    # one resident base model; each role's request switches to its own LoRA adapter
+    adapters = role_adapters.RoleAdapters(MODEL_DIR)
+    tokenizer, model = adapters.tokenizer, adapters.model
+else:
+    adapters = None
+    tokenizer = load_tokenizer(MODEL_DIR)  # fast (Rust) tokenizer, checked against the slow one
+    model = AutoModelForCausalLM.from_pretrained(MODEL_DIR, device_map="auto", torch_dtype=torch.float16)
 # If you saved just LoRA adapters, load them with peft.get_peft_model - omitted here for brevity.
 
-def make_context(facts, top_k=4):
-    docs = retrieve(facts, top_k=top_k)
-    ctx = "\n".join([f"[{d.get('source','unknown')}] {d.get('text','')}" for d in docs])
-    return ctx
+def context_entries(facts, top_k=4, plan=None):
+    """One "[source] ..." entry per precedent"""
+    with span("agents.make_context", top_k=top_k, planned=plan is not None) as s:
+        if plan is not None:
+            # reuse the request's retrieval instead of searching again
+            entries = plan.context_entries(top_k)
+        else:
+            # diversified so several chunks of one judgment don't eat the prompt budget
+            docs, _, bundle = run_retrieval(facts, top_k=top_k, diversify=True, max_per_case=2)
+            # holding/ratio/orders digests (case_digests.py) instead of raw judgment text,
+            # one per case even when two of its passages were retrieved
+            entries = case_digests.context_entries(docs, bundle.digests if bundle is not None else {})
+        s.set(chars=sum(len(e) for e in entries) + max(len(entries) - 1, 0))
+    return entries
+
+def make_context(facts, top_k=4, plan=None):
+    return "\n".join(context_entries(facts, top_k, plan))
 
 # role prompts
-SYSTEM_TEMPLATES = {
-    "claimant": "You are the Claimant's counsel in a moot court. Produce a clear legal submission arguing that dismissal was unfair. Support your submission by reference to the provided precedents where relevant. Keep to < 600 words.",
-    "respondent": "You are the Respondent's counsel. Provide a rebuttal to the Claimant's points. Use the precedents to support the defense of the employer. Keep it focused and professional.",
-    "judge": "You are the Judge. Given the facts and arguments, analyze procedurally and substantively, evaluate the cited precedents and give a reasoned judgment, list orders and monetary award if any."
+SYSTEM_TEMPLATES = role_adapters.SYSTEM_TEMPLATES  # the adapters are trained on the same templates
+ANSWER_HEADERS = role_adapters.ANSWER_HEADERS
+
+SECTION_HEADERS = ("\n\nContext:\n", "\n\nFacts:\n", "\n\nClaimant Submission:\n", "\n\nClaimant said:\n",
+                   "\n\nRespondent Submission:\n", "\n\nClaimant:\n", "\n\nRespondent:\n", "\n\nJudgment:\n", "\n")
+# templates and headers are tokenized once; context entries are cached as they are first seen
+prompt_encoder = PromptEncoder(tokenizer, static=list(SYSTEM_TEMPLATES.values()) + list(SECTION_HEADERS))
+
+def build_prompt(role, ctx_entries, sections):
+    """Prompt token ids: role template, context, then (header, text) sections and the role's answer header
+    (the layout the role adapters are trained on, see role_adapters.prompt_segments)
+    """
+    return prompt_encoder.build(role_adapters.prompt_segments(role, ctx_entries, sections))
+
+# a turn is over when the model starts a line with another section of the hearing
+ROLE_STOP_HEADERS = {
+    "claimant": ("Claimant Submission", "Claimant said", "Respondent Submission", "Respondent", "Judgment",
+                 "Facts", "Context"),
+    "respondent": ("Respondent Submission", "Claimant Submission", "Claimant said", "Claimant", "Judgment",
+                   "Facts", "Context"),
+    # the judge may discuss "Claimant:" / "Respondent:" points under its own headings
+    "judge": ("Judgment", "Claimant Submission", "Respondent Submission", "Facts", "Context"),
 }
+ROLE_MAX_TIME = {"claimant": 60.0, "respondent": 60.0, "judge": 120.0}  # wall-clock budget per turn, seconds
+DEFAULT_MAX_TIME = 90.0
+STOP_LOOKBACK_TOKENS = 24  # new tokens decoded per step when looking for a stop header
+REPEAT_NGRAM = 12          # tokens compared when looking for repeated output
+REPEAT_TIMES = 3           # occurrences of the same n-gram before it counts towards a loop
+REPEAT_RUN = 24            # consecutive such n-grams (a repeated span of REPEAT_NGRAM + REPEAT_RUN - 1 tokens)
+
+
+def _stop_pattern(role):
+    headers = ROLE_STOP_HEADERS.get(role, tuple(sorted({h for hs in ROLE_STOP_HEADERS.values() for h in hs})))
+    # "Respondent Submission:" alone on its line, or followed by the runaway text itself
+    return re.compile(r"\n[ \t]*(?:" + "|".join(re.escape(h) for h in headers) + r"):(?=\s|$)")
+
+class _FirstTokenTimer(StoppingCriteria):
+    """Never stops generation; notes when the first new token exists (end of prefill)"""
+    def __init__(self):
+        self.first_token_at = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+class _StopOnHeader(StoppingCriteria):
+    """Stops once the new text contains one of the role's stop headers"""
+    def __init__(self, pattern, prompt_tokens):
+        self.pattern = pattern
+        self.prompt_tokens = prompt_tokens
+        self.triggered = False
 
-def generate(prompt, max_new_tokens=512):
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    out = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False, temperature=0.0)
-    text = tokenizer.decode(out[0], skip_special_tokens=True)
-    # strip off the prompt part (simple heuristic)
-    return text[len(prompt):].strip()
-
-def run_moot(facts):
-    ctx = make_context(facts, top_k=4)
-    # 1. Claimant
-    claim_prompt = SYSTEM_TEMPLATES["claimant"] + "\n\nContext:\n" + ctx + "\n\nFacts:\n" + facts + "\n\nClaimant Submission:\n"
-    claimant_submission = generate(claim_prompt)
-    print("=== Claimant ===\n", claimant_submission)
-
-    # 2. Respondent
-    resp_prompt = SYSTEM_TEMPLATES["respondent"] + "\n\nContext:\n" + ctx + "\n\nFacts:\n" + facts + "\n\nClaimant said:\n" + claimant_submission + "\n\nRespondent Submission:\n"
-    respondent_submission = generate(resp_prompt)
-    print("=== Respondent ===\n", respondent_submission)
-
-    # 3. Judge
-    judge_prompt = SYSTEM_TEMPLATES["judge"] + "\n\nContext:\n" + ctx + "\n\nFacts:\n" + facts + "\n\nClaimant:\n" + claimant_submission + "\n\nRespondent:\n" + respondent_submission + "\n\nJudgment:\n"
-    judgment = generate(judge_prompt, max_new_tokens=1024)
-    print("=== Judge ===\n", judgment)
-    return claimant_submission, respondent_submission, judgment
+    def __call__(self, input_ids, scores, **kwargs):
+        n_new = input_ids.shape[1] - self.prompt_tokens
+        tail = tokenizer.decode(input_ids[0, -min(n_new, STOP_LOOKBACK_TOKENS):], skip_special_tokens=True)
+        if n_new <= STOP_LOOKBACK_TOKENS:
+            tail = "\n" + tail  # the output starts a line
+        self.triggered = self.triggered or bool(self.pattern.search(tail))
+        return torch.full((input_ids.shape[0],), self.triggered, dtype=torch.bool, device=input_ids.device)
+
+class _StopOnRepetition(StoppingCriteria):
+    """Stops when the output loops: REPEAT_RUN consecutive REPEAT_NGRAM-token n-grams that each
+    occur for the REPEAT_TIMES-th time. A quoted phrase repeated once or twice does not trigger it.
+    """
+    def __init__(self, prompt_tokens, n=REPEAT_NGRAM, times=REPEAT_TIMES, run=REPEAT_RUN):
+        self.prompt_tokens = prompt_tokens
+        self.n = n
+        self.times = times
+        self.run_needed = run
+        self.seen = {}  # n-gram -> new-token offsets where it started
+        self.run = 0
+        self.cut = None  # new-token offset where the repeats start (the first copy is kept)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        n_new = input_ids.shape[1] - self.prompt_tokens
+        if self.cut is None and n_new >= self.n:
+            start = n_new - self.n
+            starts = self.seen.setdefault(tuple(input_ids[0, -self.n:].tolist()), [])
+            self.run = self.run + 1 if len(starts) >= self.times - 1 else 0
+            if self.run >= self.run_needed:
+                first = start - self.run + 1  # this copy of the looping text starts here
+                period = start - starts[-1]
+                self.cut = first - period if first >= period else first
+            starts.append(start)
+        return torch.full((input_ids.shape[0],), self.cut is not None, dtype=torch.bool, device=input_ids.device)
+
+def generate(prompt, max_new_tokens=512, role=None, max_time=None):
+    """prompt: text, or token ids from build_prompt"""
+    max_time = ROLE_MAX_TIME.get(role, DEFAULT_MAX_TIME) if max_time is None else max_time
+    with span("generate", role=role):
+        with span("generate.tokenize"):
+            if isinstance(prompt, str):
+                inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+            else:
+                input_ids = torch.tensor([prompt], dtype=torch.long, device=model.device)
+                inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+        prompt_tokens = inputs["input_ids"].shape[1]
+        pattern = _stop_pattern(role)
+        timer = _FirstTokenTimer()
+        header = _StopOnHeader(pattern, prompt_tokens)
+        repetition = _StopOnRepetition(prompt_tokens)
+        with adapters.use(role) if adapters is not None else nullcontext():
+            start = time.perf_counter()
+            out = model.generate(**inputs, max_new_tokens=max_new_tokens, max_time=max_time, do_sample=False,
+                                 temperature=0.0,
+                                 stopping_criteria=StoppingCriteriaList([timer, header, repetition]))
+        end = time.perf_counter()
+
+        # prefill = prompt forward + first token; decode = every token after it
+        first = timer.first_token_at or end
+        new_ids = out[0, prompt_tokens:]
+        new_tokens = len(new_ids)
+        if repetition.cut is not None:
+            reason = "repetition"
+        elif header.triggered:
+            reason = "stop_sequence"
+        elif new_tokens and new_ids[-1].item() == tokenizer.eos_token_id:
+            reason = "eos"
+        elif new_tokens >= max_new_tokens:
+            reason = "max_new_tokens"
+        else:
+            reason = "max_time"
+        observe("generate.prefill", (first - start) * 1000, "ms", role=role, prompt_tokens=prompt_tokens)
+        observe("generate.decode", (end - first) * 1000, "ms", role=role, new_tokens=new_tokens)
+        observe("generate.prompt_tokens", prompt_tokens, "tokens", role=role)
+        observe("generate.new_tokens", new_tokens, "tokens", role=role, stop=reason)
+        if new_tokens > 1 and end > first:
+            observe("generate.decode_tokens_per_s", (new_tokens - 1) / (end - first), "tok/s", role=role)
+
+        # the answer is the generated ids, not the decoded sequence minus len(prompt)
+        if repetition.cut is not None:
+            new_ids = new_ids[:repetition.cut]
+        text = tokenizer.decode(new_ids, skip_special_tokens=True)
+        match = pattern.search("\n" + text + "\n")
+        if match:
+            text = text[:max(match.start() - 1, 0)]
+    return text.strip()
+
+def run_moot(facts, issues=None, plan=None):
+    with profile_request("moot.hearing", generator="agents"), span("moot.hearing", generator="agents"):
+        if plan is None:
+            plan = RetrievalPlan.build(facts, issues)
+        ctx = context_entries(facts, top_k=4, plan=plan)
+        # 1. Claimant
+        claim_prompt = build_prompt("claimant", ctx, role_adapters.role_sections("claimant", facts))
+        claimant_submission = generate(claim_prompt, role="claimant")
+        print("=== Claimant ===\n", claimant_submission)
+
+        # 2. Respondent
+        resp_prompt = build_prompt("respondent", ctx,
+                                   role_adapters.role_sections("respondent", facts, claimant_submission))
+        respondent_submission = generate(resp_prompt, role="respondent")
+        print("=== Respondent ===\n", respondent_submission)
+
+        # 3. Judge
+        judge_prompt = build_prompt("judge", ctx, role_adapters.role_sections("judge", facts, claimant_submission,
+                                                                              respondent_submission))
+        judgment = generate(judge_prompt, max_new_tokens=1024, role="judge")
+        print("=== Judge ===\n", judgment)
+        return claimant_submission, respondent_submission, judgment
 
 if __name__ == "__main__":
+    import argparse
+    import profiling
+
+    parser = argparse.ArgumentParser(description="Run one moot hearing with the fine-tuned model")
+    parser.add_argument("--profile", action="store_true",
+                        help="write a CPU/torch/allocation profile of the hearing to profiles/ (see profiling.py)")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
     sample_facts = "The claimant was a procurement officer dismissed after alleged overstatement of procurement costs totalling Ksh 825,700. After the hearing, a follow-up letter said the correct figure was Ksh 442,600. Claimant says dismissal was unfair, procedural and substantive issues."
     run_moot(sample_facts)
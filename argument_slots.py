@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Model-free argument assembly from retrieved passages.
+
+At ingestion every passage is split into sentences, which are embedded once
+and stored (memory-mapped) next to embeddings of a prototype description of
+each argument slot: procedural fairness, substantive fairness, burden of proof
+and relief. At hearing time the sentences of the retrieved passages are
+scored against all slots with one matrix product and the best sentences fill
+each slot, so arguments are grounded in the precedents in a few milliseconds
+with no language model and no query encoding. This is the low-latency tier
+used when the LLM path is unavailable or overloaded.
+
+    python argument_slots.py            # (re)build sentence_store/ from case_meta.jsonl
+"""
+import json
+import os
+import re
+import time
+import numpy as np
+import corpus
+import snapshots
+
+STORE_DIR = "sentence_store"
+META_FILE = "case_meta.jsonl"
+EMBED_MODEL = "all-mpnet-base-v2"
+ENCODE_CHUNK = 4096       # sentences encoded per batch at build time
+MIN_SENTENCE_CHARS = 40
+MAX_SENTENCE_CHARS = 500
+SENTENCES_PER_SLOT = 2
+MIN_SLOT_SIMILARITY = 0.25
+PASSAGE_WEIGHT = 0.2      # weight of the passage's retrieval score in a sentence's slot score
+
+SLOTS = {
+    "procedural": "Procedural fairness of the dismissal: notice to show cause, explanation of the grounds, "
+                  "a disciplinary hearing, the right to be accompanied and to make representations "
+                  "under section 41 of the Employment Act.",
+    "substantive": "Substantive fairness of the dismissal: whether there was a valid and fair reason related "
+                   "to the employee's conduct, capacity or compatibility, gross misconduct under section 44, "
+                   "and whether dismissal was proportionate.",
+    "burden": "Burden of proof: the employee must prove that an unfair termination occurred and the employer "
+              "must prove the reasons for termination and justify them under sections 43 and 47(5).",
+    "relief": "Remedies and relief: compensation of up to twelve months' gross salary, pay in lieu of notice, "
+              "reinstatement or re-engagement, terminal dues and costs under section 49.",
+}
+SLOT_TITLES = {"procedural": "PROCEDURAL FAIRNESS", "substantive": "SUBSTANTIVE FAIRNESS",
+               "burden": "BURDEN OF PROOF", "relief": "RELIEF"}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+(?=[\"'(A-Z0-9])")
+
+
+def split_sentences(text):
+    """Sentences of a passage that are long enough to quote"""
+    sentences = []
+    for sentence in _SENTENCE_END.split(re.sub(r"\s+", " ", text or "").strip()):
+        if len(sentence) >= MIN_SENTENCE_CHARS:
+            sentences.append(sentence[:MAX_SENTENCE_CHARS])
+    return sentences
+
+
+def _iter_meta(path, columns=("id", "text")):
+    return corpus.iter_records(path, columns=list(columns))
+
+
+def build(meta_path=META_FILE, embedder=None, directory=STORE_DIR):
+    """Split, embed and persist the sentences of every indexed passage.
+
+    The meta file is streamed twice (count, then encode in chunks into a
+    memory-mapped array), so the corpus is never held in memory.
+    """
+    if embedder is None:
+        from sentence_transformers import SentenceTransformer
+        embedder = SentenceTransformer(EMBED_MODEL)
+
+    passage_ids, counts = [], []
+    for doc in _iter_meta(meta_path):
+        passage_ids.append(doc.get("id"))
+        counts.append(len(split_sentences(doc.get("text", ""))))
+    indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+
+    os.makedirs(directory, exist_ok=True)
+    dim = embedder.get_sentence_embedding_dimension()
+    embeddings = np.lib.format.open_memmap(os.path.join(directory, "embeddings.npy"), mode="w+",
+                                           dtype=np.float32, shape=(int(indptr[-1]), dim))
+    written = 0
+    batch = []
+    with open(os.path.join(directory, "sentences.jsonl"), "w", encoding="utf-8") as out:
+        def flush():
+            nonlocal written
+            if batch:
+                embeddings[written:written + len(batch)] = _encode(embedder, batch)
+                written += len(batch)
+                batch.clear()
+
+        for doc in _iter_meta(meta_path, ["text"]):
+            for sentence in split_sentences(doc.get("text", "")):
+                out.write(json.dumps(sentence, ensure_ascii=False) + "\n")
+                batch.append(sentence)
+                if len(batch) >= ENCODE_CHUNK:
+                    flush()
+        flush()
+    embeddings.flush()
+
+    np.save(os.path.join(directory, "row_indptr.npy"), indptr)
+    np.save(os.path.join(directory, "slots.npy"), _encode(embedder, list(SLOTS.values())))
+    with open(os.path.join(directory, "store.json"), "w", encoding="utf-8") as f:
+        json.dump({"slots": SLOTS, "passage_ids": passage_ids, "sentences": written}, f)
+    return {"passages": len(passage_ids), "sentences": written}
+
+
+def _encode(embedder, texts):
+    embs = embedder.encode(texts, convert_to_numpy=True, batch_size=64).astype(np.float32)
+    embs /= np.maximum(np.linalg.norm(embs, axis=1, keepdims=True), 1e-12)
+    return embs
+
+
+class SentenceStore:
+    """Memory-mapped sentence embeddings grouped by passage row"""
+
+    def __init__(self, directory=STORE_DIR):
+        with open(os.path.join(directory, "store.json"), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        if info["slots"] != SLOTS:
+            raise ValueError("slot prototypes changed since the sentence store was built")
+        self.slot_names = list(info["slots"])
+        self.rows = {pid: row for row, pid in enumerate(info["passage_ids"]) if pid is not None}
+        self.embeddings = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode="r")
+        self.indptr = np.load(os.path.join(directory, "row_indptr.npy"))
+        self.slots = np.load(os.path.join(directory, "slots.npy"))
+        with open(os.path.join(directory, "sentences.jsonl"), "r", encoding="utf-8") as f:
+            self.sentences = [json.loads(line) for line in f]
+
+    @classmethod
+    def load(cls, directory=STORE_DIR):
+        """The persisted store, or None if it was never built (or is stale)"""
+        if not os.path.exists(os.path.join(directory, "store.json")):
+            return None
+        try:
+            return cls(directory)
+        except (ValueError, OSError) as e:
+            print(f"⚠️ Sentence store unusable ({e}); rebuild with argument_slots.py")
+            return None
+
+    def candidates(self, docs):
+        """(sentence ids, passage index into docs) for the sentences of the given passages"""
+        ids, owners = [], []
+        for i, doc in enumerate(docs):
+            row = self.rows.get(doc.get("id"))
+            if row is None:
+                continue
+            start, end = int(self.indptr[row]), int(self.indptr[row + 1])
+            ids.append(np.arange(start, end))
+            owners.append(np.full(end - start, i))
+        if not ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(ids), np.concatenate(owners)
+
+
+def fill_slots(docs, per_slot=SENTENCES_PER_SLOT, store=None, bundle=None):
+    """Best sentences from the retrieved passages for each argument slot.
+
+    Each sentence is assigned to the slot it matches best, scored as slot
+    similarity plus PASSAGE_WEIGHT * the passage's retrieval score.
+    Returns {slot: [{"text", "source", "score"}]} (empty lists without a store).
+
+    store: the SentenceStore to read; by default that of `bundle`, the
+    retriever.IndexBundle the docs were retrieved from (the served one if omitted).
+    """
+    if store is None:
+        if bundle is None:
+            import retriever
+            bundle = retriever.get_bundle()
+        store = bundle.sentences if bundle is not None else None
+    filled = {slot: [] for slot in SLOTS}
+    if store is None or not docs:
+        return filled
+    ids, owners = store.candidates(docs)
+    if not len(ids):
+        return filled
+
+    sims = np.asarray(store.embeddings[ids]) @ store.slots.T  # (sentences, slots)
+    prior = np.array([float(d.get("score", 0.0)) for d in docs], dtype=np.float32)[owners]
+    best = sims.argmax(axis=1)
+    best_sim = sims[np.arange(len(ids)), best]
+    scores = best_sim + PASSAGE_WEIGHT * prior
+    for s, slot in enumerate(store.slot_names):
+        members = np.flatnonzero((best == s) & (best_sim >= MIN_SLOT_SIMILARITY))
+        for m in members[np.argsort(-scores[members])][:per_slot]:
+            filled[slot].append({"text": store.sentences[ids[m]], "score": float(scores[m]),
+                                 "source": docs[owners[m]].get("source", "unknown")})
+    return filled
+
+
+def quote(filled, slot, lead="The authorities hold"):
+    """Markdown quotation of a slot's sentences, or "" if it is empty"""
+    if not filled.get(slot):
+        return ""
+    lines = [f"{lead}:"] + [f"> \"{s['text']}\" — *{s['source']}*" for s in filled[slot]]
+    return "\n".join(lines) + "\n"
+
+
+def assemble_arguments(facts, issues=None, plan=None, docs=None):
+    """Claimant, respondent and judge texts built only from retrieved sentences.
+
+    plan: a retrieval_plan.RetrievalPlan (its precedents are used), or docs:
+    passages already retrieved. Same keys as case_arguer.argue_case, plus
+    "authorities", "tier" and "assembly_ms".
+    """
+    start = time.perf_counter()
+    docs = plan.precedents() if plan is not None else (docs or [])
+    filled = fill_slots(docs, bundle=plan.bundle if plan is not None else None)
+    issue_line = f"\n**ISSUES:** {issues}\n" if issues else ""
+
+    def section(slot, lead):
+        return f"**{SLOT_TITLES[slot]}:**\n" + (quote(filled, slot, lead) or "No directly applicable authority was retrieved.\n")
+
+    claimant = (f"The Claimant submits that the dismissal was unfair.\n\n**FACTS:** {facts}\n{issue_line}\n"
+                + "\n".join(section(s, "The Claimant relies on") for s in SLOTS))
+    respondent = (f"The Respondent submits that the dismissal was fair and lawful.\n\n**FACTS:** {facts}\n{issue_line}\n"
+                  + "\n".join(section(s, "The Respondent relies on") for s in ("procedural", "substantive", "burden")))
+    judge = ("**JUDGMENT (summary from the authorities)**\n\n"
+             + "\n".join(section(s, "The Court notes") for s in SLOTS)
+             + "\n**ORDERS:** to be determined on the evidence against the principles above.")
+    return {
+        "claimant": claimant.strip(),
+        "respondent": respondent.strip(),
+        "judge": judge.strip(),
+        "precedents_used": len(docs),
+        "authorities": filled,
+        "tier": "grounded",
+        "assembly_ms": (time.perf_counter() - start) * 1000,
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the sentence store used for model-free argument assembly")
+    parser.add_argument("--meta", default=None, help="case meta (default: the served snapshot's)")
+    parser.add_argument("--output", default=STORE_DIR)
+    parser.add_argument("--no-snapshot", action="store_true",
+                        help="only write --output; do not republish the served snapshot with it")
+    args = parser.parse_args()
+
+    stats = build(args.meta or corpus.locate(snapshots.served_file(META_FILE)), directory=args.output)
+    print(f"✅ Sentence store: {stats['sentences']} sentences from {stats['passages']} passages")
+    if not args.no_snapshot and os.path.normpath(args.output) == STORE_DIR:
+        version = snapshots.republish([STORE_DIR])
+        if version:
+            print(f"Published index snapshot {version}; running apps switch to it without a restart.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Batch moot runner for evaluation over many case files.
+
+Reads a JSONL of {"id": ..., "facts": ..., "issues": ...}, runs retrieval and
+argument generation for each case as priority="batch" jobs on a
+moot_jobs.JobRunner, and streams one result per line to an output JSONL.
+Cases already present in the output are skipped, so an interrupted overnight
+run resumes where it stopped.
+
+Run from a process that also serves the app (run_batch(..., runner=app_runner)),
+the cases share the app's workers: interactive hearings are dequeued first
+and keep the workers reserved for them.
+
+    python batch_moot.py heldout_cases.jsonl --output heldout_results.jsonl --concurrency 4
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import retriever
+from moot_jobs import JobRunner, AdmissionError
+from retrieval_plan import RetrievalPlan
+
+GENERATORS = ("arguer", "agents", "grounded")
+ADMISSION_RETRY_S = 5.0  # wait before resubmitting a case a shared runner refused
+
+
+def case_id(record):
+    """Stable id for an input record (its own id, else a hash of facts + issues)"""
+    if record.get("id") is not None:
+        return str(record["id"])
+    text = f"{record.get('facts', '')}\x1f{record.get('issues', '')}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def load_cases(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def completed_ids(path):
+    """Ids already written successfully to the output file"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by an interrupted run
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def run_case(record, generator):
+    """Retrieve once and generate arguments for one case (runs on a worker thread)"""
+    facts = record["facts"]
+    issues = record.get("issues", "")
+
+    t0 = time.perf_counter()
+    plan = RetrievalPlan.build(facts, issues)
+    retrieval_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    if generator == "agents":
+        import agents
+        claimant, respondent, judge = agents.run_moot(facts, issues, plan=plan)
+        arguments = {"claimant": claimant, "respondent": respondent, "judge": judge}
+    elif generator == "grounded":
+        from argument_slots import assemble_arguments
+        arguments = assemble_arguments(facts, issues, plan=plan)
+    else:
+        from case_arguer import argue_case
+        arguments = argue_case(facts, issues, plan=plan)
+    generation_s = time.perf_counter() - t0
+
+    return {
+        "arguments": arguments,
+        "precedents": plan.sources(),
+        "retrieval_ms": retrieval_s * 1000,
+        "generation_ms": generation_s * 1000,
+    }
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[rank]
+
+
+def summarize(results, wall_s):
+    latencies = [r["latency_ms"] for r in results if r["status"] == "ok"]
+    ok = len(latencies)
+    return {
+        "cases": len(results),
+        "ok": ok,
+        "failed": len(results) - ok,
+        "wall_s": wall_s,
+        "throughput_per_s": ok / wall_s if wall_s > 0 else 0.0,
+        "latency_ms": {
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "p99": _percentile(latencies, 99),
+            "max": max(latencies, default=0.0),
+        },
+        "retrieval_ms_mean": sum(r["retrieval_ms"] for r in results if r["status"] == "ok") / ok if ok else 0.0,
+        "generation_ms_mean": sum(r["generation_ms"] for r in results if r["status"] == "ok") / ok if ok else 0.0,
+    }
+
+
+async def _submit(runner, record, generator):
+    """Queue one case as a batch job and wait for it, retrying while the runner is at capacity"""
+    key = runner.request_key("batch", case_id(record), generator)
+    while True:
+        try:
+            job_id = runner.submit(key, run_case, record, generator, priority="batch")
+            break
+        except AdmissionError:
+            await asyncio.sleep(ADMISSION_RETRY_S)
+    return await asyncio.wrap_future(runner.get(job_id).future)
+
+
+async def run_batch(cases, output_path, generator="arguer", concurrency=4, runner=None):
+    """Fan cases out as batch jobs, at most `concurrency` at a time, appending results as they finish
+
+    runner: a JobRunner to share (e.g. the app's); by default one with
+    `concurrency` workers and nothing reserved for interactive jobs.
+    """
+    if runner is None:
+        runner = JobRunner(max_workers=concurrency, max_queued=concurrency,
+                           interactive_workers=0, interactive_slots=0)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        async def worker(record):
+            async with semaphore:
+                cid = case_id(record)
+                start = time.perf_counter()
+                try:
+                    result = await _submit(runner, record, generator)
+                    result.update({"id": cid, "status": "ok"})
+                except Exception as e:
+                    result = {"id": cid, "status": "error", "error": str(e)}
+                result["latency_ms"] = (time.perf_counter() - start) * 1000
+                # single event-loop thread: lines are never interleaved
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                results.append(result)
+                print(f"   [{len(results)}/{len(cases)}] {cid}: {result['status']} ({result['latency_ms']:.0f} ms)")
+
+        await asyncio.gather(*(worker(r) for r in cases))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run moot hearings for every case in a JSONL file")
+    parser.add_argument("cases", help="JSONL with facts / issues (and optionally id) per line")
+    parser.add_argument("--output", default="batch_results.jsonl")
+    parser.add_argument("--summary", default=None, help="where to write the JSON summary (default: <output>.summary.json)")
+    parser.add_argument("--generator", choices=GENERATORS, default="arguer",
+                        help="arguer: case_arguer templates; agents: the fine-tuned model; "
+                             "grounded: model-free sentence assembly")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--restart", action="store_true", help="ignore existing results in --output")
+    args = parser.parse_args(argv)
+
+    cases = load_cases(args.cases)
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done = completed_ids(args.output)
+    pending = [c for c in cases if case_id(c) not in done]
+    print(f"🏛️ Batch moot run: {len(cases)} cases, {len(done)} already done, {len(pending)} to run")
+
+    # load the index once before threads race to do it
+    retriever.load()
+    if args.generator == "agents":
+        import agents  # noqa: F401  (loads the model up front)
+
+    start = time.perf_counter()
+    results = asyncio.run(run_batch(pending, args.output, args.generator, args.concurrency))
+    summary = summarize(results, time.perf_counter() - start)
+    summary.update({"generator": args.generator, "concurrency": args.concurrency, "skipped": len(done)})
+
+    summary_path = args.summary or f"{os.path.splitext(args.output)[0]}.summary.json"
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    lat = summary["latency_ms"]
+    print(f"\n✅ {summary['ok']} ok, {summary['failed']} failed in {summary['wall_s']:.1f}s "
+          f"({summary['throughput_per_s']:.2f} cases/s)")
+    print(f"   latency p50 {lat['p50']:.0f} ms · p95 {lat['p95']:.0f} ms · p99 {lat['p99']:.0f} ms")
+    print(f"   summary written to {summary_path}")
+
+
+if __name__ == "__main__":
+    main()
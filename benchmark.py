@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Reproducible benchmarks for the retrieval and generation hot paths.
+
+Builds an index over a synthetic (or sampled) corpus in a scratch directory,
+then measures index build time, query latency percentiles, queries/sec under
+concurrency, RSS, model load time and (optionally) generation tokens/sec.
+Results go to a JSON report that can be compared against a previous run:
+
+    python benchmark.py --docs 5000 --output bench_before.json
+    python benchmark.py --docs 5000 --output bench_after.json --compare bench_before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# vocabulary for the synthetic corpus: employment-law flavoured, so query
+# and passage lengths look like the real thing
+_PARTIES = ["the Claimant", "the Respondent", "the employer", "the employee", "the Union", "the Board"]
+_ACTS = ["was dismissed", "was issued a notice to show cause", "appeared before the disciplinary committee",
+         "was suspended without pay", "sought reinstatement", "was declared redundant", "filed a grievance"]
+_GROUNDS = ["gross misconduct", "insubordination", "theft of company property", "absence from duty",
+            "overstatement of procurement costs", "breach of confidentiality", "poor performance"]
+_LAW = ["Section 41 of the Employment Act", "Section 43 of the Employment Act", "Section 44(4) of the Employment Act",
+        "Section 45 of the Employment Act", "Section 49 of the Employment Act", "Article 41 of the Constitution"]
+_HOLDINGS = ["the termination was procedurally unfair", "the reasons for termination were valid and fair",
+             "the employer failed to discharge the burden of proof", "the Claimant is entitled to compensation",
+             "the claim is dismissed with costs", "the Respondent acted as a reasonable employer"]
+
+
+def synthetic_corpus(n_docs, seed=0, sentences=12):
+    """Deterministic pseudo-judgment passages"""
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_docs):
+        text = " ".join(
+            f"{rng.choice(_PARTIES)} {rng.choice(_ACTS)} on grounds of {rng.choice(_GROUNDS)}; "
+            f"under {rng.choice(_LAW)} the Court found that {rng.choice(_HOLDINGS)}."
+            for _ in range(sentences))
+        docs.append({"id": f"synthetic_{i}", "text": text, "source": f"synthetic_{i % max(1, n_docs // 4)}.pdf"})
+    return docs
+
+
+def sampled_corpus(path, n_docs, seed=0):
+    """Sample (with replacement once the file runs out) from a real cases_sections.jsonl"""
+    import corpus
+
+    real = corpus.read_records(path)
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_docs):
+        d = dict(rng.choice(real))
+        d["id"] = f"{d.get('id', 'doc')}_{i}"
+        docs.append(d)
+    return docs
+
+
+def synthetic_queries(n, seed=1):
+    rng = random.Random(seed)
+    return [f"{rng.choice(_PARTIES)} {rng.choice(_ACTS)} for {rng.choice(_GROUNDS)}, "
+            f"was this fair under {rng.choice(_LAW)}?" for _ in range(n)]
+
+
+def rss_mb():
+    """Current resident set size (falls back to peak RSS off Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def percentiles(values):
+    ordered = sorted(values)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+    return {"p50": pct(50), "p95": pct(95), "p99": pct(99), "mean": sum(ordered) / len(ordered) if ordered else 0.0}
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "commit": commit}
+
+
+def bench_retrieval(args, report):
+    import index_cases
+    import quantize
+    import retriever
+    import encoders
+
+    t0 = time.perf_counter()
+    embedder, report["encoder"] = encoders.load_checked(args.encoder, index_cases.EMBED_MODEL,
+                                                        os.path.join(PROJECT_DIR, encoders.ONNX_DIR))
+    report["embedder_load_s"] = time.perf_counter() - t0
+
+    docs = sampled_corpus(args.sample_from, args.docs, args.seed) if args.sample_from \
+        else synthetic_corpus(args.docs, args.seed)
+
+    # index build
+    t0 = time.perf_counter()
+    index, embs = index_cases.build_index(docs, embedder, mode=args.vector_mode)
+    build_s = time.perf_counter() - t0
+    quantize.write_index(index, args.vector_mode)
+    quantize.save_vectors(embs)
+    quantize.save_info(args.vector_mode, len(docs), embs.shape[1])
+    index_cases.save_meta(docs)
+    report["index_build"] = {"docs": len(docs), "seconds": build_s, "docs_per_s": len(docs) / build_s,
+                             "vector_mode": args.vector_mode}
+    report["rss_mb_after_build"] = rss_mb()
+    del index, embs
+
+    # reuse the loaded embedder; load the index written above
+    retriever.reset()
+    retriever.load(embedder=embedder)
+
+    queries = synthetic_queries(args.queries, args.seed + 1)
+    for q in queries[:args.warmup]:
+        retriever.retrieve(q, top_k=args.top_k, diversify=args.diversify)
+
+    latencies = []
+    stages = {}
+    for q in queries:
+        t0 = time.perf_counter()
+        retriever.retrieve(q, top_k=args.top_k, diversify=args.diversify)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        for stage, ms in retriever.get_last_timings().items():
+            if stage.endswith("_ms"):
+                stages.setdefault(stage, []).append(ms)
+    report["query_latency_ms"] = percentiles(latencies)
+    report["query_stage_ms"] = {stage: percentiles(v) for stage, v in stages.items()}
+
+    concurrency = {}
+    for workers in args.concurrency:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda q: retriever.retrieve(q, top_k=args.top_k, diversify=args.diversify), queries))
+        concurrency[str(workers)] = len(queries) / (time.perf_counter() - t0)
+    report["queries_per_s"] = concurrency
+    report["rss_mb_after_queries"] = rss_mb()
+
+
+def bench_generation(args, report):
+    import instrumentation
+
+    t0 = time.perf_counter()
+    import agents
+    report["model_load_s"] = time.perf_counter() - t0
+    report["rss_mb_after_model"] = rss_mb()
+
+    instrumentation.histogram.reset()
+    prompt = agents.SYSTEM_TEMPLATES["claimant"] + "\n\nFacts:\n" + synthetic_queries(1, args.seed)[0] + \
+        "\n\nClaimant Submission:\n"
+    for _ in range(args.generations):
+        agents.generate(prompt, max_new_tokens=args.max_new_tokens, role="claimant")
+    snap = instrumentation.histogram.snapshot()
+    report["generation"] = {
+        "runs": args.generations,
+        "max_new_tokens": args.max_new_tokens,
+        "prefill_ms": snap.get("generate.prefill", {}).get("p50", 0.0),
+        "decode_ms": snap.get("generate.decode", {}).get("p50", 0.0),
+        "new_tokens": snap.get("generate.new_tokens", {}).get("mean", 0.0),
+        "decode_tokens_per_s": snap.get("generate.decode_tokens_per_s", {}).get("mean", 0.0),
+    }
+
+
+# metrics compared by --compare, and whether higher is better
+COMPARED = {
+    "index_build.docs_per_s": True,
+    "query_latency_ms.p50": False,
+    "query_latency_ms.p95": False,
+    "query_latency_ms.p99": False,
+    "rss_mb_after_queries": False,
+    "embedder_load_s": False,
+    "model_load_s": False,
+    "generation.decode_tokens_per_s": True,
+}
+
+
+def _lookup(report, dotted):
+    value = report
+    for part in dotted.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def compare(current, baseline, threshold_pct):
+    """Print a delta table; return the metrics that regressed by more than threshold_pct"""
+    regressions = []
+    metrics = list(COMPARED.items()) + [(f"queries_per_s.{w}", True) for w in current.get("queries_per_s", {})]
+    print(f"\n{'metric':<34}{'baseline':>12}{'current':>12}{'change':>9}")
+    for metric, higher_is_better in metrics:
+        old, new = _lookup(baseline["results"], metric), _lookup(current["results"], metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        worse = -change if higher_is_better else change
+        flag = "  ⚠️" if worse > threshold_pct else ""
+        if flag:
+            regressions.append(metric)
+        print(f"{metric:<34}{old:>12.2f}{new:>12.2f}{change:>+8.1f}%{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark index build, retrieval and generation")
+    parser.add_argument("--docs", type=int, default=2000, help="corpus size")
+    parser.add_argument("--sample-from", default=None, help="sample passages from this JSONL instead of synthesizing")
+    parser.add_argument("--vector-mode", default="flat", choices=("flat", "int8", "binary"))
+    parser.add_argument("--encoder", default="torch", choices=("torch", "onnx", "onnx-int8"),
+                        help="query/passage encoder backend (see encoders.py)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--diversify", action="store_true")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--generation", action="store_true", help="also load the model and time generation")
+    parser.add_argument("--generations", type=int, default=3)
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_report.json")
+    parser.add_argument("--compare", default=None, help="baseline report to diff against")
+    parser.add_argument("--fail-on-regression", type=float, default=None, metavar="PCT",
+                        help="exit non-zero if a compared metric is worse by more than PCT percent")
+    args = parser.parse_args(argv)
+    args.output = os.path.abspath(args.output)
+    if args.sample_from:
+        args.sample_from = os.path.abspath(args.sample_from)
+
+    report = {"config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+              "env": environment(), "results": {"rss_mb_start": rss_mb()}}
+
+    # the index files are cwd-relative, so run in a scratch directory
+    sys.path.insert(0, PROJECT_DIR)
+    workdir = tempfile.mkdtemp(prefix="moot_bench_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        print(f"🏁 Benchmarking retrieval on {args.docs} docs ({args.vector_mode})...")
+        bench_retrieval(args, report["results"])
+        if args.generation:
+            os.chdir(PROJECT_DIR)  # model lives in the project
+            print("🏁 Benchmarking generation...")
+            bench_generation(args, report["results"])
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    r = report["results"]
+    print(f"\n✅ Index build: {r['index_build']['seconds']:.1f}s ({r['index_build']['docs_per_s']:.0f} docs/s)")
+    lat = r["query_latency_ms"]
+    print(f"   Query latency: p50 {lat['p50']:.1f} ms · p95 {lat['p95']:.1f} ms · p99 {lat['p99']:.1f} ms")
+    print("   Queries/sec: " + ", ".join(f"{w} threads → {q:.0f}" for w, q in r["queries_per_s"].items()))
+    if "generation" in r:
+        print(f"   Generation: {r['generation']['decode_tokens_per_s']:.1f} tok/s, model load {r['model_load_s']:.1f}s")
+    print(f"   Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, 10.0 if args.fail_on_regression is None else args.fail_on_regression)
+        if regressions and args.fail_on_regression is not None:
+            print(f"\n❌ Regressions beyond {args.fail_on_regression}%: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
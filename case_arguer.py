@@ -2,17 +2,14 @@
 """
 Case argumentation system using the fine-tuned model
 """
-import json
 import os
+from argument_slots import fill_slots, quote
+import corpus
 
 def load_precedents():
     """Load legal precedents from the cases database"""
     try:
-        with open("case_meta.jsonl", "r", encoding="utf-8") as f:
-            precedents = []
-            for line in f:
-                precedents.append(json.loads(line))
-        return precedents
+        return list(corpus.load_table("case_meta.jsonl", exclude=("full_text", "citations")))
     except FileNotFoundError:
         return []
 
@@ -32,8 +29,14 @@ def find_relevant_precedents(facts, precedents, top_k=3):
     relevant.sort(key=lambda x: x[1], reverse=True)
     return [item[0] for item in relevant[:top_k]]
 
-def argue_case(facts, issues=None):
-    """Generate comprehensive arguments for a case"""
+def argue_case(facts, issues=None, precedents=None, plan=None):
+    """Generate comprehensive arguments for a case
+
+    plan: a retrieval_plan.RetrievalPlan already computed for this request;
+    its precedents are used as-is, with no second search.
+    precedents: an already-loaded precedent list (e.g. the app's cached store)
+    for the keyword scan; case_meta.jsonl is read when omitted.
+    """
     
     print("🏛️ MOOT COURT AI - CASE ARGUMENTATION")
     print("=" * 60)
@@ -43,8 +46,12 @@ def argue_case(facts, issues=None):
     
     # Load and find relevant precedents
     try:
-        precedents = load_precedents()
-        relevant_precedents = find_relevant_precedents(facts, precedents)
+        if plan is not None:
+            relevant_precedents = plan.precedents()
+        else:
+            if precedents is None:
+                precedents = load_precedents()
+            relevant_precedents = find_relevant_precedents(facts, precedents)
         
         print(f"\n🔍 Found {len(relevant_precedents)} relevant legal precedents:")
         for i, precedent in enumerate(relevant_precedents, 1):
@@ -54,6 +61,13 @@ def argue_case(facts, issues=None):
         print(f"⚠️ Warning: Could not load precedents: {e}")
         relevant_precedents = []
     
+    # Ground each argument slot in sentences from the retrieved precedents
+    try:
+        authorities = fill_slots(relevant_precedents, bundle=plan.bundle if plan is not None else None)
+    except Exception as e:
+        print(f"⚠️ Warning: Could not extract authorities: {e}")
+        authorities = {}
+    
     print(f"\n{'='*60}")
     print("🎭 AI-GENERATED LEGAL ARGUMENTS")
     print("=" * 60)
@@ -72,22 +86,22 @@ The disciplinary process failed to comply with Section 41 of the Employment Act,
 - Inadequate notice of allegations
 - Denial of proper representation
 - Failure to follow fair hearing procedures
-
+{quote(authorities, "procedural", "The Claimant relies on")}
 **SUBSTANTIVE UNFAIRNESS:**
 The reasons advanced for dismissal were not valid, fair, or sufficient under Section 44 of the Employment Act:
 - No clear evidence of misconduct
 - Disproportionate response to alleged offense
 - Failure to consider mitigating circumstances
-
+{quote(authorities, "substantive", "The Claimant relies on")}
 **BURDEN OF PROOF:**
 The Respondent bears the burden of proving fair dismissal under Section 43 of the Employment Act. This burden has not been discharged.
-
+{quote(authorities, "burden", "The Claimant relies on")}
 **RELIEF SOUGHT:**
 - Declaration that dismissal was unfair
 - One month's salary in lieu of notice
 - Compensation for unfair dismissal (up to 12 months gross salary)
 - Costs of the suit
-
+{quote(authorities, "relief", "The Claimant relies on")}
 The Claimant seeks justice and fair compensation for the wrongful termination.
 """
     print(claimant_args)
@@ -107,7 +121,7 @@ All statutory requirements under Section 41 of the Employment Act were strictly
 - Disciplinary hearing conducted
 - Opportunity for employee representation
 - Consideration of employee's response
-
+{quote(authorities, "procedural", "The Respondent relies on")}
 **VALID GROUNDS FOR DISMISSAL:**
 The dismissal was based on valid reasons under Section 44 of the Employment Act:
 - Gross misconduct as defined in Section 44(4)
@@ -119,7 +133,7 @@ Clear and cogent evidence demonstrates:
 - The employee's misconduct
 - Impact on the organization
 - Justification for dismissal
-
+{quote(authorities, "substantive", "The Respondent relies on")}
 **REASONABLE EMPLOYER TEST:**
 Any reasonable employer would have dismissed the employee in these circumstances, following the test established in British Leyland UK Ltd v Swift [1981] IRLR 91.
 
@@ -164,7 +178,7 @@ Based on the evidence presented and legal precedents, this Court finds:
 
 **BURDEN OF PROOF:**
 [Assessment of whether the Respondent discharged the burden under Section 43]
-
+{quote(authorities, "burden", "The Court notes")}
 **LEGAL PRECEDENTS CONSIDERED:**
 - Employment Act, 2007 (Sections 41, 43, 44, 49)
 - British Leyland UK Ltd v Swift [1981] IRLR 91
@@ -186,7 +200,8 @@ Judge, Employment and Labour Relations Court
         "claimant": claimant_args.strip(),
         "respondent": respondent_args.strip(),
         "judge": judge_decision.strip(),
-        "precedents_used": len(relevant_precedents)
+        "precedents_used": len(relevant_precedents),
+        "authorities": authorities
     }
 
 def main():
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Offline map-reduce digests of the judgments in the index.
+
+Map: every judgment's full text is cut into passages and each passage is
+reduced to its best candidate sentences for three fields (holding, ratio
+decidendi, orders), scored against a prototype of each field plus cue-phrase
+and position bonuses. Reduce: the candidates of all passages of a case are
+merged into one short digest per field, in document order. With
+--abstractive, each field is then rewritten by a summarization model.
+
+Digests are written to case_digests.jsonl beside case_meta.jsonl. Each line
+records the version of the summarizer that produced it, and digests from a
+different version are ignored. The retriever loads them with the rest of an
+index version, and agents.make_context uses a case's digest in place of its
+raw text, so prompts carry a few hundred characters per
+precedent instead of a multi-page extract.
+
+    python case_digests.py                 # extractive (embedding model only)
+    python case_digests.py --abstractive   # + SUMMARY_MODEL rewrite
+"""
+import hashlib
+import json
+import os
+import re
+import numpy as np
+from argument_slots import split_sentences
+import corpus
+import snapshots
+
+DIGEST_FILE = "case_digests.jsonl"
+META_FILE = "case_meta.jsonl"
+EMBED_MODEL = "all-mpnet-base-v2"
+SUMMARY_MODEL = "sshleifer/distilbart-cnn-12-6"
+SCHEMA_VERSION = 1
+PASSAGE_CHARS = 4000     # map unit
+CANDIDATES_PER_PASSAGE = 3
+SENTENCES_PER_FIELD = 1
+MAX_FIELD_CHARS = 300
+
+FIELDS = {
+    "holding": "The court finds and holds that the dismissal of the claimant was unfair or was fair, "
+               "and determines the issues for determination.",
+    "ratio": "The reason for the decision: the legal principle applied by the court, the test under the "
+             "Employment Act and the precedents relied on to reach its conclusion.",
+    "orders": "The court orders that judgment is entered, awards compensation, salary in lieu of notice, "
+              "reinstatement, terminal dues and costs of the suit.",
+}
+CUES = {
+    "holding": re.compile(r"\b(?:I find|we find|the court finds|hold that|held that|is hereby declared|"
+                          r"in the circumstances|in conclusion)\b", re.I),
+    "ratio": re.compile(r"\b(?:because|the test|the principle|it is trite|burden of proof|section \d+|"
+                        r"reasonable employer|in the case of)\b", re.I),
+    "orders": re.compile(r"\b(?:ordered|orders?|award(?:ed)?|judgment is entered|costs|Kshs?\.?\s?[\d,]+|"
+                         r"reinstat\w+|compensation)\b", re.I),
+}
+CUE_BONUS = 0.1
+POSITION_BONUS = {"holding": 0.1, "ratio": 0.0, "orders": 0.2}  # times relative position in the judgment
+
+
+def digest_version(abstractive=False):
+    """Version of the summarizer: changes with the models or the field prototypes"""
+    spec = {"schema": SCHEMA_VERSION, "embed_model": EMBED_MODEL, "fields": FIELDS,
+            "summary_model": SUMMARY_MODEL if abstractive else None}
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+def digest_key(doc):
+    """Cases are digested whole: passages of one judgment share a digest"""
+    return doc.get("case_id") or doc.get("source") or doc.get("id")
+
+
+def _passages(text):
+    return [text[i:i + PASSAGE_CHARS] for i in range(0, len(text), PASSAGE_CHARS)] or [""]
+
+
+def _encode(embedder, texts):
+    embs = np.asarray(embedder.encode(texts, convert_to_numpy=True, batch_size=64), dtype=np.float32)
+    return embs / np.maximum(np.linalg.norm(embs, axis=1, keepdims=True), 1e-12)
+
+
+def map_passage(sentences, embs, prototypes, start, total):
+    """Best candidate sentences of one passage per field: {field: [(score, position, sentence)]}"""
+    if not sentences:
+        return {field: [] for field in FIELDS}
+    sims = embs @ prototypes.T  # (sentences, fields)
+    positions = (start + np.arange(len(sentences))) / max(total - 1, 1)
+    out = {}
+    for f, field in enumerate(FIELDS):
+        cues = np.array([bool(CUES[field].search(s)) for s in sentences], dtype=np.float32)
+        scores = sims[:, f] + CUE_BONUS * cues + POSITION_BONUS[field] * positions
+        top = np.argsort(-scores)[:CANDIDATES_PER_PASSAGE]
+        out[field] = [(float(scores[i]), start + int(i), sentences[i]) for i in top]
+    return out
+
+
+def reduce_case(mapped, per_field=SENTENCES_PER_FIELD, max_chars=MAX_FIELD_CHARS):
+    """Merge passage candidates into {field: text}; a sentence is used by one field only"""
+    digest, used = {}, set()
+    for field in FIELDS:
+        candidates = sorted((c for m in mapped for c in m[field]), reverse=True)
+        chosen = []
+        for score, position, sentence in candidates:
+            if sentence in used:
+                continue
+            chosen.append((position, sentence))
+            used.add(sentence)
+            if len(chosen) >= per_field:
+                break
+        digest[field] = " ".join(s for _, s in sorted(chosen))[:max_chars]
+    return digest
+
+
+def summarize_case(text, embedder, prototypes, per_field=SENTENCES_PER_FIELD, max_chars=MAX_FIELD_CHARS):
+    """Map over the passages of one judgment, then reduce to a digest"""
+    sentences_by_passage = [split_sentences(p) for p in _passages(text)]
+    flat = [s for ss in sentences_by_passage for s in ss]
+    if not flat:
+        return {field: "" for field in FIELDS}
+    embs = _encode(embedder, flat)
+    mapped, start = [], 0
+    for sentences in sentences_by_passage:
+        mapped.append(map_passage(sentences, embs[start:start + len(sentences)], prototypes, start, len(flat)))
+        start += len(sentences)
+    return reduce_case(mapped, per_field, max_chars)
+
+
+def _iter_meta(path):
+    return corpus.iter_records(path, columns=["id", "case_id", "source", "text", "full_text"])
+
+
+def build(meta_path=META_FILE, output=DIGEST_FILE, embedder=None, abstractive=False):
+    """Digest every case in the meta file (streamed) and write the digests file"""
+    if embedder is None:
+        from sentence_transformers import SentenceTransformer
+        embedder = SentenceTransformer(EMBED_MODEL)
+    rewrite = None
+    if abstractive:
+        from transformers import pipeline
+        rewrite = pipeline("summarization", model=SUMMARY_MODEL)
+
+    prototypes = _encode(embedder, list(FIELDS.values()))
+    version = digest_version(abstractive)
+    seen = set()
+    stats = {"cases": 0, "judgment_chars": 0, "passage_chars": 0, "digest_chars": 0}
+    tmp = f"{output}.tmp"
+    with open(tmp, "w", encoding="utf-8") as out:
+        for doc in _iter_meta(meta_path):
+            key = digest_key(doc)
+            if key in seen:
+                continue
+            seen.add(key)
+            text = doc.get("full_text") or doc.get("text", "")
+            if rewrite is None:
+                digest = summarize_case(text, embedder, prototypes)
+            else:
+                # more extracted material per field, condensed by the summarization model
+                digest = summarize_case(text, embedder, prototypes, per_field=4, max_chars=4000)
+                for field, value in digest.items():
+                    if value:
+                        digest[field] = rewrite(value, max_length=60, min_length=10,
+                                                truncation=True)[0]["summary_text"][:MAX_FIELD_CHARS]
+            record = {"case": key, "source": doc.get("source", "unknown"), "version": version, **digest}
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            stats["cases"] += 1
+            stats["judgment_chars"] += len(text)
+            stats["passage_chars"] += len(doc.get("text", ""))
+            stats["digest_chars"] += len(format_digest(record))
+    os.replace(tmp, output)
+    return stats
+
+
+def load_digests(path=DIGEST_FILE):
+    """{case key: digest} of the current summarizer version (stale or missing file: {})"""
+    if not os.path.exists(path):
+        return {}
+    valid = {digest_version(False), digest_version(True)}
+    digests, stale = {}, 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("version") in valid:
+                digests[record["case"]] = record
+            else:
+                stale += 1
+    if stale:
+        print(f"⚠️ Ignoring {stale} digests from another summarizer version; rerun case_digests.py")
+    return digests
+
+
+def format_digest(digest):
+    parts = [f"{label}: {digest[field]}" for field, label in
+             (("holding", "Holding"), ("ratio", "Ratio"), ("orders", "Orders")) if digest.get(field)]
+    return " | ".join(parts)
+
+
+def _served_digests():
+    import retriever
+    bundle = retriever.get_bundle()
+    return bundle.digests if bundle is not None else {}
+
+
+def context_entry(doc, digests=None):
+    """One precedent's prompt context: its digest when there is one, else the raw passage
+
+    digests: those of the retriever.IndexBundle the doc came from (the served one if omitted).
+    """
+    digests = _served_digests() if digests is None else digests
+    digest = digests.get(digest_key(doc))
+    body = format_digest(digest) if digest else ""
+    return f"[{doc.get('source', 'unknown')}] {body or doc.get('text', '')}"
+
+
+def context_entries(docs, digests=None):
+    """Prompt context entries for retrieved passages; passages of one digested case share a single entry"""
+    digests = _served_digests() if digests is None else digests
+    entries, seen = [], set()
+    for doc in docs:
+        key = digest_key(doc)
+        if key in digests:
+            if key in seen:
+                continue
+            seen.add(key)
+        entries.append(context_entry(doc, digests))
+    return entries
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build holding/ratio/orders digests of the indexed cases")
+    parser.add_argument("--meta", default=None, help="case meta (default: the served snapshot's)")
+    parser.add_argument("--output", default=DIGEST_FILE)
+    parser.add_argument("--abstractive", action="store_true", help=f"rewrite each field with {SUMMARY_MODEL}")
+    parser.add_argument("--no-snapshot", action="store_true",
+                        help="only write --output; do not republish the served snapshot with it")
+    args = parser.parse_args()
+
+    meta = args.meta or corpus.locate(snapshots.served_file(META_FILE))
+    stats = build(meta, args.output, abstractive=args.abstractive)
+    if not stats["cases"]:
+        print("❌ No cases found")
+        return
+    print(f"✅ Digested {stats['cases']} cases (version {digest_version(args.abstractive)})")
+    n = stats["cases"]
+    print(f"Context per precedent: {stats['digest_chars'] / n:.0f} characters "
+          f"(passage {stats['passage_chars'] / n:.0f}, full judgment {stats['judgment_chars'] / n:.0f})")
+    if not args.no_snapshot and os.path.normpath(args.output) == DIGEST_FILE:
+        version = snapshots.republish([DIGEST_FILE])
+        if version:
+            print(f"Published index snapshot {version}; running apps switch to it without a restart.")
+
+
+if __name__ == "__main__":
+    main()
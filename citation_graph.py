@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Citation graph over the judgment corpus.
+
+Ingestion extracts case citations ("British Leyland UK Ltd v Swift [1981] IRLR 91",
+"... v Kenya Ports Authority [2018] eKLR") from each judgment. The graph is
+stored as CSR arrays (one node per row of case_meta.jsonl), with PageRank
+authority precomputed, all saved as .npy files and memory-mapped at query
+time, so neighbour lookups are array slices rather than text scans.
+"""
+import json
+import os
+import re
+import numpy as np
+import corpus
+import snapshots
+
+GRAPH_DIR = "citation_graph"
+META_FILE = "case_meta.jsonl"
+META_COLUMNS = ["id", "source", "text", "full_text", "citations"]  # read when building
+DAMPING = 0.85
+PAGERANK_ITERS = 50
+
+# "<Party> v <Party> [year] eKLR" or "<Party> v <Party> [year] <REPORTER> <page>"
+CASE_CITATION = re.compile(
+    r"(?P<p1>[A-Z][\w&.,'’()\- ]{1,120}?)\s+v\.?\s+(?P<p2>[A-Z][\w&.,'’()\- ]{1,120}?)\s*"
+    r"[\[(](?P<year>(?:19|20)\d{2})[\])]\s*(?P<reporter>eKLR|[A-Z][A-Za-z]{1,5}(?: [A-Z][A-Za-z]{0,3})?)(?:\s+(?P<page>\d+))?")
+_STOPWORDS = {"the", "of", "and", "ltd", "limited", "co", "others", "other", "another", "anor", "ors",
+              "&", "in", "re", "for", "inc", "plc", "uk", "k"}
+_CONNECTORS = {"of", "and", "&", "the", "others", "other", "another", "anor", "ors", "for", "in", "de", "la"}
+
+
+def _party_words(text, n=3):
+    words = [w for w in re.findall(r"[a-z]+", text.lower()) if w not in _STOPWORDS and len(w) > 1]
+    return " ".join(words[:n])
+
+
+def _trim_party(text):
+    """Drop prose before a party name ("Reliance was placed on British Leyland" -> "British Leyland")"""
+    text = re.split(r"[.;:]\s+|\n", text)[-1]
+    tokens = text.split()
+    start = len(tokens)
+    while start > 0:
+        token = tokens[start - 1]
+        bare = token.strip("(),'’&-")
+        if bare[:1].isupper() or bare[:1].isdigit() or bare.lower() in _CONNECTORS or not bare:
+            start -= 1
+        else:
+            break
+    while start < len(tokens) and tokens[start].lower() in _CONNECTORS:
+        start += 1
+    return " ".join(tokens[start:])
+
+
+def case_key(party1, party2, year):
+    """Normalized identity of a case, shared by citations and the cited judgment itself"""
+    return f"{_party_words(party1)}|{_party_words(party2)}|{year}"
+
+
+def extract_citations(text):
+    """Case citations in a judgment as [{"citation", "key"}], de-duplicated"""
+    seen = {}
+    for m in CASE_CITATION.finditer(text or ""):
+        p1 = _trim_party(m.group("p1"))
+        key = case_key(p1, m.group("p2"), m.group("year"))
+        if key.startswith("|"):
+            continue
+        citation = f"{p1.strip()} v {m.group('p2').strip()} [{m.group('year')}] {m.group('reporter')}" + \
+            (f" {m.group('page')}" if m.group("page") else "")
+        seen.setdefault(key, citation)
+    return [{"citation": c, "key": k} for k, c in seen.items()]
+
+
+def self_keys(doc):
+    """Keys a judgment is known by: its eKLR-style filename slug and the citation in its heading"""
+    keys = set()
+    stem = os.path.splitext(doc.get("source") or doc.get("id") or "")[0].lower()
+    m = re.match(r"(?P<p1>.+?)-v-(?P<p2>.+?)-(?P<year>(?:19|20)\d{2})(?:-eklr)?$", stem)
+    if m:
+        keys.add(case_key(m.group("p1").replace("-", " "), m.group("p2").replace("-", " "), m.group("year")))
+    heading = (doc.get("full_text") or doc.get("text") or "")[:1500]
+    first = CASE_CITATION.search(heading)
+    if first:
+        p1 = _trim_party(first.group("p1"))
+        keys.add(case_key(p1, first.group("p2"), first.group("year")))
+    return keys
+
+
+def to_csr(n, src, dst):
+    """(indptr, indices) for edges src -> dst over n nodes"""
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int32)
+    order = np.lexsort((dst, src))
+    src, dst = src[order], dst[order]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst
+
+
+def pagerank(n, src, dst, damping=DAMPING, iters=PAGERANK_ITERS, tol=1e-9):
+    """Power-iteration PageRank over an edge list (vectorized; dangling mass spread uniformly)"""
+    if n == 0:
+        return np.zeros(0, dtype=np.float32)
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    out_degree = np.bincount(src, minlength=n).astype(np.float64)
+    dangling = out_degree == 0
+    rank = np.full(n, 1.0 / n)
+    for _ in range(iters):
+        share = np.divide(rank, out_degree, out=np.zeros(n), where=~dangling)
+        incoming = np.bincount(dst, weights=share[src], minlength=n)
+        new = (1 - damping) / n + damping * (incoming + rank[dangling].sum() / n)
+        done = np.abs(new - rank).sum() < tol
+        rank = new
+        if done:
+            break
+    return (rank / rank.max()).astype(np.float32)  # scaled so the top authority is 1.0
+
+
+def _iter_meta(path):
+    return corpus.iter_records(path, columns=META_COLUMNS)
+
+
+def build(docs, directory=GRAPH_DIR):
+    """Build and persist the graph for docs in index (meta) order.
+
+    docs: a list of docs, or the path of a meta JSONL (streamed twice, never
+    held in memory).
+    """
+    def iter_docs():
+        return _iter_meta(docs) if isinstance(docs, str) else iter(docs)
+
+    n = 0
+    owner = {}
+    for i, doc in enumerate(iter_docs()):
+        n += 1
+        for key in self_keys(doc):
+            owner.setdefault(key, i)  # first row of a judgment stands for the whole case
+
+    src, dst, unresolved = [], [], 0
+    for i, doc in enumerate(iter_docs()):
+        citations = doc.get("citations")
+        if citations is None:
+            citations = extract_citations(doc.get("full_text") or doc.get("text", ""))
+        targets = {owner[c["key"]] for c in citations if c["key"] in owner} - {i}
+        unresolved += sum(c["key"] not in owner for c in citations)
+        src.extend([i] * len(targets))
+        dst.extend(sorted(targets))
+
+    out_indptr, out_indices = to_csr(n, src, dst)
+    in_indptr, in_indices = to_csr(n, dst, src)
+    authority = pagerank(n, src, dst)
+
+    os.makedirs(directory, exist_ok=True)
+    for name, array in (("out_indptr", out_indptr), ("out_indices", out_indices),
+                        ("in_indptr", in_indptr), ("in_indices", in_indices), ("authority", authority)):
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+    stats = {"nodes": n, "edges": len(src), "unresolved_citations": unresolved}
+    with open(os.path.join(directory, "stats.json"), "w", encoding="utf-8") as f:
+        json.dump(stats, f)
+    return stats
+
+
+class CitationGraph:
+    """Memory-mapped CSR citation graph"""
+
+    def __init__(self, directory=GRAPH_DIR):
+        def load(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+        self.out_indptr, self.out_indices = load("out_indptr"), load("out_indices")
+        self.in_indptr, self.in_indices = load("in_indptr"), load("in_indices")
+        self.authority = load("authority")
+
+    @classmethod
+    def load(cls, directory=GRAPH_DIR):
+        """The persisted graph, or None if it was never built"""
+        if not os.path.exists(os.path.join(directory, "authority.npy")):
+            return None
+        return cls(directory)
+
+    def __len__(self):
+        return len(self.authority)
+
+    def cites(self, node):
+        return self.out_indices[self.out_indptr[node]:self.out_indptr[node + 1]]
+
+    def cited_by(self, node):
+        return self.in_indices[self.in_indptr[node]:self.in_indptr[node + 1]]
+
+    def neighbours(self, node):
+        return np.concatenate([self.cites(node), self.cited_by(node)])
+
+    def expand(self, seeds, hops=1, decay=0.5):
+        """Nodes within `hops` citation links of the seeds.
+
+        seeds: {node: score}. Returns {node: (score, hop, via)} for new nodes,
+        scored as seed score * decay**hop * authority.
+        """
+        found = {}
+        frontier = dict(seeds)
+        for hop in range(1, hops + 1):
+            next_frontier = {}
+            for node, score in frontier.items():
+                for nb in self.neighbours(node).tolist():
+                    if nb in seeds or nb >= len(self):
+                        continue
+                    candidate = score * decay ** hop * float(self.authority[nb])
+                    if nb not in found or candidate > found[nb][0]:
+                        found[nb] = (candidate, hop, node)
+                        next_frontier[nb] = max(next_frontier.get(nb, 0.0), score)
+            frontier = next_frontier
+        return found
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the citation graph for the indexed corpus")
+    parser.add_argument("--meta", default=None, help="case meta (default: the served snapshot's)")
+    parser.add_argument("--output", default=GRAPH_DIR)
+    parser.add_argument("--no-snapshot", action="store_true",
+                        help="only write --output; do not republish the served snapshot with it")
+    args = parser.parse_args()
+
+    stats = build(args.meta or corpus.locate(snapshots.served_file(META_FILE)), args.output)
+    print(f"✅ Citation graph: {stats['nodes']} judgments, {stats['edges']} citation links "
+          f"({stats['unresolved_citations']} citations to cases outside the corpus)")
+    if not args.no_snapshot and os.path.normpath(args.output) == GRAPH_DIR:
+        version = snapshots.republish([GRAPH_DIR])
+        if version:
+            print(f"Published index snapshot {version}; running apps switch to it without a restart.")
+
+
+if __name__ == "__main__":
+    main()
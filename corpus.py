@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Shared reader/writer for the pipeline's corpus files.
+
+cases_sections, case_meta and training data are tables of records. They
+can be stored as line-delimited JSON (.jsonl, the default) or as Parquet
+(.parquet, needs pyarrow). The file extension picks the format.
+
+With Parquet a stage reads only the columns it needs: embedding reads
+`text` (and `full_text` only when collapsing near-duplicates), the
+citation graph reads `id`/`source`/`full_text`, and serving leaves
+`full_text` on disk. The file is memory-mapped, and Rows gives list
+access to a table by slicing one row at a time, without copying the table.
+
+A stage is pointed at a "case_meta.jsonl"-style path. locate() returns
+whichever of case_meta.parquet / case_meta.jsonl exists (the newer if both
+do), so readers need no changes when the index is built with
+`index_cases.py --format parquet`.
+
+    python corpus.py convert cases_sections.jsonl cases_sections.parquet
+    python corpus.py info case_meta.parquet
+"""
+import json
+import os
+
+FORMATS = (".jsonl", ".parquet")
+BATCH_ROWS = 10000   # rows per Parquet row group / streamed batch
+EXTRA_COLUMN = "_extra"  # JSON of keys (or values) that do not fit the file's schema
+# declared Parquet types of the pipeline's columns; other columns are typed from the first batch
+COLUMN_TYPES = {"id": "string", "source": "string", "case_id": "string", "text": "string",
+                "full_text": "string", "citations": "list<string>"}
+
+
+def is_parquet(path):
+    return str(path).endswith(".parquet")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet corpus files need pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def _has_pyarrow():
+    try:
+        _pyarrow()
+        return True
+    except ImportError:
+        return False
+
+
+def with_format(path, fmt):
+    """path with its extension replaced by fmt ("jsonl" or "parquet")"""
+    stem = os.path.splitext(str(path))[0]
+    return f"{stem}.{fmt.lstrip('.')}"
+
+
+def locate(path):
+    """The existing file for path in either format (the newer if both exist); path itself if neither does"""
+    candidates = [with_format(path, ext) for ext in FORMATS]
+    if not _has_pyarrow():
+        candidates = [c for c in candidates if not is_parquet(c)]
+    existing = [c for c in candidates if os.path.exists(c)]
+    if not existing:
+        return str(path)
+    return max(existing, key=os.path.getmtime)
+
+
+def exists(path):
+    return os.path.exists(locate(path))
+
+
+def _clean(record):
+    """Parquet has a column for every key; drop the nulls so missing keys stay missing"""
+    extra = record.pop(EXTRA_COLUMN, None)
+    record = {k: v for k, v in record.items() if v is not None}
+    if extra:
+        record.update(json.loads(extra))
+    return record
+
+
+def _project(record, columns):
+    return record if columns is None else {k: record[k] for k in columns if k in record}
+
+
+def iter_batches(path, columns=None, batch_size=BATCH_ROWS, skip=0):
+    """Stream records in lists of up to batch_size, skipping the first `skip` rows"""
+    path = locate(path)
+    if is_parquet(path):
+        pq = _pyarrow().parquet
+        f = pq.ParquetFile(path, memory_map=True)
+        names = set(f.schema_arrow.names)
+        read = None if columns is None else [c for c in columns if c in names]
+        if columns is not None and EXTRA_COLUMN in names:
+            read.append(EXTRA_COLUMN)
+        seen = 0
+        for batch in f.iter_batches(batch_size=batch_size, columns=read):
+            if seen + batch.num_rows <= skip:
+                seen += batch.num_rows
+                continue
+            if seen < skip:
+                batch = batch.slice(skip - seen)
+            seen += batch.num_rows
+            yield [_project(_clean(r), columns) for r in batch.to_pylist()]
+        return
+
+    chunk, seen = [], 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            seen += 1
+            if seen <= skip:
+                continue
+            chunk.append(_project(json.loads(line), columns))
+            if len(chunk) >= batch_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_records(path, columns=None, batch_size=BATCH_ROWS):
+    for batch in iter_batches(path, columns, batch_size):
+        yield from batch
+
+
+def read_records(path, columns=None):
+    return list(iter_records(path, columns))
+
+
+def read_column(path, name):
+    """One column: a zero-copy pyarrow ChunkedArray for Parquet, a list for JSONL"""
+    path = locate(path)
+    if is_parquet(path):
+        return _pyarrow().parquet.read_table(path, columns=[name], memory_map=True).column(name)
+    return [r.get(name) for r in iter_records(path, [name])]
+
+
+def count(path):
+    """Number of records (free for Parquet: read from the footer)"""
+    path = locate(path)
+    if is_parquet(path):
+        return _pyarrow().parquet.ParquetFile(path).metadata.num_rows
+    with open(path, "r", encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+class Writer:
+    """Append records to a corpus file in either format"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.rows = 0
+        self._schema = None
+        self._parquet = None
+        self._file = None
+        if not is_parquet(self.path):
+            self._file = open(self.path, "w", encoding="utf-8")
+
+    def write(self, records):
+        records = list(records)
+        if not records:
+            return
+        self.rows += len(records)
+        if self._file is not None:
+            for r in records:
+                self._file.write(json.dumps(r, ensure_ascii=False) + "\n")
+            return
+
+        pa = _pyarrow()
+        if self._schema is None:
+            self._schema = _schema(pa, records)
+            self._parquet = pa.parquet.ParquetWriter(self.path, self._schema)
+        known = set(self._schema.names)
+        rows = []
+        for r in records:
+            extra = {k: v for k, v in r.items() if k not in known}
+            rows.append({**{k: v for k, v in r.items() if k in known},
+                         EXTRA_COLUMN: json.dumps(extra, ensure_ascii=False) if extra else None})
+        try:
+            table = pa.Table.from_pylist(rows, schema=self._schema)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+            table = None
+        if table is None or not _exact(pa, table, rows):
+            # a later batch holds values of another type (a float in an int column, ...)
+            table = pa.Table.from_pylist(_demote(pa, self._schema, rows), schema=self._schema)
+        self._parquet.write_table(table, row_group_size=BATCH_ROWS)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        if self._parquet is not None:
+            self._parquet.close()
+        elif self._file is None:
+            # no records: still leave a valid (empty) file
+            pa = _pyarrow()
+            pa.parquet.write_table(pa.table({EXTRA_COLUMN: pa.array([], pa.string())}), self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _untyped(pa, t):
+    """Types that carry no information yet: null, list<null>, ..."""
+    if pa.types.is_null(t):
+        return True
+    if pa.types.is_list(t) or pa.types.is_large_list(t):
+        return _untyped(pa, t.value_type)
+    return False
+
+
+def _schema(pa, records):
+    """COLUMN_TYPES for the known columns, the first batch's types for the others.
+
+    Columns that are all null (or all-empty lists) or of mixed types in the
+    first batch get no column; their values go to EXTRA_COLUMN.
+    """
+    declared = {"string": pa.string(), "list<string>": pa.list_(pa.string())}
+    names = list(dict.fromkeys(k for r in records for k in r))
+    fields = []
+    for name in names:
+        if name == EXTRA_COLUMN:
+            continue
+        if name in COLUMN_TYPES:
+            fields.append(pa.field(name, declared[COLUMN_TYPES[name]]))
+            continue
+        try:
+            t = pa.array([r.get(name) for r in records]).type
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+            continue
+        if not _untyped(pa, t):
+            fields.append(pa.field(name, t))
+    return pa.schema(fields + [pa.field(EXTRA_COLUMN, pa.string())])
+
+
+def _checked(pa, t):
+    """Columns whose conversion can silently coerce a value (2.5 -> 2 in an int64 column)"""
+    return not (pa.types.is_string(t) or (pa.types.is_list(t) and pa.types.is_string(t.value_type)))
+
+
+def _exact(pa, table, rows):
+    """Whether the coercible columns of table hold exactly the rows' values"""
+    return all(table.column(f.name).to_pylist() == [r.get(f.name) for r in rows]
+               for f in table.schema if _checked(pa, f.type))
+
+
+def _fits(pa, values, t):
+    try:
+        converted = pa.array(values, type=t)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return False
+    return not _checked(pa, t) or converted.to_pylist() == values
+
+
+def _demote(pa, schema, rows):
+    """Move the values that do not convert exactly to their column's type into EXTRA_COLUMN"""
+    for field in schema:
+        if field.name == EXTRA_COLUMN or _fits(pa, [r.get(field.name) for r in rows], field.type):
+            continue
+        for r in rows:
+            value = r.get(field.name)
+            if value is not None and not _fits(pa, [value], field.type):
+                extra = json.loads(r[EXTRA_COLUMN]) if r[EXTRA_COLUMN] else {}
+                extra[field.name] = value
+                r[field.name], r[EXTRA_COLUMN] = None, json.dumps(extra, ensure_ascii=False)
+    return rows
+
+
+def write(records, path, batch_size=BATCH_ROWS):
+    """Write an iterable of records; returns the number written"""
+    with Writer(path) as w:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                w.write(batch)
+                batch = []
+        w.write(batch)
+    return w.rows
+
+
+def convert(source, target, batch_size=BATCH_ROWS):
+    """Rewrite a corpus file in the format of target's extension (streamed)"""
+    tmp = f"{target}.tmp{os.path.splitext(str(target))[1]}"
+    rows = write(iter_records(source, batch_size=batch_size), tmp, batch_size)
+    os.replace(tmp, target)
+    return rows
+
+
+class Rows:
+    """Read-only list of records over a Parquet table, materializing rows on access"""
+
+    def __init__(self, table):
+        self.table = table
+
+    @classmethod
+    def open(cls, path, columns=None, exclude=()):
+        pq = _pyarrow().parquet
+        names = pq.ParquetFile(path).schema_arrow.names
+        read = [c for c in (columns or names) if c not in exclude]
+        return cls(pq.read_table(path, columns=read, memory_map=True))
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return _clean(self.table.slice(i, 1).to_pylist()[0])
+
+    def __iter__(self):
+        for batch in self.table.to_batches(max_chunksize=BATCH_ROWS):
+            for r in batch.to_pylist():
+                yield _clean(r)
+
+
+def load_table(path, exclude=()):
+    """All records of a corpus file, without the `exclude` columns: Rows for Parquet, a list for JSONL"""
+    path = locate(path)
+    if is_parquet(path):
+        return Rows.open(path, exclude=exclude)
+    return [{k: v for k, v in r.items() if k not in exclude} for r in iter_records(path)]
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Convert and inspect corpus files (JSONL / Parquet)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert_cmd = sub.add_parser("convert", help="rewrite a corpus file in the target's format")
+    convert_cmd.add_argument("source")
+    convert_cmd.add_argument("target")
+    info_cmd = sub.add_parser("info", help="rows, columns and read time of a corpus file")
+    info_cmd.add_argument("path")
+    info_cmd.add_argument("--column", default="text", help="column timed on its own")
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        t0 = time.perf_counter()
+        rows = convert(args.source, args.target)
+        before, after = os.path.getsize(locate(args.source)), os.path.getsize(args.target)
+        print(f"✅ Wrote {rows} records to {args.target} in {time.perf_counter() - t0:.1f}s "
+              f"({before / 1e6:.1f} MB → {after / 1e6:.1f} MB)")
+        return
+
+    path = locate(args.path)
+    t0 = time.perf_counter()
+    n = sum(len(b) for b in iter_batches(path))
+    full_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    read_column(path, args.column)
+    column_s = time.perf_counter() - t0
+    print(f"📦 {path}: {n} records, {os.path.getsize(path) / 1e6:.1f} MB")
+    print(f"⏱️ all columns {full_s * 1000:.0f} ms, `{args.column}` only {column_s * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
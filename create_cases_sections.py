@@ -3,9 +3,12 @@
 Create cases_sections.jsonl from PDF files in cases directory
 """
 import pdfplumber
-import json
 import re
+import sys
 from pathlib import Path
+from dedup import collapse_duplicates
+from citation_graph import extract_citations
+import corpus
 
 def extract_sections_from_pdf(pdf_path):
     """Extract different sections from a PDF"""
@@ -17,7 +20,8 @@ def extract_sections_from_pdf(pdf_path):
         "id": Path(pdf_path).stem,
         "source": Path(pdf_path).name,
         "text": text[:2000] + "..." if len(text) > 2000 else text,  # Limit length
-        "full_text": text
+        "full_text": text,
+        "citations": extract_citations(text)
     }
     
     return case_info
@@ -36,12 +40,17 @@ def main():
         except Exception as e:
             print(f"Error processing {pdf_file.name}: {e}")
     
-    # Write to cases_sections.jsonl
-    with open("cases_sections.jsonl", "w", encoding="utf-8") as f:
-        for section in sections:
-            f.write(json.dumps(section, ensure_ascii=False) + "\n")
+    # Collapse re-issued / renamed copies of the same judgment
+    extracted = len(sections)
+    sections = collapse_duplicates(sections)
+    if len(sections) < extracted:
+        print(f"Collapsed {extracted - len(sections)} near-duplicate judgments")
     
-    print(f"Created cases_sections.jsonl with {len(sections)} cases")
+    # Write to cases_sections.jsonl (or .parquet when given as the output path)
+    output = sys.argv[1] if len(sys.argv) > 1 else "cases_sections.jsonl"
+    corpus.write(sections, output)
+    
+    print(f"Created {output} with {len(sections)} cases")
 
 if __name__ == "__main__":
     main()
@@ -3,6 +3,7 @@ import pdfplumber
 import re
 import json
 from pathlib import Path
+import corpus
 
 # heuristics: anchor words to split doc
 FACT_KEYS = [r"\bFacts\b", r"\bBackground\b", r"\bIntroduction\b"]
@@ -84,7 +85,5 @@ if __name__ == "__main__":
             samples.append(sample)
         except Exception as e:
             print(f"ERROR parsing {pdf}: {e}")
-    with open(out_file, "w", encoding="utf-8") as f:
-        for s in samples:
-            f.write(json.dumps(s, ensure_ascii=False) + "\n")
+    corpus.write(samples, out_file)  # .jsonl or .parquet, by extension
     print(f"Wrote {len(samples)} samples to {out_file}")
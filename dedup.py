@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate judgment detection with MinHash + LSH.
+
+Used during ingestion (create_cases_sections.py, index_cases.py) so the same
+judgment published under different filenames is embedded and indexed once.
+"""
+import re
+import zlib
+import numpy as np
+
+NUM_PERM = 128          # MinHash signature length
+BANDS = 32              # LSH bands (NUM_PERM must be divisible by BANDS)
+SHINGLE_SIZE = 5        # words per shingle
+THRESHOLD = 0.8         # estimated Jaccard above which two docs are duplicates
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def _permutations(num_perm, seed=1):
+    """Random (a, b) coefficients for the universal hash family"""
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, np.iinfo(np.int32).max, size=num_perm, dtype=np.int64).astype(np.uint64)
+    b = rng.randint(0, np.iinfo(np.int32).max, size=num_perm, dtype=np.int64).astype(np.uint64)
+    return a, b
+
+
+def _words(text):
+    return re.findall(r"\w+", (text or "").lower())
+
+
+def shingle_hashes(text, k=SHINGLE_SIZE):
+    """Hash the set of k-word shingles of a text to 32-bit ints (empty for texts under k words)"""
+    words = _words(text)
+    shingles = {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles),
+                       dtype=np.uint64, count=len(shingles))
+
+
+def minhash_signature(text, num_perm=NUM_PERM, perms=None):
+    """MinHash signature of a text (vectorized over shingles and permutations)"""
+    a, b = perms if perms is not None else _permutations(num_perm)
+    hashes = shingle_hashes(text)
+    # (num_shingles, num_perm) table of permuted hashes, min over shingles
+    permuted = ((hashes[:, None] * a[None, :] + b[None, :]) % _MERSENNE_PRIME) & _MAX_HASH
+    return permuted.min(axis=0)
+
+
+def find_duplicate_groups(texts, threshold=THRESHOLD, num_perm=NUM_PERM, bands=BANDS):
+    """Group near-duplicate texts.
+
+    Returns a list of index groups; each group is sorted and its first index is
+    the canonical document. Runs in roughly linear time: every document is
+    hashed once and only documents sharing an LSH bucket are compared.
+
+    Texts with fewer than SHINGLE_SIZE words (empty or scanned PDFs) have no
+    shingles to compare, so they are never grouped with anything.
+    """
+    if num_perm % bands:
+        raise ValueError("num_perm must be divisible by bands")
+    rows = num_perm // bands
+    perms = _permutations(num_perm)
+    hashed = [i for i, t in enumerate(texts) if len(_words(t)) >= SHINGLE_SIZE]
+    signatures = np.vstack([minhash_signature(texts[i], num_perm, perms) for i in hashed]) if hashed else \
+        np.empty((0, num_perm), dtype=np.uint64)
+
+    # union-find over document indices
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+
+    for band in range(bands):
+        buckets = {}
+        band_sig = signatures[:, band * rows:(band + 1) * rows]
+        for i, key in enumerate(map(bytes, band_sig)):
+            buckets.setdefault(key, []).append(i)  # i: row of signatures, hashed[i]: document
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            head = members[0]
+            for other in members[1:]:
+                if find(hashed[head]) == find(hashed[other]):
+                    continue
+                similarity = float(np.mean(signatures[head] == signatures[other]))
+                if similarity >= threshold:
+                    union(hashed[head], hashed[other])
+
+    groups = {}
+    for i in range(len(texts)):
+        groups.setdefault(find(i), []).append(i)
+    return [sorted(g) for g in groups.values()]
+
+
+def collapse_duplicates(docs, threshold=THRESHOLD, text_key="full_text"):
+    """Collapse near-duplicate docs into canonical docs with aliases.
+
+    Each returned doc is the first member of its duplicate group, with an
+    "aliases" list of {"id", "source"} for the dropped copies.
+    """
+    texts = [d.get(text_key) or d.get("text", "") for d in docs]
+    groups = find_duplicate_groups(texts, threshold=threshold)
+    groups.sort(key=lambda g: g[0])
+
+    collapsed = []
+    for group in groups:
+        canonical = dict(docs[group[0]])
+        aliases = list(canonical.get("aliases", []))
+        for i in group[1:]:
+            aliases.append({"id": docs[i].get("id", str(i)), "source": docs[i].get("source", "unknown")})
+            aliases.extend(docs[i].get("aliases", []))
+        if aliases:
+            canonical["aliases"] = aliases
+        collapsed.append(canonical)
+    return collapsed
+
+
+if __name__ == "__main__":
+    import sys
+    import corpus
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "cases_sections.jsonl"
+    docs = corpus.read_records(path)
+    collapsed = collapse_duplicates(docs)
+    print(f"{len(docs)} documents -> {len(collapsed)} after removing near-duplicates")
+    for d in collapsed:
+        for alias in d.get("aliases", []):
+            print(f"   {alias['source']} -> {d.get('source', 'unknown')}")
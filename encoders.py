@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Query/passage encoder backends.
+
+"torch" is the stock sentence-transformers model. "onnx" runs the same model
+exported to ONNX on onnxruntime, and "onnx-int8" the ONNX graph with dynamic
+int8 quantization of its weights, which is typically several times faster
+per query on CPU. An exported backend is only used after it passes a fidelity
+check: the cosine similarity of its embeddings with the PyTorch embeddings
+must stay above FIDELITY_MIN_COSINE on a sample of texts.
+
+    pip install "optimum[onnxruntime]"
+    python encoders.py export                  # export + quantize + fidelity check
+    python encoders.py compare --runs 200      # per-query latency and fidelity of every backend
+
+Select a backend with `index_cases.py --encoder onnx-int8` or MOOT_ENCODER=onnx-int8
+for the retriever.
+"""
+import json
+import os
+import time
+import numpy as np
+import corpus
+
+EMBED_MODEL = "all-mpnet-base-v2"
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_DIR = "encoder_onnx"
+INFO_FILE = "encoder_info.json"
+QUANTIZATION_CONFIG = "avx2"  # arm64, avx2, avx512 or avx512_vnni; avx2 runs on any x86-64 node
+QUANTIZED_FILE = f"onnx/model_qint8_{QUANTIZATION_CONFIG}.onnx"
+FIDELITY_MIN_COSINE = 0.98    # every sample text
+FIDELITY_MEAN_COSINE = 0.995  # on average
+
+SAMPLE_TEXTS = [
+    "unfair termination without a disciplinary hearing",
+    "dismissal for gross misconduct under section 44(4) of the Employment Act",
+    "An employee was dismissed for allegedly stealing company equipment worth Ksh. 75,000.",
+    "Whether the refusal to work unpaid overtime constitutes grounds for dismissal",
+    "The burden of proving that the reasons for termination were valid lies on the employer.",
+    "compensation of twelve months gross salary and pay in lieu of notice",
+    "redundancy notice to the labour officer and the union",
+    "The Claimant was not given an opportunity to be heard in the presence of a fellow employee.",
+]
+
+
+def _sample_texts(limit=64, meta_file="case_meta.jsonl"):
+    """Fidelity sample: built-in queries plus passages from the corpus when available"""
+    texts = list(SAMPLE_TEXTS)
+    if corpus.exists(meta_file):
+        for doc in corpus.iter_records(meta_file, columns=["text"], batch_size=limit):
+            if len(texts) >= limit:
+                break
+            texts.append(doc.get("text", "")[:2000])
+    return texts
+
+
+def load_encoder(backend="torch", model_name=EMBED_MODEL, directory=ONNX_DIR):
+    """A SentenceTransformer for the backend (same .encode interface for all of them)"""
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown encoder backend {backend!r}; choose from {', '.join(BACKENDS)}")
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(f"{directory} not found; run `python encoders.py export` first")
+    kwargs = {"file_name": QUANTIZED_FILE} if backend == "onnx-int8" else {}
+    return SentenceTransformer(directory, backend="onnx", model_kwargs=kwargs)
+
+
+def load_checked(backend="torch", model_name=EMBED_MODEL, directory=ONNX_DIR):
+    """load_encoder, falling back to torch if the export is missing or failed its fidelity check"""
+    if backend != "torch":
+        info = load_info(directory)
+        check = info.get("fidelity", {}).get(backend)
+        if check is None or not check["passed"]:
+            reason = "not exported" if check is None else f"failed fidelity (min cosine {check['min']:.4f})"
+            print(f"⚠️ Encoder backend {backend} {reason}; using torch")
+            backend = "torch"
+        else:
+            try:
+                return load_encoder(backend, model_name, directory), backend
+            except Exception as e:
+                print(f"⚠️ Could not load encoder backend {backend}: {e}; using torch")
+                backend = "torch"
+    return load_encoder("torch", model_name), backend
+
+
+def _normalized(embedder, texts):
+    embs = np.asarray(embedder.encode(texts, convert_to_numpy=True), dtype=np.float32)
+    return embs / np.maximum(np.linalg.norm(embs, axis=1, keepdims=True), 1e-12)
+
+
+def fidelity(reference, candidate, texts):
+    """Per-text cosine similarity between two encoders' embeddings, summarized"""
+    cos = np.sum(_normalized(reference, texts) * _normalized(candidate, texts), axis=1)
+    passed = bool(cos.min() >= FIDELITY_MIN_COSINE and cos.mean() >= FIDELITY_MEAN_COSINE)
+    return {"mean": float(cos.mean()), "min": float(cos.min()), "texts": len(texts), "passed": passed}
+
+
+def load_info(directory=ONNX_DIR):
+    path = os.path.join(directory, INFO_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def export(model_name=EMBED_MODEL, directory=ONNX_DIR, quantize=True, texts=None):
+    """Export the model to ONNX (and a dynamic-int8 variant), then record the fidelity checks"""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    onnx_model = SentenceTransformer(model_name, backend="onnx")  # exported on load
+    onnx_model.save_pretrained(directory)
+    if quantize:
+        export_dynamic_quantized_onnx_model(onnx_model, quantization_config=QUANTIZATION_CONFIG,
+                                            model_name_or_path=directory)
+
+    texts = texts or _sample_texts()
+    reference = load_encoder("torch", model_name)
+    info = {"model": model_name, "quantization_config": QUANTIZATION_CONFIG, "fidelity": {}}
+    for backend in ("onnx", "onnx-int8") if quantize else ("onnx",):
+        info["fidelity"][backend] = fidelity(reference, load_encoder(backend, model_name, directory), texts)
+    with open(os.path.join(directory, INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+    return info
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def compare(backends=BACKENDS, runs=100, texts=None, model_name=EMBED_MODEL, directory=ONNX_DIR):
+    """Single-query latency (ms) and fidelity vs torch for each available backend"""
+    texts = texts or SAMPLE_TEXTS
+    reference = load_encoder("torch", model_name)
+    results = {}
+    for backend in backends:
+        try:
+            t0 = time.perf_counter()
+            encoder = reference if backend == "torch" else load_encoder(backend, model_name, directory)
+            load_s = time.perf_counter() - t0
+        except Exception as e:
+            print(f"⚠️ Skipping {backend}: {e}")
+            continue
+        for text in texts[:3]:
+            encoder.encode([text], convert_to_numpy=True)  # warm-up
+        latencies = []
+        for i in range(runs):
+            t0 = time.perf_counter()
+            encoder.encode([texts[i % len(texts)]], convert_to_numpy=True)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        results[backend] = {"p50_ms": _percentile(latencies, 50), "p95_ms": _percentile(latencies, 95),
+                            "load_s": load_s if backend != "torch" else None,
+                            "fidelity": fidelity(reference, encoder, _sample_texts()) if backend != "torch" else None}
+    return results
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export and compare query encoder backends")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_cmd = sub.add_parser("export", help="export the embedder to ONNX (+ dynamic int8) and check fidelity")
+    export_cmd.add_argument("--no-quantize", action="store_true")
+    compare_cmd = sub.add_parser("compare", help="per-query latency and fidelity of each backend")
+    compare_cmd.add_argument("--runs", type=int, default=100)
+    compare_cmd.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    compare_cmd.add_argument("--output", default=None, help="write the comparison as JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        info = export(quantize=not args.no_quantize)
+        for backend, check in info["fidelity"].items():
+            status = "✅" if check["passed"] else "❌"
+            print(f"{status} {backend}: mean cosine {check['mean']:.4f}, min {check['min']:.4f} "
+                  f"over {check['texts']} texts")
+        return
+
+    results = compare(args.backends, args.runs)
+    baseline = results.get("torch", {}).get("p50_ms")
+    print(f"\n{'backend':<12}{'p50 ms':>10}{'p95 ms':>10}{'speedup':>10}{'min cos':>10}")
+    for backend, r in results.items():
+        speedup = f"{baseline / r['p50_ms']:.2f}x" if baseline and r["p50_ms"] else "-"
+        min_cos = f"{r['fidelity']['min']:.4f}" if r["fidelity"] else "-"
+        print(f"{backend:<12}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{speedup:>10}{min_cos:>10}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Retrieval quality + speed evaluation.
+
+Runs every retrieval configuration over a labelled query set and reports
+recall@k, MRR and nDCG@k next to latency, marking the configurations that are
+Pareto-optimal (no other configuration is both faster and at least as good).
+
+The query set is JSONL, one labelled query per line:
+
+    {"query": "dismissal without a disciplinary hearing", "relevant": ["courtcase", "case2.pdf"]}
+
+"relevant" entries may be doc ids, source filenames or alias ids/sources.
+
+    python evaluate_retrieval.py labelled_queries.jsonl --k 5 --output retrieval_eval.json
+"""
+import argparse
+import json
+import math
+import os
+import time
+
+import retriever
+
+# name -> how to run it; vector_mode configs rebuild the index in memory from case_vectors.npy
+CONFIGS = {
+    "dense": {"retrieve": {}},
+    "dense+mmr": {"retrieve": {"diversify": True}},
+    "dense+mmr+case-cap": {"retrieve": {"diversify": True, "max_per_case": 1}},
+    "dense+rerank": {"retrieve": {"rerank": True}},
+    "int8": {"vector_mode": "int8", "retrieve": {}},
+    "binary": {"vector_mode": "binary", "retrieve": {}},
+    "keyword": {"keyword": True},
+}
+
+
+def load_labelled(path):
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                queries.append({"query": record["query"], "relevant": set(map(str, record["relevant"]))})
+    return queries
+
+
+def doc_keys(doc):
+    """Every label a retrieved doc answers to"""
+    keys = set()
+    for d in [doc] + list(doc.get("aliases", [])):
+        for field in ("id", "case_id", "source"):
+            if d.get(field):
+                keys.add(str(d[field]))
+        if d.get("source"):
+            keys.add(os.path.splitext(d["source"])[0])
+    return keys
+
+
+def ranked_relevance(docs, relevant):
+    """Binary relevance per rank, counting each relevant label once"""
+    found = set()
+    gains = []
+    for doc in docs:
+        hit = (doc_keys(doc) & relevant) - found
+        found |= hit
+        gains.append(1 if hit else 0)
+    return gains, found
+
+
+def score_query(docs, relevant, k):
+    gains, found = ranked_relevance(docs[:k], relevant)
+    recall = len(found) / len(relevant) if relevant else 0.0
+    mrr = next((1.0 / (rank + 1) for rank, g in enumerate(gains) if g), 0.0)
+    dcg = sum(g / math.log2(rank + 2) for rank, g in enumerate(gains))
+    ideal = sum(1.0 / math.log2(rank + 2) for rank in range(min(len(relevant), k)))
+    return {f"recall@{k}": recall, "mrr": mrr, f"ndcg@{k}": dcg / ideal if ideal else 0.0}
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def run_config(name, config, queries, k):
+    """Evaluate one configuration; returns mean metrics and latency percentiles"""
+    if config.get("keyword"):
+        from case_arguer import load_precedents, find_relevant_precedents
+        precedents = load_precedents()
+
+        def search(q):
+            return find_relevant_precedents(q, precedents, top_k=k)
+    else:
+        def search(q):
+            return retriever.retrieve(q, top_k=k, **config.get("retrieve", {}))
+
+    search(queries[0]["query"])  # warm-up (model loads, caches)
+    totals, latencies = {}, []
+    for q in queries:
+        start = time.perf_counter()
+        docs = search(q["query"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        for metric, value in score_query(docs, q["relevant"], k).items():
+            totals[metric] = totals.get(metric, 0.0) + value
+
+    result = {metric: value / len(queries) for metric, value in totals.items()}
+    result.update({"latency_p50_ms": _percentile(latencies, 50), "latency_p95_ms": _percentile(latencies, 95)})
+    return result
+
+
+def pareto_front(results, quality, latency="latency_p95_ms"):
+    """Names of configurations not dominated on (higher quality, lower latency)"""
+    front = []
+    for name, r in results.items():
+        dominated = any(
+            o[quality] >= r[quality] and o[latency] <= r[latency] and (o[quality] > r[quality] or o[latency] < r[latency])
+            for other, o in results.items() if other != name)
+        if not dominated:
+            front.append(name)
+    return front
+
+
+def evaluate(queries, configs, k=5):
+    import quantize
+
+    retriever.load()
+    disk_index = retriever.current_index()
+    vectors = quantize.load_vectors()
+
+    results = {}
+    for name, config in configs.items():
+        mode = config.get("vector_mode")
+        if mode and mode != disk_index[3]:
+            if vectors is None:
+                print(f"⚠️ Skipping {name}: {quantize.VECTORS_FILE} not found")
+                continue
+            retriever.install(quantize.build_index(vectors, mode), disk_index[1], vectors, mode, disk_index[4])
+        try:
+            print(f"🔎 Evaluating {name}...")
+            results[name] = run_config(name, config, queries, k)
+        except Exception as e:
+            print(f"⚠️ {name} failed: {e}")
+        finally:
+            if mode:
+                retriever.install(*disk_index)
+    return results
+
+
+def print_table(results, k, front):
+    columns = [f"recall@{k}", "mrr", f"ndcg@{k}", "latency_p50_ms", "latency_p95_ms"]
+    print(f"\n{'config':<22}" + "".join(f"{c:>16}" for c in columns) + "  pareto")
+    for name, r in sorted(results.items(), key=lambda item: item[1]["latency_p95_ms"]):
+        print(f"{name:<22}" + "".join(f"{r[c]:>16.3f}" for c in columns) + ("  ★" if name in front else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and latency per configuration")
+    parser.add_argument("queries", help="labelled JSONL: {query, relevant: [ids]}")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--pareto-metric", default=None, help="quality metric for the Pareto front (default ndcg@k)")
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    queries = load_labelled(args.queries)
+    if not queries:
+        print("❌ No labelled queries found")
+        return
+    results = evaluate(queries, {name: CONFIGS[name] for name in args.configs}, k=args.k)
+    if not results:
+        return
+    quality = args.pareto_metric or f"ndcg@{args.k}"
+    front = pareto_front(results, quality)
+    print_table(results, args.k, front)
+    print(f"\n★ Pareto-optimal on ({quality}, p95 latency): {', '.join(front)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"k": args.k, "queries": len(queries), "pareto_metric": quality,
+                       "pareto_front": front, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
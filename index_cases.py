@@ -1,41 +1,297 @@
 # index_cases.py
+import argparse
 import json
-from sentence_transformers import SentenceTransformer
+import os
+import shutil
 import faiss
 import numpy as np
 from pathlib import Path
+from dedup import collapse_duplicates
+import quantize
+import citation_graph
+import statute_index
+import argument_slots
+import snapshots
+import encoders
+import shards
+import case_digests
+import corpus
+import profiling
 
 EMBED_MODEL = "all-mpnet-base-v2"  # good default
 INDEX_FILE = "case_index.faiss"
 META_FILE = "case_meta.jsonl"
 DOCS_JSONL = "cases_sections.jsonl"  # one JSON per line: {"id": "...", "text": "...", "source": "..."}
 DIM = 768
+CHUNK_SIZE = 10000  # docs per streamed chunk
+CHECKPOINT_FILE = "case_index.ckpt.json"
+PARTIAL_VECTORS = "case_vectors.partial.f32"  # raw float32 rows appended per chunk
+PARTIAL_META = "case_meta.partial.jsonl"
+EMBED_COLUMNS = ["text"]
+DEDUP_COLUMNS = ["id", "source", "text", "full_text", "aliases"]  # what collapse_duplicates reads
+STREAM_WORKERS = 2  # encode processes for --stream; each holds its own copy of the encoder
 
-# Load model
-embedder = SentenceTransformer(EMBED_MODEL)
-
-# Load docs
-docs = []
-with open(DOCS_JSONL, "r", encoding="utf-8") as f:
-    for line in f:
-        docs.append(json.loads(line))
-
-texts = [d["text"] for d in docs]
-ids = [d.get("id", str(i)) for i,d in enumerate(docs)]
-
-# create embeddings
-embs = embedder.encode(texts, show_progress_bar=True, convert_to_numpy=True)
-# ensure dims
-assert embs.shape[1] == embs.shape[1]
-
-# build faiss index
-index = faiss.IndexFlatIP(embs.shape[1])  # inner-product; we'll normalize
-faiss.normalize_L2(embs)
-index.add(embs)
-faiss.write_index(index, INDEX_FILE)
-
-# store meta
-with open(META_FILE, "w", encoding="utf-8") as f:
-    for d in docs:
-        f.write(json.dumps(d, ensure_ascii=False) + "\n")
-print("Saved faiss index and meta.")
+
+def load_docs(path=DOCS_JSONL, dedup=True):
+    """Load docs, collapsing near-duplicates so they are embedded only once
+
+    Only the columns embedding needs are read (plus those dedup compares
+    and reports), so `full_text` stays on disk unless dedup is on. Each doc
+    keeps its input row in "_row"; full_records() streams the complete
+    records for the meta file.
+    """
+    columns = DEDUP_COLUMNS if dedup else EMBED_COLUMNS
+    docs = [dict(d, _row=row) for row, d in enumerate(corpus.iter_records(path, columns=columns))]
+    if dedup:
+        before = len(docs)
+        docs = collapse_duplicates(docs)
+        if len(docs) < before:
+            print(f"Skipping {before - len(docs)} near-duplicate documents")
+    return docs
+
+
+def full_records(path, docs):
+    """The input records of load_docs() docs with every column, in the same order, with their dedup aliases"""
+    kept = {d["_row"]: d.get("aliases") for d in docs}
+    row = 0
+    for batch in corpus.iter_batches(path):
+        for record in batch:
+            if row in kept:
+                if kept[row]:
+                    record["aliases"] = kept[row]
+                yield record
+            row += 1
+
+
+def embed_docs(docs, embedder):
+    texts = [d["text"] for d in docs]
+
+    # create embeddings
+    embs = embedder.encode(texts, show_progress_bar=True, convert_to_numpy=True).astype(np.float32)
+    # ensure dims
+    assert embs.shape[1] == DIM
+    faiss.normalize_L2(embs)  # inner-product index; normalized = cosine
+    return embs
+
+
+def build_index(docs, embedder, mode="flat"):
+    embs = embed_docs(docs, embedder)
+    return quantize.build_index(embs, mode), embs
+
+
+def save_meta(docs, path=META_FILE):
+    corpus.write(docs, path)
+    _remove_other_formats(path)
+
+
+def _remove_other_formats(path):
+    """Drop a meta file left in the other format by an earlier build"""
+    for ext in corpus.FORMATS:
+        other = corpus.with_format(path, ext)
+        if other != path and os.path.exists(other):
+            os.remove(other)
+
+
+def iter_doc_chunks(path, chunk_size, skip=0):
+    """Stream docs (JSONL or Parquet) in chunks, skipping the first `skip` docs"""
+    yield from corpus.iter_batches(path, batch_size=chunk_size, skip=skip)
+
+
+def _build_key(docs_path, mode, encoder, chunk_size):
+    """What a checkpoint must match to be resumed: vectors from another encoder must not be mixed in"""
+    return {"docs": os.path.abspath(docs_path), "vector_mode": mode, "model": EMBED_MODEL, "encoder": encoder,
+            "chunk_size": chunk_size}
+
+
+def _read_checkpoint(key):
+    if not os.path.exists(CHECKPOINT_FILE):
+        return 0
+    with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+        ckpt = json.load(f)
+    different = {name: ckpt.get(name) for name, value in key.items() if ckpt.get(name) != value}
+    if different:
+        print(f"Ignoring checkpoint of a different build (it has {different}); starting over")
+        return 0
+    return int(ckpt["done"])
+
+
+def _write_checkpoint(key, done):
+    tmp = CHECKPOINT_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({**key, "done": done}, f)
+    os.replace(tmp, CHECKPOINT_FILE)
+
+
+def _truncate_partials(done, dim):
+    """Drop anything written after the last checkpoint (e.g. a chunk interrupted mid-write)"""
+    mode = "r+b" if os.path.exists(PARTIAL_VECTORS) else "w+b"
+    with open(PARTIAL_VECTORS, mode) as f:
+        f.truncate(done * dim * 4)
+    kept = 0
+    with open(PARTIAL_META, "a+", encoding="utf-8") as f:
+        f.seek(0)
+        pos = 0
+        while kept < done:
+            line = f.readline()
+            if not line:
+                break
+            pos = f.tell()
+            kept += 1
+        f.truncate(pos)
+    if kept != done:
+        raise RuntimeError(f"{PARTIAL_META} has {kept} rows, checkpoint says {done}; rerun with --restart")
+
+
+def build_streaming(docs_path, embedder, mode="flat", chunk_size=CHUNK_SIZE, workers=STREAM_WORKERS, restart=False,
+                    meta_path=META_FILE, encoder=None):
+    """Embed docs chunk by chunk on a multi-process pool, adding each chunk to
+    the index as it arrives.
+
+    Vectors and metadata are appended to partial files and checkpointed after
+    every chunk, so an interrupted build resumes where it stopped (with the
+    same docs, vector mode, encoder and chunk size). Peak memory is one chunk
+    plus the index, plus one encoder copy per worker process.
+    """
+    key = _build_key(docs_path, mode, encoder, chunk_size)
+    done = 0 if restart else _read_checkpoint(key)
+    _truncate_partials(done, DIM)
+
+    index = quantize.new_index(DIM, mode)
+    if done:
+        print(f"Resuming after {done} documents")
+        vectors = np.memmap(PARTIAL_VECTORS, dtype=np.float32, mode="r", shape=(done, DIM))
+        for start in range(0, done, chunk_size):
+            quantize.add_vectors(index, np.ascontiguousarray(vectors[start:start + chunk_size]), mode)
+        del vectors
+
+    devices = ["cpu"] * workers if workers else None
+    pool = embedder.start_multi_process_pool(target_devices=devices)
+    try:
+        with open(PARTIAL_VECTORS, "ab") as vec_f, open(PARTIAL_META, "a", encoding="utf-8") as meta_f:
+            for chunk in iter_doc_chunks(docs_path, chunk_size, skip=done):
+                embs = embedder.encode([d["text"] for d in chunk], pool=pool,
+                                       convert_to_numpy=True).astype(np.float32)
+                assert embs.shape[1] == DIM
+                faiss.normalize_L2(embs)
+                quantize.add_vectors(index, embs, mode)
+
+                vec_f.write(embs.tobytes())
+                for d in chunk:
+                    meta_f.write(json.dumps(d, ensure_ascii=False) + "\n")
+                vec_f.flush()
+                meta_f.flush()
+                os.fsync(vec_f.fileno())
+                os.fsync(meta_f.fileno())
+                done += len(chunk)
+                _write_checkpoint(key, done)
+                print(f"Indexed {done} documents")
+    finally:
+        embedder.stop_multi_process_pool(pool)
+
+    if not done:
+        raise ValueError(f"No documents found in {docs_path}")
+
+    # finalize: convert the raw rows to a .npy and move the partials into place
+    raw = np.memmap(PARTIAL_VECTORS, dtype=np.float32, mode="r", shape=(done, DIM))
+    out = np.lib.format.open_memmap(quantize.VECTORS_FILE, mode="w+", dtype=np.float32, shape=(done, DIM))
+    for start in range(0, done, chunk_size):
+        out[start:start + chunk_size] = raw[start:start + chunk_size]
+    out.flush()
+    del raw, out
+    if corpus.is_parquet(meta_path):
+        corpus.convert(PARTIAL_META, meta_path)
+        os.remove(PARTIAL_META)
+    else:
+        os.replace(PARTIAL_META, meta_path)
+    _remove_other_formats(meta_path)
+    os.remove(PARTIAL_VECTORS)
+    os.remove(CHECKPOINT_FILE)
+    return index, done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the FAISS case index")
+    parser.add_argument("--docs", default=DOCS_JSONL, help="input docs, .jsonl or .parquet")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="index near-duplicate documents too (always the case with --stream)")
+    parser.add_argument("--vector-mode", choices=quantize.VECTOR_MODES, default="flat",
+                        help="int8/binary store compressed codes and rescore from memory-mapped float vectors")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream the docs in chunks through a multi-process encode pool, with checkpoints; "
+                             "does not collapse near-duplicates (create_cases_sections.py already does)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=STREAM_WORKERS,
+                        help="encode processes for --stream; each loads its own copy of the encoder")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing --stream checkpoint")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="partition the vectors into N shards, each searched by its own worker process "
+                             "(served when MOOT_SHARDS=on)")
+    parser.add_argument("--encoder", choices=encoders.BACKENDS, default="torch",
+                        help="passage encoder backend; onnx/onnx-int8 need `python encoders.py export`")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl",
+                        help="case meta file format; parquet (needs pyarrow) lets each stage read only its columns")
+    parser.add_argument("--no-digests", action="store_true",
+                        help="skip the holding/ratio/orders digests (python case_digests.py builds them later "
+                             "and republishes the served snapshot with them)")
+    parser.add_argument("--profile", action="store_true",
+                        help="write a CPU/torch/allocation profile of the build to profiles/ (MOOT_PROFILE=cpu,torch "
+                             "skips the allocation tracing, which slows large builds)")
+    parser.add_argument("--no-snapshot", action="store_true",
+                        help="leave the files in the working directory without publishing a new index snapshot")
+    args = parser.parse_args(argv)
+    if args.profile:
+        profiling.enable()
+    with profiling.profile_request("index_cases", vector_mode=args.vector_mode, stream=args.stream):
+        build_all(args)
+
+
+def build_all(args):
+    """Index, side indexes and snapshot for parsed main() arguments"""
+    embedder, encoder = encoders.load_checked(args.encoder, EMBED_MODEL)
+    meta_path = corpus.with_format(META_FILE, args.format)
+    if args.stream:
+        # streaming keeps one chunk in memory, so the corpus-wide dedup pass is
+        # left to create_cases_sections.py
+        if not args.no_dedup:
+            print("⚠️ --stream does not collapse near-duplicate documents; build the docs with "
+                  "create_cases_sections.py (which does) or pass --no-dedup to acknowledge")
+        index, count = build_streaming(args.docs, embedder, mode=args.vector_mode, chunk_size=args.chunk_size,
+                                       workers=args.workers, restart=args.restart, meta_path=meta_path,
+                                       encoder=encoder)
+    else:
+        docs = load_docs(args.docs, dedup=not args.no_dedup)
+        index, embs = build_index(docs, embedder, mode=args.vector_mode)
+        quantize.save_vectors(embs)
+        save_meta(full_records(args.docs, docs), meta_path)
+        count = len(docs)
+    path = quantize.write_index(index, args.vector_mode)
+    quantize.save_info(args.vector_mode, count, DIM)
+    if args.shards > 1:
+        shards.build(quantize.load_vectors(), args.vector_mode, args.shards)
+        print(f"Partitioned {count} vectors into {args.shards} shards ({shards.SHARD_DIR}/); "
+              f"serve them with MOOT_SHARDS=on")
+    elif os.path.isdir(shards.SHARD_DIR):
+        shutil.rmtree(shards.SHARD_DIR)  # stale shards of an earlier build
+    graph = citation_graph.build(meta_path)
+    print(f"Citation graph: {graph['edges']} links between {graph['nodes']} documents")
+    statutes = statute_index.build(meta_path)
+    print(f"Statute index: {statutes['sections']} sections cited")
+    sentences = argument_slots.build(meta_path, embedder)
+    print(f"Sentence store: {sentences['sentences']} quotable sentences")
+    if not args.no_digests:
+        digests = case_digests.build(meta_path, embedder=embedder)
+        print(f"Case digests: {digests['cases']} cases")
+    elif os.path.exists(case_digests.DIGEST_FILE):
+        os.remove(case_digests.DIGEST_FILE)  # digests of an earlier build; they would be published with this one
+    full = quantize.bytes_per_vector("flat", DIM)
+    packed = quantize.bytes_per_vector(args.vector_mode, DIM)
+    print(f"Index mode {args.vector_mode}: {packed} bytes/vector ({1 - packed / full:.0%} smaller than float32)")
+    print(f"Saved faiss index ({path}) and meta.")
+    if not args.no_snapshot:
+        info = {"documents": count, "vector_mode": args.vector_mode, "encoder": encoder, "shards": args.shards}
+        version = snapshots.publish(info=info)
+        print(f"Published index snapshot {version}; running apps switch to it without a restart.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+# instrumentation.py
+"""
+Lightweight latency instrumentation for the moot pipeline.
+
+    from instrumentation import span, observe
+
+    with span("retrieve.search", k=top_k) as s:
+        ...
+    s.ms                      # duration, once the block has exited
+    observe("generate.decode_tokens_per_s", 41.7)
+
+Every span/observation goes to the registered sinks:
+- an in-process HistogramSink (always on; read by the Streamlit sidebar)
+- a JsonLogSink, enabled with MOOT_TRACE_LOG=/path/to/trace.jsonl
+- a Prometheus-style text endpoint, enabled with MOOT_METRICS_PORT=9108
+"""
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+BUCKETS_TOKENS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+BUCKETS_RATE = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250, 500)
+BUCKETS_COUNT = (0, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+# histogram bounds per observation unit; other units use BUCKETS_COUNT
+BUCKETS = {"ms": BUCKETS_MS, "tokens": BUCKETS_TOKENS, "tok/s": BUCKETS_RATE, "count": BUCKETS_COUNT,
+           "jobs": BUCKETS_COUNT}
+RECENT = 1000  # observations kept per metric for percentiles
+
+_trace_id = contextvars.ContextVar("moot_trace_id", default=None)
+_parent = contextvars.ContextVar("moot_parent_span", default=None)
+
+
+class HistogramSink:
+    """Bucketed histograms plus a window of recent values per metric"""
+
+    def __init__(self, buckets=BUCKETS, recent=RECENT):
+        self.buckets = buckets
+        self.recent = recent
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        name, value = event["name"], event["value"]
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                unit = event.get("unit", "ms")
+                bounds = self.buckets.get(unit, BUCKETS_COUNT)
+                m = self._metrics[name] = {"count": 0, "sum": 0.0, "errors": 0, "unit": unit, "bounds": bounds,
+                                           "buckets": [0] * (len(bounds) + 1),
+                                           "recent": deque(maxlen=self.recent)}
+            m["count"] += 1
+            m["sum"] += value
+            m["errors"] += event.get("status") == "error"
+            m["buckets"][bisect.bisect_left(m["bounds"], value)] += 1
+            m["recent"].append(value)
+
+    def snapshot(self):
+        """{name: {count, mean, p50, p95, p99, errors, unit}}"""
+        out = {}
+        with self._lock:
+            for name, m in self._metrics.items():
+                recent = sorted(m["recent"])
+
+                def pct(p):
+                    return recent[min(len(recent) - 1, int(round(p / 100 * (len(recent) - 1))))] if recent else 0.0
+
+                out[name] = {"count": m["count"], "mean": m["sum"] / m["count"] if m["count"] else 0.0,
+                             "p50": pct(50), "p95": pct(95), "p99": pct(99),
+                             "errors": m["errors"], "unit": m["unit"]}
+        return out
+
+    def prometheus_text(self):
+        """Histograms in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, m in sorted(self._metrics.items()):
+                metric = "moot_" + name.replace(".", "_").replace("-", "_")
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(m["bounds"], m["buckets"]):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {m["count"]}')
+                lines.append(f"{metric}_sum {m['sum']}")
+                lines.append(f"{metric}_count {m['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+
+class JsonLogSink:
+    """Appends one JSON object per span/observation"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        line = json.dumps(event, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+histogram = HistogramSink()
+_sinks = [histogram]
+
+
+def add_sink(sink):
+    _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def _emit(event):
+    for sink in list(_sinks):
+        try:
+            sink.emit(event)
+        except Exception as e:
+            print(f"⚠️ Instrumentation sink {type(sink).__name__} failed: {e}")
+
+
+class Span:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.id = uuid.uuid4().hex[:16]
+        self.ms = None
+        self.status = "ok"
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a block. Nested spans share the trace id of the outermost one."""
+    s = Span(name, attrs)
+    trace_token = None
+    if _trace_id.get() is None:
+        trace_token = _trace_id.set(uuid.uuid4().hex[:16])
+    parent = _parent.get()
+    parent_token = _parent.set(s.id)
+    start = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.status, s.error = "error", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.ms = (time.perf_counter() - start) * 1000
+        _parent.reset(parent_token)
+        event = {"ts": time.time(), "trace": _trace_id.get(), "span": s.id, "parent": parent,
+                 "name": name, "value": s.ms, "unit": "ms", "status": s.status}
+        if s.error:
+            event["error"] = s.error
+        if s.attrs:
+            event["attrs"] = s.attrs
+        if trace_token is not None:
+            _trace_id.reset(trace_token)
+        _emit(event)
+
+
+def current_trace():
+    """Trace id of the enclosing span, or None outside any span"""
+    return _trace_id.get()
+
+
+def observe(name, value, unit="", **attrs):
+    """Record a non-duration measurement (token counts, tokens/sec, ...)"""
+    event = {"ts": time.time(), "trace": _trace_id.get(), "parent": _parent.get(),
+             "name": name, "value": float(value), "unit": unit, "status": "ok"}
+    if attrs:
+        event["attrs"] = attrs
+    _emit(event)
+
+
+def record_error(name, error):
+    """Count a failure that was handled (e.g. logged and swallowed) rather than raised"""
+    event = {"ts": time.time(), "trace": _trace_id.get(), "parent": _parent.get(),
+             "name": name, "value": 0.0, "unit": "ms", "status": "error", "error": str(error)}
+    _emit(event)
+
+
+_server = None
+
+
+def serve_prometheus(port, host="0.0.0.0"):
+    """Serve histogram.prometheus_text() at http://host:port/metrics on a daemon thread"""
+    global _server
+    if _server is not None:
+        return _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = histogram.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    _server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+    threading.Thread(target=_server.serve_forever, name="moot-metrics", daemon=True).start()
+    print(f"📈 Serving metrics on http://{host}:{port}/metrics")
+    return _server
+
+
+if os.environ.get("MOOT_TRACE_LOG"):
+    add_sink(JsonLogSink(os.environ["MOOT_TRACE_LOG"]))
+if os.environ.get("MOOT_METRICS_PORT"):
+    try:
+        serve_prometheus(os.environ["MOOT_METRICS_PORT"])
+    except OSError as e:
+        print(f"⚠️ Could not serve metrics on port {os.environ['MOOT_METRICS_PORT']}: {e}")
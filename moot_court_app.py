@@ -5,10 +5,23 @@ Built with Streamlit
 """
 import streamlit as st
 import json
+import sys
 import time
+import uuid
 from pathlib import Path
+import retriever
+import profiling
+from instrumentation import histogram, span
 from case_arguer import argue_case
-from retriever import retrieve
+from moot_jobs import JobRunner, AdmissionError
+from result_store import ResultStore
+from retrieval_plan import RetrievalPlan, PLAN_TOP_K, PLAN_MAX_PER_CASE
+from retriever import run_retrieval
+
+POLL_INTERVAL_S = 1.0  # how often a page with a pending hearing reruns to check on it
+
+if "--profile" in sys.argv[1:]:  # streamlit run moot_court_app.py -- --profile
+    profiling.enable()
 
 # Page configuration
 st.set_page_config(
@@ -68,6 +81,133 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+class NotCached(Exception):
+    """Raised inside a cached function to hand back its result (the argument) without caching it"""
+
+def uncached(cached_fn, *args):
+    """cached_fn(*args), or the result it declined to cache"""
+    try:
+        return cached_fn(*args)
+    except NotCached as e:
+        return e.args[0]
+
+@st.cache_resource(show_spinner="Loading search index...")
+def _load_search_index():
+    info = retriever.load()
+    if not info["loaded"]:
+        raise NotCached(info)  # a failed load is retried on the next rerun
+    return info
+
+def get_search_index():
+    """Index, embedder and metadata, loaded once per process; retried on the next rerun until it loads"""
+    return uncached(_load_search_index)
+
+@st.cache_resource
+def get_result_store():
+    """SQLite store of finished hearings"""
+    return ResultStore()
+
+@st.cache_resource
+def get_job_runner():
+    """Background workers shared by every session"""
+    return JobRunner()
+
+def index_status():
+    """Live description of the served index (picks up newly published snapshots)"""
+    get_search_index()
+    return retriever.load()
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _cached_retrieve(query, top_k, max_per_case, expand_hops, index_version):
+    get_search_index()
+    docs, timings, bundle = run_retrieval(query, top_k=top_k, diversify=True, max_per_case=max_per_case,
+                                          expand_hops=expand_hops)
+    # a failed query (bundle None), no hits, or a partial answer (a shard left out, the reranker
+    # skipped) may be transient: return it without caching it for every session
+    if bundle is None or not docs or timings.get("missing_shards") or timings.get("rerank_fallback"):
+        raise NotCached(docs)
+    return docs
+
+def cached_retrieve(query, top_k, max_per_case=1, expand_hops=0):
+    """Retrieval results reused across reruns and sessions, until the index snapshot changes"""
+    if not get_search_index()["loaded"]:
+        return []  # not cached: results appear as soon as the index loads
+    return uncached(_cached_retrieve, query, top_k, max_per_case, expand_hops, retriever.index_version())
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _cached_section_lookup(reference, index_version):
+    get_search_index()
+    results = retriever.lookup_section(reference)
+    if not results:
+        raise NotCached(results)
+    return results
+
+def cached_section_lookup(reference):
+    """Passages citing a statute section, reused across reruns and sessions"""
+    if not get_search_index()["loaded"]:
+        return []
+    return uncached(_cached_section_lookup, reference, retriever.index_version())
+
+HEARING_PARAMS = {"generator": "case_arguer", "top_k": PLAN_TOP_K, "max_per_case": PLAN_MAX_PER_CASE}
+
+def run_hearing(facts, issues, store):
+    """Retrieve precedents once and generate arguments from them (runs on a job thread, no st.* calls)
+
+    Identical hearings (same facts, issues, model, index and params) come
+    straight from the result store. With profiling on, the hearing carries
+    the path of its profile artifact.
+    """
+    with profiling.profile_request("moot.hearing", generator="case_arguer") as profile:
+        hearing = _run_hearing(facts, issues, store)
+    if profile is not None:
+        hearing["profile"] = profile["path"]
+    return hearing
+
+def _run_hearing(facts, issues, store):
+    stored, key = store.lookup(facts, issues, HEARING_PARAMS)
+    if stored is not None:
+        stored["cached"] = True
+        return stored
+    
+    with span("moot.hearing", generator="case_arguer"):
+        plan = RetrievalPlan.build(facts, issues)
+        precedents = plan.precedents()
+        try:
+            arguments = argue_case(facts, issues, plan=plan)
+            error = None
+        except Exception as e:
+            error = str(e)
+            # Provide fallback arguments
+            arguments = {
+                "claimant": "Error generating claimant arguments. Please try again.",
+                "respondent": "Error generating respondent arguments. Please try again.",
+                "judge": "Error generating judge decision. Please try again."
+            }
+    hearing = {"facts": facts, "issues": issues, "arguments": arguments, "precedents": precedents, "error": error}
+    if error is None:
+        store.put(key, facts, issues, hearing, HEARING_PARAMS)
+    return hearing
+
+def run_grounded_hearing(facts, issues, store):
+    """Cheaper tier used under overload: model-free arguments assembled from the retrieved sentences"""
+    from argument_slots import assemble_arguments
+
+    stored, _ = store.lookup(facts, issues, HEARING_PARAMS)
+    if stored is not None:
+        stored["cached"] = True
+        return stored
+    with span("moot.hearing", generator="grounded"):
+        plan = RetrievalPlan.build(facts, issues)
+        arguments = assemble_arguments(facts, issues, plan=plan)
+    return {"facts": facts, "issues": issues, "arguments": arguments, "precedents": plan.precedents(),
+            "error": None}
+
+def session_user():
+    """Per-browser-session id used for the per-user job limit"""
+    if "user_id" not in st.session_state:
+        st.session_state["user_id"] = uuid.uuid4().hex
+    return st.session_state["user_id"]
+
 def load_example_cases():
     """Load example cases for quick selection"""
     return [
@@ -96,7 +236,7 @@ def load_example_cases():
 def display_precedents(query, top_k=3):
     """Display relevant legal precedents"""
     try:
-        precedents = retrieve(query, top_k=top_k)
+        precedents = cached_retrieve(query, top_k)
         
         if precedents:
             st.markdown("### 🔍 Relevant Legal Precedents Found")
@@ -128,20 +268,31 @@ def main():
         st.markdown("## 🎯 Navigation")
         page = st.selectbox(
             "Choose a page:",
-            ["🏠 Home", "⚖️ Argue Case", "📚 Browse Precedents", "ℹ️ About"]
+            ["🏠 Home", "⚖️ Argue Case", "📚 Browse Precedents", "🗂️ Saved Hearings", "ℹ️ About"]
         )
         
         st.markdown("---")
         st.markdown("## 📊 System Status")
-        st.success("✅ AI Model Loaded")
-        st.success("✅ Legal Database Ready")
-        st.success("✅ Search Index Active")
+        index = index_status()
+        if index["loaded"]:
+            st.success(f"✅ Search index: {index['documents']} passages "
+                       f"({index['vector_mode']}, {index['encoder']} encoder)")
+            if index["version"]:
+                st.caption(f"Index snapshot {index['version']}")
+        else:
+            st.error("❌ Search index not loaded - run index_cases.py")
+        jobs = get_job_runner().stats()
+        st.caption(f"🧑‍⚖️ Hearings: {jobs['running']} running ({jobs['shed']} on the grounded tier), "
+                   f"{jobs['queued']} queued; evaluation: {jobs['batch']['running']} running, "
+                   f"{jobs['batch']['queued']} queued")
+        if profiling.enabled():
+            st.caption(f"🔬 Profiling on: one artifact per hearing in {profiling.PROFILE_DIR}/")
+        show_latency_metrics()
         
         st.markdown("---")
         st.markdown("## 🏆 Quick Stats")
-        st.metric("Legal Cases", "6")
+        st.metric("Indexed passages", index["documents"])
         st.metric("AI Agents", "3")
-        st.metric("Search Index", "Active")
     
     # Main content based on page selection
     if page == "🏠 Home":
@@ -150,9 +301,42 @@ def main():
         show_argue_case_page()
     elif page == "📚 Browse Precedents":
         show_browse_precedents_page()
+    elif page == "🗂️ Saved Hearings":
+        show_saved_hearings_page()
     elif page == "ℹ️ About":
         show_about_page()
 
+# spans shown in the sidebar, in pipeline order
+SIDEBAR_METRICS = [
+    ("jobs.queue_wait", "Queue wait"),
+    ("moot.hearing", "Hearing"),
+    ("retrieve", "Retrieve"),
+    ("retrieve.embed", "· Embed query"),
+    ("retrieve.search", "· FAISS search"),
+    ("retrieve.metadata", "· Metadata"),
+    ("agents.make_context", "Build context"),
+    ("generate.prefill", "Prefill"),
+    ("generate.decode", "Decode"),
+    ("generate.decode_tokens_per_s", "Decode tok/s"),
+]
+
+def show_latency_metrics():
+    """Recent pipeline latencies from the in-process histogram"""
+    snapshot = histogram.snapshot()
+    rows = []
+    for name, label in SIDEBAR_METRICS:
+        m = snapshot.get(name)
+        if m:
+            unit = "" if m["unit"] == "ms" else f" {m['unit']}"
+            rows.append(f"| {label} | {m['p50']:.0f}{unit} | {m['p95']:.0f}{unit} | {m['count']} |")
+    if not rows:
+        st.caption("⏱️ No requests timed yet")
+        return
+    st.markdown("**⏱️ Latency (ms)**\n\n| Stage | p50 | p95 | n |\n|---|---|---|---|\n" + "\n".join(rows))
+    errors = sum(m["errors"] for m in snapshot.values())
+    if errors:
+        st.warning(f"⚠️ {errors} pipeline errors recorded")
+
 def show_home_page():
     """Display the home page"""
     st.markdown("## 🎯 Welcome to Moot Court AI")
@@ -234,52 +418,51 @@ def show_argue_case_page():
             st.error("Please enter case facts before generating arguments.")
             return
         
-        # Show progress
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
+        runner = get_job_runner()
+        key = runner.request_key(facts, issues)
         try:
-            # Step 1: Search precedents
-            status_text.text("🔍 Searching for relevant legal precedents...")
-            progress_bar.progress(25)
-            
-            query = f"{facts} {issues}" if issues.strip() else facts
-            try:
-                precedents = retrieve(query, top_k=3)
-            except Exception as e:
-                st.warning(f"Could not search precedents: {e}")
-                precedents = []
-            
-            # Step 2: Generate arguments
-            status_text.text("🎭 Generating AI legal arguments...")
-            progress_bar.progress(50)
-            
-            try:
-                arguments = argue_case(facts, issues)
-            except Exception as e:
-                st.error(f"Error generating arguments: {str(e)}")
-                # Provide fallback arguments
-                arguments = {
-                    "claimant": "Error generating claimant arguments. Please try again.",
-                    "respondent": "Error generating respondent arguments. Please try again.",
-                    "judge": "Error generating judge decision. Please try again."
-                }
-            
-            # Step 3: Display results
-            status_text.text("📊 Preparing results...")
-            progress_bar.progress(100)
-            
-            # Clear progress indicators
-            progress_bar.empty()
-            status_text.empty()
-            
-            # Display results
-            display_case_results(facts, issues, arguments, precedents)
-            
-        except Exception as e:
-            st.error(f"Unexpected error: {str(e)}")
-            progress_bar.empty()
-            status_text.empty()
+            st.session_state["moot_job"] = runner.submit(key, run_hearing, facts, issues, get_result_store(),
+                                                         user=session_user(), priority="interactive",
+                                                         fallback=run_grounded_hearing)
+        except AdmissionError as e:
+            st.warning(f"⏳ {e}")
+    
+    show_hearing_job()
+
+def show_hearing_job():
+    """Show the session's hearing job, polling while it is still being generated"""
+    job_id = st.session_state.get("moot_job")
+    if not job_id:
+        return
+    job = get_job_runner().get(job_id)
+    if job is None:
+        del st.session_state["moot_job"]
+        return
+    
+    if job.status in ("queued", "running"):
+        position = get_job_runner().position(job_id) if job.status == "queued" else None
+        if position is not None:
+            ahead, wait_s = position
+            st.info(f"⏳ Position {ahead + 1} in the queue, about {wait_s:.0f}s until your hearing starts "
+                    f"(waiting {job.elapsed:.0f}s)")
+        else:
+            st.info(f"🔍 Searching precedents and generating arguments... ({job.elapsed:.0f}s)")
+        time.sleep(POLL_INTERVAL_S)
+        st.rerun()
+    elif job.status == "failed":
+        st.error(f"Unexpected error: {job.error()}")
+    elif job.status == "done":
+        hearing = job.result()
+        if hearing["error"]:
+            st.error(f"Error generating arguments: {hearing['error']}")
+        if hearing.get("cached"):
+            st.caption("⚡ Loaded from saved hearings (same facts, issues, model and index)")
+        if hearing.get("profile"):
+            st.caption(f"🔬 Profile saved to {hearing['profile']} (python profiling.py <file> to summarize)")
+        if job.tier == "shed" and not hearing.get("cached"):
+            st.caption("⚡ High demand: these arguments were assembled directly from the precedents' own "
+                       "sentences instead of being generated")
+        display_case_results(hearing["facts"], hearing["issues"], hearing["arguments"], hearing["precedents"])
 
 def display_case_results(facts, issues, arguments, precedents):
     """Display the generated case results"""
@@ -335,10 +518,25 @@ def show_browse_precedents_page():
     
     # Search functionality
     search_query = st.text_input("🔍 Search Legal Precedents:", placeholder="Enter keywords to search...")
+    follow_citations = st.checkbox("🔗 Include cases linked by citation", value=False)
+    section_query = st.text_input("📜 Cases citing a statute section:",
+                                  placeholder="e.g. Section 44(4) of the Employment Act")
+    
+    if section_query:
+        citing = cached_section_lookup(section_query)
+        if citing:
+            st.markdown(f"### {len(citing)} cases cite {section_query}:")
+            for i, precedent in enumerate(citing, 1):
+                with st.expander(f"{i}. {precedent.get('source', 'Unknown')}"):
+                    st.markdown(f"**Source:** {precedent.get('source', 'Unknown')}")
+                    st.markdown("**Content:**")
+                    st.write(precedent.get('text', ''))
+        else:
+            st.warning(f"No indexed cases cite {section_query}.")
     
     if search_query:
         try:
-            precedents = retrieve(search_query, top_k=6)
+            precedents = cached_retrieve(search_query, 6, max_per_case=2, expand_hops=1 if follow_citations else 0)
             
             if precedents:
                 st.markdown(f"### Found {len(precedents)} relevant precedents:")
@@ -347,6 +545,9 @@ def show_browse_precedents_page():
                     with st.expander(f"{i}. {precedent.get('source', 'Unknown')} (Score: {precedent['score']:.3f})"):
                         st.markdown(f"**Relevance Score:** {precedent['score']:.3f}")
                         st.markdown(f"**Source:** {precedent.get('source', 'Unknown')}")
+                        if precedent.get("via") == "citation":
+                            st.markdown(f"**Linked by citation to:** {precedent['cited_with']} "
+                                        f"(authority {precedent['authority']:.2f})")
                         st.markdown("**Content:**")
                         st.write(precedent.get('text', ''))
             else:
@@ -354,7 +555,7 @@ def show_browse_precedents_page():
                 
         except Exception as e:
             st.error(f"Error searching precedents: {str(e)}")
-    else:
+    elif not section_query:
         # Show all available precedents
         st.info("Enter a search term above to find relevant legal precedents.")
         
@@ -372,6 +573,39 @@ def show_browse_precedents_page():
         for case in case_sources:
             st.markdown(f"- 📄 {case}")
 
+def show_saved_hearings_page():
+    """Browse and export stored hearings"""
+    st.markdown("## 🗂️ Saved Hearings")
+    store = get_result_store()
+    
+    search = st.text_input("🔍 Filter by facts or issues:", placeholder="Enter keywords...")
+    hearings = store.list(limit=100, search=search or None)
+    
+    st.download_button(
+        "⬇️ Export all hearings (JSONL)",
+        data=store.export_jsonl(),
+        file_name="moot_hearings.jsonl",
+        mime="application/json",
+    )
+    
+    if not hearings:
+        st.info("No saved hearings yet. Hearings are saved automatically after 'Generate Legal Arguments'.")
+        return
+    
+    st.markdown(f"### {len(hearings)} of {store.count()} hearings")
+    for h in hearings:
+        created = time.strftime("%Y-%m-%d %H:%M", time.localtime(h["created"]))
+        with st.expander(f"{created} — {h['facts'][:90]}..."):
+            st.markdown(f"**Facts:** {h['facts']}")
+            if h["issues"]:
+                st.markdown(f"**Issues:** {h['issues']}")
+            st.caption(f"Model {h['model_version']} · Index {h['index_version']} · Reused {h['hits']} times")
+            if st.button("Open", key=f"open_{h['key']}"):
+                hearing = store.get(h["key"])
+                display_case_results(hearing["facts"], hearing["issues"], hearing["arguments"], hearing["precedents"])
+            st.download_button("⬇️ Export", data=store.export_jsonl([h["key"]]),
+                               file_name=f"hearing_{h['key'][:12]}.jsonl", key=f"export_{h['key']}")
+
 def show_about_page():
     """Display the about page"""
     st.markdown("## ℹ️ About Moot Court AI")
@@ -0,0 +1,234 @@
+# moot_jobs.py
+"""
+Background execution of moot hearings for the Streamlit app.
+
+The runner lives in a process-wide cache (st.cache_resource), so reruns and
+concurrent sessions share it: a page submits a job, stores the job id in its
+session state and polls until the job is done. Identical submissions that
+are still queued or running are attached to the same job instead of being
+computed twice.
+
+Admission control sits in front of the workers:
+- the work queue is bounded (MAX_QUEUED) and each user may have at most
+  MAX_PER_USER hearings queued or running;
+- interactive jobs are dequeued before batch (evaluation) jobs; batch jobs
+  never occupy the INTERACTIVE_WORKERS workers or the INTERACTIVE_SLOTS
+  queue slots reserved for interactive users;
+- when an interactive job would wait longer than SHED_WAIT_S (or the queue
+  is full), it is served by its cheaper fallback (the model-free grounded
+  tier) on a separate pool of SHED_WORKERS threads, which admits at most
+  MAX_SHED jobs at once, instead of joining the queue.
+A request that cannot be admitted raises AdmissionError.
+
+batch_moot.py submits its cases with priority="batch", to its own runner or
+to one shared with the app (run_batch(..., runner=...)).
+"""
+import hashlib
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+MAX_WORKERS = 2          # hearings generated in parallel
+KEEP_FINISHED_S = 600    # how long finished jobs stay pollable
+MAX_QUEUED = 16          # jobs waiting for a worker
+MAX_PER_USER = 1         # a user's jobs queued or running at once
+INTERACTIVE_WORKERS = 1  # workers batch jobs may never occupy
+INTERACTIVE_SLOTS = 4    # queue slots batch jobs may never fill
+SHED_WAIT_S = 45.0       # estimated wait above which interactive jobs go to their fallback
+SHED_WORKERS = 2         # pool for fallback (shed) jobs
+MAX_SHED = 8             # fallback jobs queued or running at once
+DEFAULT_SERVICE_S = 20.0 # service-time estimate until jobs have finished
+SERVICE_SMOOTHING = 0.2  # weight of the newest job in the service-time moving average
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+
+class AdmissionError(Exception):
+    """A job was refused: the queue is full or the user has too many jobs in flight"""
+
+
+class MootJob:
+    def __init__(self, key, future, user=None, priority="interactive", tier="full"):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.future = future
+        self.user = user
+        self.priority = priority
+        self.tier = tier         # "full", or "shed" when served by the fallback
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def status(self):
+        if self.future.cancelled():
+            return "cancelled"
+        if not self.future.done():
+            return "running" if self.future.running() else "queued"
+        return "failed" if self.future.exception() else "done"
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.submitted
+
+    def result(self):
+        return self.future.result()
+
+    def error(self):
+        return self.future.exception() if self.future.done() else None
+
+
+class JobRunner:
+    def __init__(self, max_workers=MAX_WORKERS, max_queued=MAX_QUEUED, max_per_user=MAX_PER_USER,
+                 interactive_workers=INTERACTIVE_WORKERS, interactive_slots=INTERACTIVE_SLOTS,
+                 shed_wait_s=SHED_WAIT_S, max_shed=MAX_SHED):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self.batch_workers = max(max_workers - interactive_workers, 0)
+        self.batch_queued = max(max_queued - interactive_slots, 0)
+        self.shed_wait_s = shed_wait_s
+        self.max_shed = max_shed
+        self._jobs = {}
+        self._active = {}      # request key -> job id, while queued or running
+        self._queue = []       # heap of (priority rank, sequence, job id, fn, args, kwargs)
+        self._sequence = itertools.count()
+        self._running = {name: 0 for name in PRIORITIES}
+        self._shed_in_flight = 0
+        self._service_s = DEFAULT_SERVICE_S
+        self._lock = threading.Lock()
+        self._work_ready = threading.Condition(self._lock)
+        self._shed = ThreadPoolExecutor(max_workers=SHED_WORKERS, thread_name_prefix="moot-shed")
+        for i in range(max_workers):
+            threading.Thread(target=self._work, name=f"moot-{i}", daemon=True).start()
+
+    @staticmethod
+    def request_key(*parts):
+        return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+    def submit(self, key, fn, *args, user=None, priority="interactive", fallback=None, **kwargs):
+        """Queue fn(*args, **kwargs); returns the job id (shared with an
+        identical job that is already queued or running)
+
+        fallback: cheaper callable with the same arguments, run instead of
+        fn when an interactive job would wait too long. Raises
+        AdmissionError when the job can be neither queued nor shed.
+        """
+        from instrumentation import observe
+
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown priority {priority!r}; expected one of {list(PRIORITIES)}")
+        with self._lock:
+            self._expire()
+            active_id = self._active.get(key)
+            if active_id and not self._jobs[active_id].future.done():
+                return active_id
+            if user is not None and self._in_flight(user) >= self.max_per_user:
+                raise AdmissionError("You already have a hearing in progress; wait for it to finish.")
+
+            interactive = priority == "interactive"
+            full = len(self._queue) >= (self.max_queued if interactive else self.batch_queued)
+            wait_s = self._wait_estimate(self._ahead_of(PRIORITIES[priority], None))
+            can_shed = interactive and fallback is not None and self._shed_in_flight < self.max_shed
+            if can_shed and (full or wait_s > self.shed_wait_s):
+                self._shed_in_flight += 1
+                job = MootJob(key, self._shed.submit(fallback, *args, **kwargs), user, priority, tier="shed")
+                observe("jobs.shed", 1, "count", reason="queue_full" if full else "wait", wait_s=wait_s)
+            elif full:
+                raise AdmissionError("The court is at capacity; please try again in a minute.")
+            else:
+                job = MootJob(key, Future(), user, priority)
+                heapq.heappush(self._queue, (PRIORITIES[priority], next(self._sequence), job.id, fn, args, kwargs))
+                self._work_ready.notify()
+            self._jobs[job.id] = job
+            self._active[key] = job.id
+            observe("jobs.queue_depth", len(self._queue), "jobs", priority=priority)
+        job.future.add_done_callback(lambda _f, job=job: self._finish(job))
+        return job.id
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job_id):
+        """(jobs ahead in the queue, estimated seconds until it starts) for a queued job, else None"""
+        with self._lock:
+            for rank, sequence, queued_id, *_ in self._queue:
+                if queued_id == job_id:
+                    ahead = self._ahead_of(rank, sequence)
+                    return ahead, self._wait_estimate(ahead)
+        return None
+
+    def stats(self):
+        """Jobs queued and running (running includes the shed jobs served by their fallback);
+        batch: the batch jobs among them
+        """
+        with self._lock:
+            batch_queued = sum(1 for e in self._queue if e[0] == PRIORITIES["batch"])
+            return {"queued": len(self._queue), "running": sum(self._running.values()) + self._shed_in_flight,
+                    "shed": self._shed_in_flight, "batch": {"queued": batch_queued, "running": self._running["batch"]},
+                    "service_s": self._service_s}
+
+    def _in_flight(self, user):
+        return sum(1 for job in self._jobs.values() if job.user == user and not job.future.done())
+
+    def _ahead_of(self, rank, sequence):
+        """Queued jobs that will be dequeued before a job of this rank/sequence (None: a new job)"""
+        return sum(1 for r, s, *_ in self._queue if r < rank or (r == rank and (sequence is None or s < sequence)))
+
+    def _wait_estimate(self, ahead):
+        free = self.max_workers - sum(self._running.values())
+        if ahead < free:
+            return 0.0
+        return ((ahead - free) // self.max_workers + 1) * self._service_s
+
+    def _next(self):
+        """Pop the next job a worker may run, or None"""
+        if not self._queue:
+            return None
+        # interactive jobs sort first: a batch job on top means none are waiting
+        if self._queue[0][0] == PRIORITIES["batch"] and self._running["batch"] >= self.batch_workers:
+            return None
+        return heapq.heappop(self._queue)
+
+    def _work(self):
+        from instrumentation import observe
+
+        while True:
+            with self._work_ready:
+                entry = self._next()
+                while entry is None:
+                    self._work_ready.wait()
+                    entry = self._next()
+                _, _, job_id, fn, args, kwargs = entry
+                job = self._jobs[job_id]
+                self._running[job.priority] += 1
+            if job.future.set_running_or_notify_cancel():
+                job.started = time.time()
+                observe("jobs.queue_wait", (job.started - job.submitted) * 1000, "ms", priority=job.priority)
+                try:
+                    job.future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    job.future.set_exception(e)
+            with self._work_ready:
+                self._running[job.priority] -= 1
+                if job.started:
+                    took = time.time() - job.started
+                    self._service_s += SERVICE_SMOOTHING * (took - self._service_s)
+                self._work_ready.notify_all()
+
+    def _finish(self, job):
+        with self._lock:
+            job.finished = time.time()
+            if job.tier == "shed":
+                self._shed_in_flight -= 1
+            if self._active.get(job.key) == job.id:
+                del self._active[job.key]
+
+    def _expire(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished > KEEP_FINISHED_S:
+                del self._jobs[job_id]
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Opt-in per-request profiling for the moot pipeline.
+
+Enable with MOOT_PROFILE=1 (or a comma list of profilers: cpu,torch,alloc),
+`--profile` on agents.py / index_cases.py, or for the web app:
+
+    MOOT_PROFILE=1 streamlit run moot_court_app.py
+    streamlit run moot_court_app.py -- --profile
+
+While enabled, every profile_request() block (a hearing, an index build)
+writes one self-contained zip to profiles/ (MOOT_PROFILE_DIR):
+
+    summary.json          wall time, hottest functions, top allocation sites
+    cpu.folded            sampled stacks of the request's thread, folded format
+                          (speedscope.app, flamegraph.pl, inferno)
+    torch_trace.json      torch.profiler trace (chrome://tracing, ui.perfetto.dev)
+    tracemalloc.snapshot  allocation snapshot (tracemalloc.Snapshot.load)
+    tracemalloc_top.txt   allocation growth over the request, by line
+    spans.jsonl           the instrumentation spans of the request
+
+The CPU profile samples Python stacks every SAMPLE_INTERVAL_MS from a
+background thread, so time inside faiss, tokenizers or torch kernels is
+charged to the Python line that called them; torch_trace.json breaks down
+the torch part. Work in other processes (encode pools, shard workers) is
+not captured.
+
+    python profiling.py profiles/20260301-101500-moot.hearing-ab12cd.zip   # print the summary
+"""
+import contextvars
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+import zipfile
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_DIR = os.environ.get("MOOT_PROFILE_DIR", "profiles")
+PROFILERS = ("cpu", "torch", "alloc")
+SAMPLE_INTERVAL_MS = float(os.environ.get("MOOT_PROFILE_INTERVAL_MS", "5"))
+TRACEMALLOC_FRAMES = 25
+TOP_N = 25
+
+_enabled = None           # set by enable(); None: follow MOOT_PROFILE
+_active = contextvars.ContextVar("moot_profile_active", default=False)
+_tracemalloc_users = 0
+_tracemalloc_lock = threading.Lock()
+_torch_lock = threading.Lock()  # torch.profiler is process-wide: one request at a time
+
+
+def _parse(value):
+    value = (value or "").strip().lower()
+    if value in ("", "0", "off", "false", "no"):
+        return ()
+    if value in ("1", "on", "true", "yes", "all"):
+        return PROFILERS
+    return tuple(p for p in PROFILERS if p in {v.strip() for v in value.split(",")})
+
+
+def enable(profilers=PROFILERS, directory=None):
+    """Turn profiling on for this process (e.g. from a --profile flag)"""
+    global _enabled, PROFILE_DIR
+    _enabled = tuple(profilers)
+    if directory:
+        PROFILE_DIR = directory
+
+
+def active_profilers():
+    return _enabled if _enabled is not None else _parse(os.environ.get("MOOT_PROFILE"))
+
+
+def enabled():
+    return bool(active_profilers())
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer; counts identical stacks"""
+
+    def __init__(self, thread_id, interval_ms=SAMPLE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="moot-profiler", daemon=True)
+
+    @staticmethod
+    def _label(code):
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        """Brendan Gregg's collapsed-stack format: "outer;inner count" per line"""
+        return "".join(f"{';'.join(stack)} {n}\n" for stack, n in self.stacks.most_common())
+
+    def top(self, n=TOP_N):
+        """Hottest functions: share of samples on top of the stack (self) and anywhere on it (total)"""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                total[label] += count
+        samples = max(self.samples, 1)
+        return [{"function": label, "self": own[label] / samples, "total": total[label] / samples}
+                for label, _ in total.most_common(n)]
+
+
+class _SpanCapture:
+    """Instrumentation sink keeping the events of one trace"""
+
+    def __init__(self):
+        self.trace = None
+        self.events = []
+
+    def emit(self, event):
+        if self.trace is not None and event.get("trace") == self.trace:
+            self.events.append(event)
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            tracemalloc.reset_peak()
+        _tracemalloc_users += 1
+    return tracemalloc.take_snapshot()
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+def _torch_profiler():
+    """A started torch.profiler.profile, or None when torch is not in use or another request holds it"""
+    if "torch" not in sys.modules or not _torch_lock.acquire(blocking=False):
+        return None
+    try:
+        import torch
+        from torch.profiler import profile, ProfilerActivity
+
+        activities = [ProfilerActivity.CPU] + ([ProfilerActivity.CUDA] if torch.cuda.is_available() else [])
+        prof = profile(activities=activities, record_shapes=True, profile_memory=True)
+        prof.__enter__()
+        return prof
+    except Exception as e:
+        _torch_lock.release()
+        print(f"⚠️ torch.profiler unavailable: {e}")
+        return None
+
+
+@contextmanager
+def profile_request(name, **attrs):
+    """Profile the block if profiling is enabled; yields {"path": artifact} (filled on exit), or None.
+
+    Nested calls (a hearing inside a profiled batch) are not profiled again.
+    """
+    profilers = active_profilers()
+    if not profilers or _active.get():
+        yield None
+        return
+    from instrumentation import add_sink, remove_sink, span, current_trace
+
+    token = _active.set(True)
+    result = {"path": None}
+    capture = add_sink(_SpanCapture())
+    sampler = StackSampler(threading.get_ident()).start() if "cpu" in profilers else None
+    before = _start_tracemalloc() if "alloc" in profilers else None
+    torch_prof = _torch_profiler() if "torch" in profilers else None
+    summary = {"name": name, "attrs": attrs, "status": "ok", "started": time.time(),
+               "profilers": list(profilers), "python": sys.version.split()[0]}
+    t0 = time.perf_counter()
+    try:
+        with span("profile", request=name):
+            capture.trace = current_trace()
+            yield result
+    except BaseException:
+        summary["status"] = "error"
+        raise
+    finally:
+        summary["wall_ms"] = (time.perf_counter() - t0) * 1000
+        _active.reset(token)
+        remove_sink(capture)
+        files = {}
+        if sampler is not None:
+            sampler.stop()
+        try:
+            if sampler is not None:
+                files["cpu.folded"] = sampler.folded()
+                summary.update(cpu_samples=sampler.samples, sample_interval_ms=sampler.interval * 1000,
+                               hottest=sampler.top())
+            if torch_prof is not None:
+                _collect_torch(torch_prof, files, summary)
+            if before is not None:
+                _collect_allocations(before, files, summary)
+            files["spans.jsonl"] = "".join(json.dumps(e, default=str) + "\n" for e in capture.events)
+            files["summary.json"] = json.dumps(summary, indent=2, default=str)
+            result["path"] = _write_artifact(name, files)
+            print(f"🔬 Profile of {name} ({summary['wall_ms']:.0f} ms) written to {result['path']}")
+        except Exception as e:
+            print(f"⚠️ Could not write the profile of {name}: {e}")
+        finally:
+            if before is not None and tracemalloc.is_tracing():
+                _stop_tracemalloc()
+
+
+def _collect_torch(prof, files, summary):
+    try:
+        prof.__exit__(None, None, None)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.json")
+            prof.export_chrome_trace(path)
+            with open(path, "r", encoding="utf-8") as f:
+                files["torch_trace.json"] = f.read()
+        summary["torch_ops"] = prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=TOP_N)
+    except Exception as e:
+        summary["torch_error"] = str(e)
+    finally:
+        _torch_lock.release()
+
+
+def _collect_allocations(before, files, summary):
+    after = tracemalloc.take_snapshot()
+    summary["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6  # shared by concurrent requests
+    growth = after.compare_to(before, "lineno")[:TOP_N]
+    files["tracemalloc_top.txt"] = "\n".join(str(stat) for stat in growth) + "\n"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snapshot")
+        after.dump(path)
+        with open(path, "rb") as f:
+            files["tracemalloc.snapshot"] = f.read()
+    summary["allocations"] = [{"site": str(s.traceback), "size_diff": s.size_diff, "count_diff": s.count_diff}
+                              for s in growth]
+
+
+def _write_artifact(name, files):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:6]}"
+    path = os.path.join(PROFILE_DIR, f"{stem}.zip")
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        for filename, data in files.items():
+            z.writestr(f"{stem}/{filename}", data)
+    return path
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize a profile artifact")
+    parser.add_argument("artifact", help="a .zip written by profile_request")
+    args = parser.parse_args(argv)
+
+    with zipfile.ZipFile(args.artifact) as z:
+        names = z.namelist()
+        summary = json.loads(z.read(next(n for n in names if n.endswith("summary.json"))))
+    print(f"🔬 {summary['name']} {summary['attrs']}: {summary['wall_ms']:.0f} ms ({summary['status']})")
+    print(f"   contains: {', '.join(os.path.basename(n) for n in names)}")
+    if summary.get("hottest"):
+        print(f"\nHottest functions ({summary['cpu_samples']} samples every {summary['sample_interval_ms']:.0f} ms):")
+        for row in summary["hottest"][:15]:
+            print(f"   {row['total']:6.1%} total  {row['self']:6.1%} self  {row['function']}")
+    if summary.get("allocations"):
+        print("\nLargest allocation growth:")
+        for row in summary["allocations"][:10]:
+            print(f"   {row['size_diff'] / 1e6:+8.2f} MB  {row['site']}")
+    if summary.get("torch_ops"):
+        print("\n" + summary["torch_ops"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Tokenizer loading and token-id prompt assembly.
+
+The agents' prompts are mostly constant: a role template, section headers
+("\\n\\nContext:\\n", ...) and the same precedent context for all three turns
+of a hearing. PromptEncoder keeps the token ids of those pieces and builds a
+prompt by concatenating id lists, encoding only the text it has not seen.
+
+Concatenating ids equals encoding the whole prompt only where the GPT-2
+pre-tokenizer would split anyway. A boundary is spliced only when one side
+ends/starts with a single newline and the other side is not whitespace;
+other neighbouring segments are encoded together.
+
+load_tokenizer() returns the Rust-backed fast tokenizer after checking that
+it produces the same ids as the slow (pure-Python) one on sample texts, and
+falls back to the slow one when it does not.
+
+    python prompt_tokens.py                  # consistency check + tokenization timings
+"""
+import time
+from collections import OrderedDict
+
+MODEL_DIR = "./moot_lora_simple"
+CACHE_SIZE = 4096  # cached segments (context entries, templates, headers)
+
+SAMPLE_TEXTS = [
+    "The claimant was a procurement officer dismissed after alleged overstatement of procurement costs "
+    "totalling Ksh 825,700. After the hearing, a follow-up letter said the correct figure was Ksh 442,600.",
+    "Section 45(2) of the Employment Act, 2007 requires a valid reason; s. 41 requires a hearing.",
+    "[Cause No. 123 of 2019] Holding: the dismissal was unfair. | Orders: 12 months' compensation.",
+    "\n\nContext:\n[a.pdf] The court finds…\n\nFacts:\n  indented line\twith tab  \n\nJudgment:\n",
+    "“Curly quotes”, em—dashes, naïve café, 2nd & 3rd respondents; don't, it's, we'll.",
+]
+
+
+def consistency(fast, slow, texts=SAMPLE_TEXTS):
+    """Texts on which the two tokenizers disagree (ids or round trip)"""
+    mismatches = []
+    for text in texts:
+        fast_ids = fast(text, add_special_tokens=False)["input_ids"]
+        slow_ids = slow(text, add_special_tokens=False)["input_ids"]
+        if fast_ids != slow_ids or fast.decode(fast_ids) != slow.decode(slow_ids):
+            mismatches.append(text)
+    return mismatches
+
+
+def load_tokenizer(model_dir=MODEL_DIR, check=True, texts=SAMPLE_TEXTS):
+    """The fast tokenizer, if it matches the slow one on `texts`; otherwise the slow one"""
+    from transformers import AutoTokenizer
+
+    fast = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+    if not check or not fast.is_fast:
+        return fast
+    slow = AutoTokenizer.from_pretrained(model_dir, use_fast=False)
+    mismatches = consistency(fast, slow, texts)
+    if mismatches:
+        print(f"⚠️ Fast tokenizer disagrees with the slow one on {len(mismatches)} sample texts; using the slow one")
+        return slow
+    return fast
+
+
+def _spliceable(left, right):
+    """Whether ids(left) + ids(right) == ids(left + right) for a GPT-2 style pre-tokenizer"""
+    if not left or not right:
+        return True
+    # a single newline closing `left`, followed by non-whitespace
+    if left[-1] == "\n" and (len(left) < 2 or not left[-2].isspace()) and not right[0].isspace():
+        return True
+    # non-whitespace closing `left`, followed by a newline run
+    return not left[-1].isspace() and right[0] == "\n"
+
+
+class PromptEncoder:
+    """Builds prompt token ids from segments, reusing the ids of segments seen before"""
+
+    def __init__(self, tokenizer, static=(), cache_size=CACHE_SIZE):
+        self.tokenizer = tokenizer
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        for text in static:  # pre-tokenize templates and headers
+            self.ids(text)
+
+    def encode(self, text):
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def ids(self, text):
+        """Token ids of one segment, from the cache when possible"""
+        ids = self._cache.get(text)
+        if ids is not None:
+            self._cache.move_to_end(text)
+            self.hits += 1
+            return ids
+        self.misses += 1
+        ids = self.encode(text)
+        self._cache[text] = ids
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return ids
+
+    def build(self, segments):
+        """Token ids of "".join(segments); cached = segments expected to recur (templates, context)
+
+        segments: list of (text, cached) pairs.
+        """
+        groups = []  # [texts, cached] runs that must be encoded together
+        for text, cached in segments:
+            if not text:
+                continue
+            # the whole group is the left side: a merged "\n" may follow other whitespace
+            if groups and not _spliceable("".join(groups[-1][0]), text):
+                groups[-1][0].append(text)
+                groups[-1][1] = False
+            else:
+                groups.append([[text], cached])
+        ids = []
+        for texts, cached in groups:
+            joined = "".join(texts)
+            ids.extend(self.ids(joined) if cached else self.encode(joined))
+        return ids
+
+
+def main(argv=None):
+    import argparse
+    from transformers import AutoTokenizer
+
+    parser = argparse.ArgumentParser(description="Check the fast tokenizer and time prompt tokenization")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    fast = AutoTokenizer.from_pretrained(args.model_dir, use_fast=True)
+    slow = AutoTokenizer.from_pretrained(args.model_dir, use_fast=False)
+    if not fast.is_fast:
+        print(f"❌ No fast tokenizer available for {args.model_dir}")
+        return
+    mismatches = consistency(fast, slow)
+    print(f"{'✅' if not mismatches else '❌'} Fast vs slow tokenizer: "
+          f"{len(SAMPLE_TEXTS) - len(mismatches)}/{len(SAMPLE_TEXTS)} sample texts identical")
+
+    # a judge-sized prompt: template, four context entries, facts and two submissions
+    entries = [f"[case-{i}.pdf] " + " ".join(SAMPLE_TEXTS[:3]) * 4 for i in range(4)]
+    entries[1] += "\n"  # an entry ending in a newline merges with the "\n" separator after it
+    context = []
+    for i, entry in enumerate(entries):
+        context += ([("\n", True)] if i else []) + [(entry, True)]
+    segments = [("You are the Judge.", True), ("\n\nContext:\n", True), *context, ("\n\nFacts:\n", True),
+                (SAMPLE_TEXTS[0] * 3, False), ("\n\nJudgment:\n", True)]
+    prompt = "".join(text for text, _ in segments)
+
+    encoder = PromptEncoder(fast)
+    assembled = encoder.build(segments)
+    print(f"{'✅' if assembled == encoder.encode(prompt) else '❌'} Assembled ids match encoding the whole prompt "
+          f"({len(assembled)} tokens)")
+    for name, fn in [("slow tokenizer", lambda: slow(prompt)["input_ids"]),
+                     ("fast tokenizer", lambda: fast(prompt)["input_ids"]),
+                     ("fast + cached segments", lambda: encoder.build(segments))]:
+        t0 = time.perf_counter()
+        for _ in range(args.repeats):
+            fn()
+        print(f"⏱️ {name}: {(time.perf_counter() - t0) * 1000 / args.repeats:.2f} ms per prompt")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Compressed vector modes for the case index.
+
+- flat:   float32 IndexFlatIP (3 KB per 768-d vector)
+- int8:   scalar-quantized IndexScalarQuantizer (1 byte per dimension)
+- binary: sign bits in an IndexBinaryFlat searched by Hamming distance (1 bit per dimension)
+
+Compressed modes only do the first pass; a shortlist is rescored exactly
+against the full-precision vectors, which stay on disk and are memory-mapped.
+"""
+import json
+import os
+import numpy as np
+
+VECTORS_FILE = "case_vectors.npy"        # full-precision, normalized, memory-mapped at query time
+INFO_FILE = "case_index_info.json"       # which vector mode the index was built with
+INDEX_FILES = {
+    "flat": "case_index.faiss",
+    "int8": "case_index.int8.faiss",
+    "binary": "case_index.bin.faiss",
+}
+VECTOR_MODES = tuple(INDEX_FILES)
+RESCORE_FACTOR = 10                      # shortlist size = k * RESCORE_FACTOR
+
+
+def bytes_per_vector(mode, dim):
+    """Index memory per vector for a mode"""
+    if mode == "flat":
+        return dim * 4
+    if mode == "int8":
+        return dim
+    if mode == "binary":
+        return (dim + 7) // 8
+    raise ValueError(f"Unknown vector mode: {mode}")
+
+
+def binarize(embs):
+    """Pack the sign bits of (n, d) float vectors into (n, d/8) uint8 codes"""
+    return np.packbits(np.asarray(embs) > 0, axis=1)
+
+
+def new_index(dim, mode="flat"):
+    """Empty FAISS index for a mode"""
+    import faiss
+
+    if mode == "flat":
+        return faiss.IndexFlatIP(dim)
+    if mode == "int8":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    if mode == "binary":
+        return faiss.IndexBinaryFlat(dim)
+    raise ValueError(f"Unknown vector mode: {mode}")
+
+
+def add_vectors(index, embs, mode="flat"):
+    """Add normalized float32 embeddings, training the int8 quantizer on the first batch"""
+    if mode == "binary":
+        index.add(binarize(embs))
+        return
+    if not index.is_trained:
+        index.train(embs)
+    index.add(embs)
+
+
+def build_index(embs, mode="flat"):
+    """Build a FAISS index over normalized float32 embeddings"""
+    index = new_index(embs.shape[1], mode)
+    add_vectors(index, embs, mode)
+    return index
+
+
+def write_index(index, mode, directory="."):
+    import faiss
+
+    path = os.path.join(directory, INDEX_FILES[mode])
+    if mode == "binary":
+        faiss.write_index_binary(index, path)
+    else:
+        faiss.write_index(index, path)
+    return path
+
+
+def read_index(mode, directory="."):
+    import faiss
+
+    path = os.path.join(directory, INDEX_FILES[mode])
+    if mode == "binary":
+        return faiss.read_index_binary(path)
+    return faiss.read_index(path)
+
+
+def save_vectors(embs, directory="."):
+    np.save(os.path.join(directory, VECTORS_FILE), np.ascontiguousarray(embs, dtype=np.float32))
+
+
+def load_vectors(directory="."):
+    """Memory-map the full-precision vectors (None if they were never saved)"""
+    path = os.path.join(directory, VECTORS_FILE)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r")
+
+
+def save_info(mode, count, dim, directory="."):
+    info = {"vector_mode": mode, "dim": int(dim), "count": int(count)}
+    with open(os.path.join(directory, INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    return info
+
+
+def load_info(directory="."):
+    path = os.path.join(directory, INFO_FILE)
+    if not os.path.exists(path):
+        return {"vector_mode": "flat"}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def search(index, mode, query_embs, k, vectors=None, rescore_factor=RESCORE_FACTOR):
+    """Search an index of any mode; returns (scores, indices) like faiss.
+
+    For int8/binary, the first pass fetches k * rescore_factor candidates and
+    those are rescored with exact inner products against `vectors` (required).
+    """
+    ntotal = index.ntotal
+    if mode == "flat":
+        return index.search(query_embs, min(k, ntotal))
+    if vectors is None:
+        raise ValueError(f"a {mode} index needs its float vectors ({VECTORS_FILE}) to rescore hits")
+
+    shortlist = min(ntotal, max(k, k * rescore_factor))
+    if mode == "binary":
+        _, cand = index.search(binarize(query_embs), shortlist)
+    else:
+        _, cand = index.search(query_embs, shortlist)
+
+    scores = np.full((len(query_embs), min(k, ntotal)), -np.inf, dtype=np.float32)
+    indices = np.full((len(query_embs), min(k, ntotal)), -1, dtype=np.int64)
+    for qi, row in enumerate(cand):
+        row = row[row >= 0]
+        order = np.sort(row)  # sorted ids read the memmap sequentially
+        exact = np.asarray(vectors[order], dtype=np.float32) @ query_embs[qi]
+        top = np.argsort(-exact)[:k]
+        scores[qi, :len(top)] = exact[top]
+        indices[qi, :len(top)] = order[top]
+    return scores, indices
+
+
+def evaluate(embs, modes=VECTOR_MODES, k=10, n_queries=200, queries=None, rescore_factor=RESCORE_FACTOR, seed=0):
+    """Memory savings and recall@k of each mode against exact float search.
+
+    Without explicit queries, a sample of corpus vectors is used (leave-one-out:
+    the query's own vector is not counted as a neighbour).
+    """
+    embs = np.ascontiguousarray(embs, dtype=np.float32)
+    dim = embs.shape[1]
+    leave_one_out = queries is None
+    if leave_one_out:
+        rng = np.random.RandomState(seed)
+        sample = rng.choice(len(embs), size=min(n_queries, len(embs)), replace=False)
+        queries = embs[sample]
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    extra = 1 if leave_one_out else 0
+
+    exact = build_index(embs, "flat")
+    _, truth = exact.search(queries, min(k + extra, len(embs)))
+
+    report = {}
+    for mode in modes:
+        index = build_index(embs, mode)
+        _, found = search(index, mode, queries, k + extra, vectors=embs, rescore_factor=rescore_factor)
+        recalls = []
+        for qi in range(len(queries)):
+            gold = [i for i in truth[qi] if not (leave_one_out and i == sample[qi])][:k]
+            got = [i for i in found[qi] if not (leave_one_out and i == sample[qi])][:k]
+            if gold:
+                recalls.append(len(set(gold) & set(got)) / len(gold))
+        index_bytes = bytes_per_vector(mode, dim) * len(embs)
+        report[mode] = {
+            "bytes_per_vector": bytes_per_vector(mode, dim),
+            "index_mb": index_bytes / 1e6,
+            "memory_saving": 1.0 - bytes_per_vector(mode, dim) / bytes_per_vector("flat", dim),
+            f"recall@{k}": float(np.mean(recalls)) if recalls else 0.0,
+        }
+    return report
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Report memory savings and recall loss of compressed vector modes")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200, help="corpus vectors sampled as queries")
+    parser.add_argument("--rescore-factor", type=int, default=RESCORE_FACTOR)
+    args = parser.parse_args(argv)
+
+    embs = load_vectors()
+    if embs is None:
+        print(f"❌ {VECTORS_FILE} not found - run index_cases.py first")
+        return
+    report = evaluate(embs, k=args.k, n_queries=args.queries, rescore_factor=args.rescore_factor)
+    print(f"{len(embs)} vectors, dim {embs.shape[1]}")
+    print(f"{'mode':<8}{'bytes/vec':>10}{'index MB':>10}{'saving':>9}{f'recall@{args.k}':>11}")
+    for mode, r in report.items():
+        print(f"{mode:<8}{r['bytes_per_vector']:>10}{r['index_mb']:>10.2f}"
+              f"{r['memory_saving']:>8.0%}{r[f'recall@{args.k}']:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# reranker.py
+"""
+Cross-encoder second stage for retriever.retrieve.
+
+Scores (query, passage) pairs in batches with a small cross-encoder, caches
+scores per pair and gives up (keeping first-stage order) once the latency
+budget is spent.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+BATCH_SIZE = 8
+BUDGET_MS = 250.0        # total rerank time allowed per query
+CACHE_SIZE = 10000       # (query, doc) scores kept in memory
+
+_model = None
+_model_lock = threading.Lock()
+_cache = OrderedDict()
+_cache_lock = threading.Lock()  # queries run on job and script threads at once
+
+
+def _load_model():
+    """Lazy load the cross-encoder (once, even with concurrent queries)"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import CrossEncoder
+                _model = CrossEncoder(RERANK_MODEL)
+    return _model
+
+
+def _pair_key(query, doc):
+    text = doc.get("text", "")
+    doc_key = doc.get("id") or hashlib.sha1(text.encode("utf-8")).hexdigest()
+    return (query, doc_key, len(text))
+
+
+def _cache_get(key):
+    with _cache_lock:
+        score = _cache.get(key)
+        if score is not None:
+            _cache.move_to_end(key)
+        return score
+
+
+def _cache_put(key, score):
+    with _cache_lock:
+        _cache[key] = score
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def rerank(query, docs, top_k=None, budget_ms=BUDGET_MS, batch_size=BATCH_SIZE):
+    """Rerank retrieved docs with the cross-encoder.
+
+    Returns (docs, stats). Reranked docs carry a "rerank_score". If scoring
+    takes longer than the budget (checked after every batch), the first-stage
+    order is kept and stats["fallback"] is True; the scores computed so far
+    stay cached. Loading the model (on the first call) is
+    reported as stats["load_ms"] and does not count against the budget.
+    """
+    start = time.perf_counter()
+    stats = {"candidates": len(docs), "cache_hits": 0, "scored": 0, "fallback": False, "rerank_ms": 0.0,
+             "load_ms": 0.0}
+    if not docs:
+        return docs, stats
+
+    keys = [_pair_key(query, d) for d in docs]
+    scores = [_cache_get(k) for k in keys]
+    stats["cache_hits"] = sum(s is not None for s in scores)
+    pending = [i for i, s in enumerate(scores) if s is None]
+
+    try:
+        if pending:
+            loaded = time.perf_counter()
+            model = _load_model()
+            stats["load_ms"] = (time.perf_counter() - loaded) * 1000
+            start += stats["load_ms"] / 1000  # the budget clock starts once the model is loaded
+        for b in range(0, len(pending), batch_size):
+            batch = pending[b:b + batch_size]
+            batch_scores = model.predict([(query, docs[i].get("text", "")) for i in batch],
+                                         batch_size=batch_size)
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+                _cache_put(keys[i], scores[i])
+            stats["scored"] += len(batch)
+            # after scoring, so the last batch cannot overrun the budget unnoticed
+            if budget_ms is not None and (time.perf_counter() - start) * 1000 > budget_ms:
+                stats["fallback"] = True
+                break
+    except Exception as e:
+        print(f"❌ Error in rerank: {e}")
+        stats["fallback"] = True
+
+    stats["rerank_ms"] = (time.perf_counter() - start) * 1000
+    if stats["fallback"] or any(s is None for s in scores):
+        stats["fallback"] = True
+        return docs[:top_k] if top_k else docs, stats
+
+    reranked = []
+    for doc, score in sorted(zip(docs, scores), key=lambda x: x[1], reverse=True):
+        doc = dict(doc)
+        doc["rerank_score"] = score
+        reranked.append(doc)
+    return (reranked[:top_k] if top_k else reranked), stats
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Persistent store of finished moot hearings.
+
+Hearings are content-addressed: the key hashes the facts, issues, model
+version, index version and generation parameters, so rerunning the same case
+returns the stored hearing instantly, while a retrained model or rebuilt index
+simply misses the cache.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+STORE_FILE = "moot_results.sqlite"
+MODEL_DIR = "./moot_lora_simple"
+INDEX_FILES = ["case_index_info.json", "case_index.faiss", "case_index.int8.faiss",
+               "case_index.bin.faiss", "case_meta.jsonl", "case_meta.parquet"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hearings (
+    key TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    facts TEXT NOT NULL,
+    issues TEXT,
+    model_version TEXT NOT NULL,
+    index_version TEXT NOT NULL,
+    params TEXT NOT NULL,
+    result TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def _fingerprint(paths):
+    """Cheap content fingerprint from file names, sizes and mtimes"""
+    h = hashlib.sha256()
+    for path in paths:
+        if os.path.isfile(path):
+            st = os.stat(path)
+            h.update(f"{path}:{st.st_size}:{st.st_mtime_ns}".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def model_version(model_dir=MODEL_DIR):
+    """Version of the generation model: changes whenever its files do"""
+    if not os.path.isdir(model_dir):
+        return "none"
+    paths = sorted(os.path.join(model_dir, name) for name in os.listdir(model_dir))
+    return _fingerprint(paths)
+
+
+def index_version():
+    """Version of the search index: the served snapshot, or a fingerprint of
+    the unversioned index files (changes whenever index_cases.py rewrites them)"""
+    import retriever
+    import snapshots
+    return retriever.index_version() or snapshots.current_version() or _fingerprint(INDEX_FILES)
+
+
+def hearing_key(facts, issues, params=None, model=None, index=None):
+    """Content address of a hearing"""
+    payload = {
+        "facts": facts.strip(),
+        "issues": (issues or "").strip(),
+        "model_version": model or model_version(),
+        "index_version": index or index_version(),
+        "params": params or {},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResultStore:
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # one short-lived connection per call, so the store is safe to share across threads
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def lookup(self, facts, issues, params=None):
+        """Stored result for a hearing (None on a miss) plus its key"""
+        key = hearing_key(facts, issues, params)
+        return self.get(key), key
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT result FROM hearings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE hearings SET hits = hits + 1 WHERE key = ?", (key,))
+        return json.loads(row["result"])
+
+    def put(self, key, facts, issues, result, params=None):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO hearings (key, created, facts, issues, model_version, index_version, params, result)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, time.time(), facts, issues or "", model_version(), index_version(),
+                 json.dumps(params or {}, sort_keys=True), json.dumps(result, ensure_ascii=False)),
+            )
+
+    def list(self, limit=50, offset=0, search=None):
+        """Stored hearings, newest first (without the full result)"""
+        sql = "SELECT key, created, facts, issues, model_version, index_version, params, hits FROM hearings"
+        args = []
+        if search:
+            sql += " WHERE facts LIKE ? OR issues LIKE ?"
+            args += [f"%{search}%", f"%{search}%"]
+        sql += " ORDER BY created DESC LIMIT ? OFFSET ?"
+        args += [limit, offset]
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(sql, args)]
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM hearings").fetchone()[0]
+
+    def export(self, keys=None):
+        """Yield full hearings as dicts, ready to be written as JSONL"""
+        sql = "SELECT * FROM hearings"
+        args = []
+        if keys:
+            sql += f" WHERE key IN ({','.join('?' * len(keys))})"
+            args = list(keys)
+        with self._connect() as conn:
+            rows = conn.execute(sql + " ORDER BY created", args).fetchall()
+        for row in rows:
+            record = dict(row)
+            record["params"] = json.loads(record["params"])
+            record["result"] = json.loads(record["result"])
+            yield record
+
+    def export_jsonl(self, keys=None):
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in self.export(keys))
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Browse or export stored moot hearings")
+    parser.add_argument("command", choices=["list", "export"])
+    parser.add_argument("--store", default=STORE_FILE)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--output", default="moot_results.jsonl")
+    args = parser.parse_args(argv)
+
+    store = ResultStore(args.store)
+    if args.command == "list":
+        print(f"📚 {store.count()} stored hearings")
+        for h in store.list(limit=args.limit):
+            created = time.strftime("%Y-%m-%d %H:%M", time.localtime(h["created"]))
+            print(f"   {h['key'][:12]}  {created}  hits={h['hits']}  {h['facts'][:70]}...")
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(store.export_jsonl())
+        print(f"✅ Exported {store.count()} hearings to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# retrieval_plan.py
+"""
+Per-request retrieval plan.
+
+A hearing retrieves its precedents once; the UI precedent display, the
+argument generator (case_arguer) and the agents' prompt context all read
+from the same plan, so they agree on which precedents were used.
+"""
+from retriever import run_retrieval
+
+PLAN_TOP_K = 4          # precedents retrieved per hearing
+PLAN_MAX_PER_CASE = 1   # at most one passage per source judgment
+
+
+def hearing_query(facts, issues=None):
+    """Retrieval query for a hearing"""
+    return f"{facts} {issues}" if issues and issues.strip() else facts
+
+
+class RetrievalPlan:
+    def __init__(self, query, docs, timings=None, bundle=None):
+        self.query = query
+        self.docs = docs
+        self.timings = timings or {}
+        self.bundle = bundle  # retriever.IndexBundle the docs came from; per-version lookups go through it
+
+    @classmethod
+    def build(cls, facts, issues=None, top_k=PLAN_TOP_K, max_per_case=PLAN_MAX_PER_CASE, **retrieve_kwargs):
+        """Run retrieval once for a hearing"""
+        query = hearing_query(facts, issues)
+        docs, timings, bundle = run_retrieval(query, top_k=top_k, diversify=True, max_per_case=max_per_case,
+                                              **retrieve_kwargs)
+        return cls(query, docs, timings, bundle)
+
+    def precedents(self, n=None):
+        return self.docs[:n] if n else list(self.docs)
+
+    def context_entries(self, n=None):
+        """One "[source] ..." entry per precedent, using its case digest when available"""
+        from case_digests import context_entries
+        return context_entries(self.precedents(n), self.bundle.digests if self.bundle is not None else {})
+
+    def context(self, n=None):
+        """Prompt context: the context entries, one per line"""
+        return "\n".join(self.context_entries(n))
+
+    def sources(self):
+        return [d.get("source", "unknown") for d in self.docs]
+
+    def __len__(self):
+        return len(self.docs)
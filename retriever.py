@@ -1,83 +1,443 @@
 # retriever.py
-import json
+import contextvars
 import os
+import threading
+import time
 from pathlib import Path
+from instrumentation import span, record_error
+import snapshots
+import corpus
 
 # Global variables for lazy loading
-_index = None
+_bundle = None      # IndexBundle being served; replaced as a whole, never mutated
 _embedder = None
-_meta_docs = None
+_encoder_backend = None
+_last_timings = contextvars.ContextVar("retrieve_timings", default=None)  # per thread / task
+_swap_lock = threading.Lock()
+_swap_thread = None
+_failed_version = None
+_last_check = 0.0
+
+MMR_LAMBDA = 0.7      # relevance vs. novelty trade-off for diversified retrieval
+FETCH_FACTOR = 4      # candidates over-fetched per requested result when diversifying
+RERANK_TOP_N = 20     # first-stage candidates passed to the cross-encoder
+CITATION_DECAY = 0.5  # score multiplier per citation hop when expanding hits
+SNAPSHOT_POLL_S = 5.0 # how often queries check for a newly published index snapshot
+ENCODER_BACKEND = os.environ.get("MOOT_ENCODER", "torch")  # torch, onnx or onnx-int8 (see encoders.py)
+USE_SHARDS = os.environ.get("MOOT_SHARDS", "off") == "on"   # serve a sharded index through worker processes
+SHARD_DRAIN_S = 30.0  # a swapped-out bundle's shard workers are stopped after in-flight queries drain
 
 INDEX_FILE = "case_index.faiss"
 META_FILE = "case_meta.jsonl"
+META_BUILD_ONLY = ("full_text", "citations")  # meta columns serving never reads
 EMBED_MODEL = "all-mpnet-base-v2"
 
+class IndexBundle:
+    """Everything one index version serves. A query reads a single bundle
+    from start to finish, so swapping in a new one never mixes versions."""
+
+    def __init__(self, index, meta_docs, vectors=None, vector_mode="flat", graph=None, statutes=None,
+                 version=None, pinned=False, shards=None, sentences=None, digests=None):
+        self.index = index
+        self.meta_docs = meta_docs
+        self.vectors = vectors
+        self.vector_mode = vector_mode
+        self.graph = graph
+        self.statutes = statutes
+        self.version = version
+        self.pinned = pinned  # installed in memory: never replaced by a snapshot
+        self.shards = shards  # shards.ShardPool searched instead of `index`, if the index is sharded
+        self.sentences = sentences  # argument_slots.SentenceStore keyed by this version's passage ids
+        self.digests = digests or {}  # case_digests of this version's judgments, by digest_key
+
+    @classmethod
+    def load(cls, directory=".", version=None):
+        """Load the index files in a snapshot (or the working) directory; None if they are missing"""
+        import quantize
+        from citation_graph import CitationGraph, GRAPH_DIR
+        from statute_index import StatuteIndex, STATUTE_INDEX_FILE
+        from argument_slots import SentenceStore, STORE_DIR
+        from case_digests import load_digests, DIGEST_FILE
+        
+        import shards
+        
+        # Check if files exist
+        vector_mode = quantize.load_info(directory).get("vector_mode", "flat")
+        sharded = USE_SHARDS and shards.load_info(os.path.join(directory, shards.SHARD_DIR)) is not None
+        meta_path = corpus.locate(os.path.join(directory, META_FILE))
+        required = [meta_path]
+        if not sharded:
+            required.append(os.path.join(directory, quantize.INDEX_FILES[vector_mode]))
+        for path in required:
+            if not os.path.exists(path):
+                print(f"Warning: {path} not found")
+                return None
+        if (vector_mode != "flat" or sharded) and not os.path.exists(os.path.join(directory, quantize.VECTORS_FILE)):
+            # compressed and sharded indexes rescore, diversify and cap per case with the float vectors
+            message = (f"{quantize.VECTORS_FILE} not found in {directory}; a {vector_mode}"
+                       f"{' sharded' if sharded else ''} index cannot be served without it (rebuild with index_cases.py)")
+            print(f"❌ {message}")
+            record_error("retrieve.load_failed", message)
+            return None
+        
+        # Load components: one in-process index, or one worker process per shard
+        index = pool = None
+        if sharded:
+            pool = shards.ShardPool(os.path.join(directory, shards.SHARD_DIR))
+        else:
+            index = quantize.read_index(vector_mode, directory)
+        # Normalized full-precision vectors (memory-mapped), used for
+        # rescoring compressed hits and for MMR
+        vectors = quantize.load_vectors(directory)
+        if vectors is None and index is not None and vector_mode == "flat":
+            vectors = index.reconstruct_n(0, index.ntotal)
+        
+        # Load metadata: a memory-mapped table for Parquet; build-only columns stay on disk
+        meta_docs = corpus.load_table(meta_path, exclude=META_BUILD_ONLY)
+        
+        graph = CitationGraph.load(os.path.join(directory, GRAPH_DIR))
+        if graph is not None and len(graph) != len(meta_docs):
+            print("Warning: citation graph does not match the index; rebuild with index_cases.py")
+            graph = None
+        statutes = StatuteIndex.load(os.path.join(directory, STATUTE_INDEX_FILE))
+        sentences = SentenceStore.load(os.path.join(directory, STORE_DIR))
+        digests = load_digests(os.path.join(directory, DIGEST_FILE))
+        return cls(index, meta_docs, vectors, vector_mode, graph, statutes, version, shards=pool,
+                   sentences=sentences, digests=digests)
+
+    def close(self):
+        """Stop this bundle's shard workers (if any)"""
+        if self.shards is not None:
+            self.shards.close()
+
 def _load_components():
-    """Lazy load the search components"""
-    global _index, _embedder, _meta_docs
+    """Lazy load the search components; returns the IndexBundle to serve, or None"""
+    global _bundle, _embedder
     
     try:
         # Only load if not already loaded
-        if _index is None:
-            import faiss
-            import numpy as np
-            from sentence_transformers import SentenceTransformer
-            
-            # Check if files exist
-            if not os.path.exists(INDEX_FILE):
-                print(f"Warning: {INDEX_FILE} not found")
-                return False
-            
-            if not os.path.exists(META_FILE):
-                print(f"Warning: {META_FILE} not found")
-                return False
-            
-            # Load components
-            _index = faiss.read_index(INDEX_FILE)
-            _embedder = SentenceTransformer(EMBED_MODEL)
-            
-            # Load metadata
-            _meta_docs = []
-            with open(META_FILE, "r", encoding="utf-8") as f:
-                for line in f:
-                    _meta_docs.append(json.loads(line))
-            
-            print(f"✅ Loaded search index with {len(_meta_docs)} documents")
-            return True
+        if _bundle is None:
+            with _swap_lock:
+                if _bundle is None:
+                    version, directory = snapshots.current_path()
+                    bundle = IndexBundle.load(directory, version)
+                    if bundle is None:
+                        return None
+                    if _embedder is None:
+                        _load_embedder()
+                    _bundle = bundle
+                    print(f"✅ Loaded search index with {len(bundle.meta_docs)} documents"
+                          + (f" (snapshot {version})" if version else ""))
+        else:
+            _check_for_snapshot()
+        return _bundle
             
     except Exception as e:
         print(f"❌ Error loading search components: {e}")
-        return False
-    
-    return True
+        record_error("retrieve.load_failed", e)
+        return None
+
+def _load_embedder(backend=None):
+    """Query encoder for ENCODER_BACKEND; exported backends must have passed their fidelity check"""
+    global _embedder, _encoder_backend
+    from encoders import load_checked
+    _embedder, _encoder_backend = load_checked(backend or ENCODER_BACKEND, EMBED_MODEL)
 
-def retrieve(query, top_k=4):
-    """Retrieve relevant documents for a query"""
+def _check_for_snapshot():
+    """Start loading a newly published snapshot in the background (checked at most every SNAPSHOT_POLL_S)"""
+    global _last_check, _swap_thread
+    now = time.monotonic()
+    if _bundle.pinned or now - _last_check < SNAPSHOT_POLL_S:
+        return
+    _last_check = now
+    version = snapshots.current_version()
+    if version is None or version in (_bundle.version, _failed_version):
+        return
+    with _swap_lock:
+        if _swap_thread is not None and _swap_thread.is_alive():
+            return
+        _swap_thread = threading.Thread(target=_swap_to, args=(version,), name="index-swap", daemon=True)
+        _swap_thread.start()
+
+def _swap_to(version):
+    """Load a snapshot off the query path, then serve it with a single assignment.
+
+    Queries already running keep the bundle they started with; the old one is
+    freed once the last of them finishes.
+    """
+    global _bundle, _failed_version
     try:
-        # Load components if needed
-        if not _load_components():
-            return []
-        
-        if _index is None or _embedder is None or _meta_docs is None:
-            return []
+        with span("retrieve.swap", version=version) as s:
+            bundle = IndexBundle.load(snapshots.snapshot_path(version), version)
+        if bundle is None:
+            _failed_version = version
+            return
+        old, _bundle = _bundle, bundle
+        if old is not None and old.shards is not None:
+            timer = threading.Timer(SHARD_DRAIN_S, old.close)
+            timer.daemon = True
+            timer.start()
+        print(f"🔄 Now serving index snapshot {version} ({len(bundle.meta_docs)} documents, loaded in {s.ms:.0f} ms)")
+    except Exception as e:
+        _failed_version = version
+        print(f"❌ Could not load index snapshot {version}: {e}")
+        record_error("retrieve.swap_failed", e)
+
+def refresh(wait=True):
+    """Check for a new snapshot now instead of on the next poll; returns the served version"""
+    global _last_check
+    if _bundle is None:
+        bundle = _load_components()
+        return bundle.version if bundle else None
+    _last_check = 0.0
+    _check_for_snapshot()
+    thread = _swap_thread
+    if wait and thread is not None:
+        thread.join()
+    return _bundle.version
+
+def get_bundle():
+    """The IndexBundle being served (loaded on first use), or None"""
+    return _load_components()
+
+def index_version():
+    """Snapshot version being served (None for an unversioned or in-memory index)"""
+    return _bundle.version if _bundle is not None else None
+
+def load(embedder=None):
+    """Load the index now (instead of on the first query) and describe it
+
+    embedder: an already-loaded SentenceTransformer to reuse instead of loading another.
+    """
+    global _embedder, _encoder_backend
+    if embedder is not None and _embedder is None:
+        _embedder, _encoder_backend = embedder, "external"
+    bundle = _load_components()
+    if bundle is None:
+        return {"loaded": False, "documents": 0, "vector_mode": "flat", "version": None, "encoder": _encoder_backend}
+    return {"loaded": True, "documents": len(bundle.meta_docs), "vector_mode": bundle.vector_mode,
+            "version": bundle.version, "encoder": _encoder_backend}
+
+def install(index, meta_docs, vectors=None, vector_mode="flat", graph=None):
+    """Serve an in-memory index (e.g. one built by quantize.build_index) instead of the files on disk
+
+    An installed index is pinned: published snapshots do not replace it until reset().
+    """
+    global _bundle
+    if vector_mode != "flat" and vectors is None:
+        raise ValueError(f"a {vector_mode} index needs its float vectors for rescoring")
+    if _embedder is None:
+        _load_embedder()
+    _bundle = IndexBundle(index, meta_docs, vectors, vector_mode, graph, pinned=True)
+
+def current_index():
+    """(index, meta_docs, vectors, vector_mode, graph) being served; install(*current_index()) restores it"""
+    b = _bundle
+    if b is None:
+        return None, None, None, "flat", None
+    return b.index, b.meta_docs, b.vectors, b.vector_mode, b.graph
+
+def reset(keep_embedder=True):
+    """Forget the loaded index so the next call reloads it from disk"""
+    global _bundle, _embedder, _encoder_backend
+    if _bundle is not None:
+        _bundle.close()
+    _bundle = None
+    if not keep_embedder:
+        _embedder = _encoder_backend = None
+
+def lookup_section(reference, limit=None):
+    """Passages citing a statute section ("Section 44(4) of the Employment Act", "s.45")
+
+    An inverted-index lookup, so no embedding or vector search is involved.
+    Citing judgments are returned in corpus order, one passage per judgment.
+    """
+    b = _load_components()
+    if b is None or b.statutes is None:
+        return []
+    with span("retrieve.statute", reference=reference) as s:
+        results, seen = [], set()
+        for row in b.statutes.rows(reference):
+            if row >= len(b.meta_docs):
+                continue
+            doc = b.meta_docs[row]
+            if _case_key(doc) in seen:
+                continue
+            seen.add(_case_key(doc))
+            result = doc.copy()
+            result.update({"via": "statute", "section": reference})
+            results.append(result)
+            if limit and len(results) >= limit:
+                break
+        s.set(results=len(results))
+    return results
+
+def _case_key(doc):
+    """Identify the source judgment a passage belongs to"""
+    return doc.get("case_id") or doc.get("source") or doc.get("id")
+
+def mmr_select(query_vec, cand_vecs, top_k, lambda_mult=MMR_LAMBDA, groups=None, max_per_group=None):
+    """Maximal marginal relevance over a candidate set.
+
+    Returns positions into cand_vecs. Each step is a vectorized update over
+    all candidates, so the cost is O(top_k * n) NumPy work, no Python double loop.
+    """
+    import numpy as np
+
+    n = len(cand_vecs)
+    if n == 0:
+        return []
+    relevance = cand_vecs @ query_vec
+    pairwise = cand_vecs @ cand_vecs.T
+    max_sim = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    if groups is not None:
+        _, group_ids = np.unique(np.asarray(groups, dtype=object).astype(str), return_inverse=True)
+        group_counts = np.zeros(group_ids.max() + 1, dtype=np.int32)
+
+    selected = []
+    for _ in range(min(top_k, n)):
+        redundancy = np.where(np.isfinite(max_sim), max_sim, 0.0)
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            break
+        selected.append(best)
+        available[best] = False
+        max_sim = np.maximum(max_sim, pairwise[best])
+        if groups is not None and max_per_group:
+            group_counts[group_ids[best]] += 1
+            if group_counts[group_ids[best]] >= max_per_group:
+                available &= group_ids != group_ids[best]
+    return selected
+
+def get_last_timings():
+    """Per-stage latency (ms) of the most recent retrieve() call in this thread (or asyncio task)"""
+    return dict(_last_timings.get() or {})
+
+def retrieve(query, top_k=4, diversify=False, fetch_k=None, lambda_mult=MMR_LAMBDA, max_per_case=None,
+             rerank=False, rerank_top_n=RERANK_TOP_N, rerank_budget_ms=None, expand_hops=0, expand_k=None):
+    """Retrieve relevant documents for a query
+
+    With diversify=True, fetch_k candidates (default top_k * FETCH_FACTOR) are
+    re-ranked with maximal marginal relevance. max_per_case keeps at most that
+    many hits from the same source judgment (in plain score order if not
+    diversifying).
+
+    With rerank=True, the first rerank_top_n first-stage hits are re-scored by
+    the cross-encoder in reranker.py, falling back to first-stage order if
+    rerank_budget_ms is exceeded. run_retrieval() also returns the stage latencies.
+
+    With expand_hops=1 or 2, up to expand_k (default top_k) extra judgments
+    that cite or are cited by the hits are appended, scored by hit score *
+    CITATION_DECAY**hops * PageRank authority and marked "via": "citation".
+    """
+    return run_retrieval(query, top_k, diversify, fetch_k, lambda_mult, max_per_case, rerank,
+                         rerank_top_n, rerank_budget_ms, expand_hops, expand_k)[0]
+
+def run_retrieval(query, top_k=4, diversify=False, fetch_k=None, lambda_mult=MMR_LAMBDA, max_per_case=None,
+                  rerank=False, rerank_top_n=RERANK_TOP_N, rerank_budget_ms=None, expand_hops=0, expand_k=None):
+    """retrieve(), also returning the per-stage timings and the IndexBundle that served the query:
+    (docs, timings, bundle). Per-version data of the hits (sentence store, digests) must come from
+    that bundle, not from whichever one is served by the time it is read.
+    """
+    timings = {}
+    _last_timings.set(timings)
+    try:
+        with span("retrieve", top_k=top_k, diversify=diversify, rerank=rerank) as total:
+            results, bundle = _retrieve(query, top_k, diversify, fetch_k, lambda_mult, max_per_case,
+                                        rerank, rerank_top_n, rerank_budget_ms, expand_hops, expand_k, timings)
+        timings["total_ms"] = total.ms
+        return results, timings, bundle
         
-        # Encode query
+    except Exception as e:
+        # already counted as an error of the "retrieve" span
+        print(f"❌ Error in retrieve function: {e}")
+        return [], timings, None
+
+def _retrieve(query, top_k, diversify, fetch_k, lambda_mult, max_per_case,
+              rerank, rerank_top_n, rerank_budget_ms, expand_hops, expand_k, timings):
+    import faiss
+    import quantize
+
+    # Load components if needed
+    with span("retrieve.load"):
+        b = _load_components()  # this query uses b throughout, even if a new snapshot is swapped in
+    
+    if b is None or _embedder is None:
+        return [], b
+    
+    # Encode query
+    with span("retrieve.embed", encoder=_encoder_backend) as s:
         query_emb = _embedder.encode([query], convert_to_numpy=True)
         faiss.normalize_L2(query_emb)
-        
-        # Search
-        scores, indices = _index.search(query_emb, top_k)
-        
-        # Return results
+    timings["embed_ms"] = s.ms
+    
+    # Search
+    first_k = max(top_k, rerank_top_n) if rerank else top_k
+    rerank_candidates = diversify or bool(max_per_case)
+    search_k = first_k
+    if rerank_candidates:
+        search_k = max(first_k, fetch_k or first_k * FETCH_FACTOR)
+    with span("retrieve.search", k=search_k, vector_mode=b.vector_mode) as s:
+        if b.shards is not None:
+            scores, indices, missing = b.shards.search(query_emb, search_k)
+            s.set(shards=b.shards.count, missing_shards=len(missing))
+            timings["missing_shards"] = missing
+        else:
+            scores, indices = quantize.search(b.index, b.vector_mode, query_emb, search_k, vectors=b.vectors)
+        hits = [(float(score), int(idx)) for score, idx in zip(scores[0], indices[0])
+                if 0 <= idx < len(b.meta_docs)]
+    timings["search_ms"] = s.ms
+    
+    if rerank_candidates and hits and b.vectors is not None:
+        with span("retrieve.mmr", candidates=len(hits)) as s:
+            cand_ids = [idx for _, idx in hits]
+            groups = [_case_key(b.meta_docs[idx]) for idx in cand_ids]
+            order = mmr_select(query_emb[0], b.vectors[cand_ids], first_k,
+                               lambda_mult if diversify else 1.0,
+                               groups=groups, max_per_group=max_per_case)
+            hits = [hits[i] for i in order]
+        timings["mmr_ms"] = s.ms
+    
+    # Return results
+    with span("retrieve.metadata", hits=len(hits[:first_k])) as s:
         results = []
-        for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-            if idx < len(_meta_docs):
-                doc = _meta_docs[idx].copy()
-                doc['score'] = float(score)
-                results.append(doc)
-        
-        return results
-        
-    except Exception as e:
-        print(f"❌ Error in retrieve function: {e}")
-        return []
+        for score, idx in hits[:first_k]:
+            doc = b.meta_docs[idx].copy()
+            doc['score'] = score
+            results.append(doc)
+    timings["metadata_ms"] = s.ms
+    
+    if rerank:
+        import reranker
+        budget = reranker.BUDGET_MS if rerank_budget_ms is None else rerank_budget_ms
+        with span("retrieve.rerank", candidates=len(results)) as s:
+            results, stats = reranker.rerank(query, results, top_k=top_k, budget_ms=budget)
+            s.set(fallback=stats["fallback"], cache_hits=stats["cache_hits"])
+        timings["rerank_ms"] = stats["rerank_ms"]
+        if stats["load_ms"]:
+            timings["rerank_load_ms"] = stats["load_ms"]
+        timings["rerank_fallback"] = stats["fallback"]
+    
+    results = results[:top_k]
+    if expand_hops and b.graph is not None and hits:
+        with span("retrieve.citations", hops=expand_hops) as s:
+            results += _expand_citations(b, hits[:first_k], expand_hops, expand_k or top_k)
+        timings["citations_ms"] = s.ms
+    
+    return results, b
+
+def _expand_citations(b, hits, hops, limit):
+    """Judgments within `hops` citation links of the hits, best first"""
+    seeds = {idx: max(score, 0.0) for score, idx in hits}
+    found = b.graph.expand(seeds, hops=hops, decay=CITATION_DECAY)
+    expanded = []
+    for row, (score, hop, via) in sorted(found.items(), key=lambda item: item[1][0], reverse=True)[:limit]:
+        doc = b.meta_docs[row].copy()
+        doc.update({"score": score, "via": "citation", "hops": hop,
+                    "cited_with": b.meta_docs[via].get("source", "unknown"),
+                    "authority": float(b.graph.authority[row])})
+        expanded.append(doc)
+    return expanded
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Role-specialised LoRA adapters over one resident base model.
+
+`python train_lora_simple.py --roles claimant respondent judge` trains one
+adapter per role into moot_lora_simple/adapters/<role>/. RoleAdapters loads
+the base DialoGPT-medium once and attaches every adapter to it (a LoRA adapter
+is a few MB against the base's ~1.4 GB), so the three roles cost one model's
+memory. A request switches the active adapter (use(role)); the adapter is
+model-wide state, so requests take turns on the model.
+
+prompt_segments() is the prompt layout both training and serving use, so
+each adapter is served the template it was trained on.
+
+    python role_adapters.py        # memory footprint and adapter switch latency
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+MODEL_DIR = "./moot_lora_simple"
+ADAPTERS_SUBDIR = "adapters"
+BASE_MODEL = "microsoft/DialoGPT-medium"
+ROLES = ("claimant", "respondent", "judge")
+SHARED = "shared"  # the joint adapter in MODEL_DIR, used for roles without their own
+
+# role prompts, shared by training (train_lora_simple.py) and inference (agents.py)
+SYSTEM_TEMPLATES = {
+    "claimant": "You are the Claimant's counsel in a moot court. Produce a clear legal submission arguing that dismissal was unfair. Support your submission by reference to the provided precedents where relevant. Keep to < 600 words.",
+    "respondent": "You are the Respondent's counsel. Provide a rebuttal to the Claimant's points. Use the precedents to support the defense of the employer. Keep it focused and professional.",
+    "judge": "You are the Judge. Given the facts and arguments, analyze procedurally and substantively, evaluate the cited precedents and give a reasoned judgment, list orders and monetary award if any."
+}
+ANSWER_HEADERS = {"claimant": "Claimant Submission", "respondent": "Respondent Submission", "judge": "Judgment"}
+
+
+def role_sections(role, facts, claimant="", respondent=""):
+    """(header, text) sections a role is prompted with: the facts and the submissions before its turn"""
+    if role == "respondent":
+        return [("Facts", facts), ("Claimant said", claimant)]
+    if role == "judge":
+        return [("Facts", facts), ("Claimant", claimant), ("Respondent", respondent)]
+    return [("Facts", facts)]
+
+
+def prompt_segments(role, ctx_entries, sections):
+    """(text, static) segments of a role prompt: template, context entries, sections and the answer header
+
+    static marks text that repeats across requests (see prompt_tokens.PromptEncoder).
+    """
+    segments = [(SYSTEM_TEMPLATES[role], True), ("\n\nContext:\n", True)]
+    for i, entry in enumerate(ctx_entries):
+        segments += ([("\n", True)] if i else []) + [(entry, True)]
+    for header, text in sections:
+        segments += [(f"\n\n{header}:\n", True), (text, False)]
+    segments.append((f"\n\n{ANSWER_HEADERS[role]}:\n", True))
+    return segments
+
+
+def prompt_text(role, ctx_entries, sections):
+    return "".join(text for text, _ in prompt_segments(role, ctx_entries, sections))
+
+
+def adapters_dir(model_dir=MODEL_DIR):
+    return os.path.join(model_dir, ADAPTERS_SUBDIR)
+
+
+def available(model_dir=MODEL_DIR):
+    """Roles with a trained adapter"""
+    root = adapters_dir(model_dir)
+    return [r for r in ROLES if os.path.exists(os.path.join(root, r, "adapter_config.json"))]
+
+
+def _base_model_name(model_dir):
+    for path in [os.path.join(adapters_dir(model_dir), r, "adapter_config.json") for r in ROLES] + \
+            [os.path.join(model_dir, "adapter_config.json")]:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f).get("base_model_name_or_path") or BASE_MODEL
+    return BASE_MODEL
+
+
+def _mb(params):
+    return sum(p.numel() * p.element_size() for p in params) / 1e6
+
+
+class RoleAdapters:
+    """One base model with a LoRA adapter per role"""
+
+    def __init__(self, model_dir=MODEL_DIR, torch_dtype=None, device_map="auto"):
+        import torch
+        from peft import PeftModel
+        from transformers import AutoModelForCausalLM
+        from prompt_tokens import load_tokenizer
+
+        self.roles = available(model_dir)
+        if not self.roles:
+            raise FileNotFoundError(f"no role adapters in {adapters_dir(model_dir)}; "
+                                    "train them with train_lora_simple.py --roles ...")
+        t0 = time.perf_counter()
+        self.tokenizer = load_tokenizer(model_dir)
+        base = AutoModelForCausalLM.from_pretrained(_base_model_name(model_dir), device_map=device_map,
+                                                    torch_dtype=torch_dtype or torch.float16)
+        root = adapters_dir(model_dir)
+        self.model = PeftModel.from_pretrained(base, os.path.join(root, self.roles[0]), adapter_name=self.roles[0])
+        for role in self.roles[1:]:
+            self.model.load_adapter(os.path.join(root, role), adapter_name=role)
+        if os.path.exists(os.path.join(model_dir, "adapter_config.json")):
+            self.model.load_adapter(model_dir, adapter_name=SHARED)
+        self.model.eval()
+        self.load_s = time.perf_counter() - t0
+        self.active = self.roles[0]
+        self.switch_ms = []
+        self._lock = threading.Lock()
+
+    @property
+    def device(self):
+        return self.model.device
+
+    def adapter_for(self, role):
+        if role in self.roles:
+            return role
+        return SHARED if SHARED in self.model.peft_config else self.roles[0]
+
+    def activate(self, role):
+        """Make role's adapter the active one; returns the switch time in ms"""
+        name = self.adapter_for(role)
+        t0 = time.perf_counter()
+        if name != self.active:
+            self.model.set_adapter(name)
+            self.active = name
+        ms = (time.perf_counter() - t0) * 1000
+        self.switch_ms.append(ms)
+        return ms
+
+    @contextmanager
+    def use(self, role):
+        """Hold the model with role's adapter active (one request at a time per model)"""
+        from instrumentation import observe
+
+        with self._lock:
+            ms = self.activate(role)
+            observe("generate.adapter_switch", ms, "ms", role=role)
+            yield self.model
+
+    def memory_report(self):
+        """Parameter memory of the base model and of each adapter, in MB"""
+        adapters = {}
+        base = []
+        for name, param in self.model.named_parameters():
+            owner = next((a for a in self.model.peft_config if f".{a}." in name or name.endswith(f".{a}")), None)
+            if "lora_" in name and owner:
+                adapters.setdefault(owner, []).append(param)
+            else:
+                base.append(param)
+        base_mb = _mb(base)
+        adapter_mb = {name: _mb(params) for name, params in adapters.items()}
+        return {"base_mb": base_mb, "adapters_mb": adapter_mb, "total_mb": base_mb + sum(adapter_mb.values()),
+                "separate_models_mb": base_mb * len(self.roles)}
+
+
+def main():
+    adapters = RoleAdapters()
+    report = adapters.memory_report()
+    print(f"📦 Base model: {report['base_mb']:.0f} MB, loaded in {adapters.load_s:.1f} s")
+    for name, mb in report["adapters_mb"].items():
+        print(f"   adapter {name}: {mb:.1f} MB")
+    print(f"Total resident: {report['total_mb']:.0f} MB "
+          f"(vs {report['separate_models_mb']:.0f} MB for {len(adapters.roles)} separate models)")
+
+    for _ in range(20):
+        for role in adapters.roles:
+            adapters.activate(role)
+    switches = sorted(adapters.switch_ms)
+    print(f"⏱️ Adapter switch: p50 {switches[len(switches) // 2]:.3f} ms, max {switches[-1]:.3f} ms "
+          f"over {len(switches)} switches")
+
+
+if __name__ == "__main__":
+    main()
@@ -34,6 +34,7 @@ def build_index():
     print("🔍 Building document index...")
     try:
         import index_cases
+        index_cases.main([])
         print("✅ Document index built successfully")
     except Exception as e:
         print(f"⚠️  Could not build index: {e}")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Entry point of one shard worker process, started by shards.ShardPool.
+
+The workers are started as this small script rather than as multiprocessing
+children: spawn re-imports the parent's __main__ in every child, so
+`python agents.py` (or any script that loads a model at import time) would
+load one model copy per shard. This module imports nothing but numpy and
+quantize.
+
+    python shard_worker.py '{"address": ..., "path": ..., "offset": ..., "delay_ms": ...}'
+
+The connection's authkey is read from MOOT_SHARD_AUTHKEY (hex).
+"""
+import json
+import os
+import sys
+import time
+from multiprocessing.connection import Client
+
+import numpy as np
+
+AUTHKEY_ENV = "MOOT_SHARD_AUTHKEY"
+
+
+def serve(path, offset, conn, delay_ms=0):
+    """Answer (request id, query embeddings, k) with global-row top-k until the pool hangs up"""
+    import quantize
+
+    mode = quantize.load_info(path)["vector_mode"]
+    index = quantize.read_index(mode, path)
+    vectors = quantize.load_vectors(path)
+    if vectors is None and mode != "flat":
+        raise FileNotFoundError(f"{os.path.join(path, quantize.VECTORS_FILE)} not found")  # never reported ready
+    conn.send(("ready", index.ntotal))
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+        request, query_embs, k = message
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        scores, indices = quantize.search(index, mode, query_embs, k, vectors=vectors)
+        conn.send((request, scores, np.where(indices >= 0, indices + offset, -1)))
+    conn.close()
+
+
+def main(argv=None):
+    spec = json.loads((sys.argv[1:] if argv is None else argv)[0])
+    address = spec["address"]
+    conn = Client(tuple(address) if isinstance(address, list) else address,
+                  authkey=bytes.fromhex(os.environ[AUTHKEY_ENV]))
+    serve(spec["path"], spec["offset"], conn, spec.get("delay_ms", 0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Sharded scatter-gather search.
+
+`index_cases.py --shards N` partitions the vectors into N contiguous row
+ranges, each with its own index (any vector mode) and float vectors:
+
+    shards/
+        shards.json            # count, vector mode and the global row offset of each shard
+        shard-0/ ... shard-N-1/
+
+At query time the retriever sends the query embedding to one worker process
+per shard, each returns its local top-k (mapped to global rows), and the
+lists are merged with a heap. A shard that does not answer within the
+timeout is left out of that query's results instead of stalling it, and a
+worker that died is restarted in the background. Answers are matched to
+queries by request id, so concurrent queries share the workers without
+waiting for each other; a shard with MAX_IN_FLIGHT unanswered queries is
+skipped until it catches up.
+
+The workers are local processes standing in for nodes (shard_worker.py,
+connected back over a multiprocessing Listener), so the whole setup runs on
+one machine. Serving a sharded index is opt-in: MOOT_SHARDS=on.
+
+    python shards.py --check                   # sharded top-k must match a single-index search
+    python shards.py --check --delay-shard 1   # a slow shard is dropped after the timeout
+"""
+import heapq
+import itertools
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+import numpy as np
+
+import shard_worker
+
+SHARD_DIR = "shards"
+SHARDS_FILE = "shards.json"
+SHARD_TIMEOUT_MS = 250   # per query; slower shards are left out of that query
+STARTUP_TIMEOUT_S = 120  # time for a worker to load its shard
+RESTART_BACKOFF_S = 10   # minimum time between restarts of a dead worker
+MAX_IN_FLIGHT = 8        # unanswered queries per shard before it is skipped
+
+
+def shard_path(directory, i):
+    return os.path.join(directory, f"shard-{i}")
+
+
+def build(vectors, mode="flat", n_shards=2, directory=SHARD_DIR):
+    """Partition normalized vectors into n_shards contiguous shards and write their indexes"""
+    import quantize
+
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    bounds = np.linspace(0, len(vectors), n_shards + 1).astype(np.int64)
+    for i in range(n_shards):
+        part = np.ascontiguousarray(vectors[bounds[i]:bounds[i + 1]], dtype=np.float32)
+        path = shard_path(directory, i)
+        os.makedirs(path)
+        quantize.write_index(quantize.build_index(part, mode), mode, path)
+        quantize.save_vectors(part, path)
+        quantize.save_info(mode, len(part), part.shape[1], path)
+    info = {"count": n_shards, "vector_mode": mode, "offsets": bounds.tolist()}
+    with open(os.path.join(directory, SHARDS_FILE), "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    return info
+
+
+def load_info(directory=SHARD_DIR):
+    """shards.json, or None if the index is not sharded"""
+    path = os.path.join(directory, SHARDS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ShardPool:
+    """One worker process per shard; search() fans a query out and merges the answers
+
+    Each connection has a reader thread that hands answers to the query
+    that sent them (matched by request id), so concurrent queries run at
+    the same time and a slow shard delays only the queries waiting on it.
+    """
+
+    def __init__(self, directory=SHARD_DIR, timeout_ms=SHARD_TIMEOUT_MS, delays=None):
+        info = load_info(directory)
+        if info is None:
+            raise FileNotFoundError(f"{os.path.join(directory, SHARDS_FILE)} not found")
+        self.directory = directory
+        self.count = info["count"]
+        self.offsets = info["offsets"]
+        self.timeout_ms = timeout_ms
+        self.delays = delays or {}  # {shard: ms}, to simulate slow nodes
+        self._authkey = os.urandom(32)
+        self._workers = [None] * self.count     # (process, connection or None until it connects, send lock, ready)
+        self._listeners = [None] * self.count   # where each worker connects back
+        self._started = [0.0] * self.count
+        self._in_flight = [0] * self.count      # queries sent to a shard and not yet answered
+        self._pending = {}                      # request id -> queue.Queue of (shard, scores, indices)
+        self._requests = itertools.count(1)
+        self._lock = threading.Lock()
+        for i in range(self.count):
+            self._start(i)
+        deadline = time.monotonic() + STARTUP_TIMEOUT_S
+        for i in range(self.count):
+            if not self._workers[i][3].wait(max(0.0, deadline - time.monotonic())):
+                print(f"⚠️ Shard {i} did not start; it is left out until it does")
+
+    def _start(self, i):
+        listener = Listener(authkey=self._authkey)
+        spec = {"address": listener.address, "path": os.path.abspath(shard_path(self.directory, i)),
+                "offset": self.offsets[i], "delay_ms": self.delays.get(i, 0)}
+        process = subprocess.Popen([sys.executable, shard_worker.__file__, json.dumps(spec)],
+                                   env=dict(os.environ, **{shard_worker.AUTHKEY_ENV: self._authkey.hex()}))
+        ready = threading.Event()
+        self._workers[i] = (process, None, threading.Lock(), ready)
+        self._listeners[i] = listener
+        self._started[i] = time.monotonic()
+        self._in_flight[i] = 0
+        threading.Thread(target=self._read, args=(i, listener, process, ready), name=f"moot-shard-reader-{i}",
+                         daemon=True).start()
+
+    def _wake(self, i):
+        """Unblock the reader of a worker that died before connecting back (its accept() never returns)"""
+        try:
+            Client(self._listeners[i].address, authkey=self._authkey).close()
+        except OSError:
+            pass  # the reader already gave up on the listener
+
+    def _read(self, i, listener, process, ready):
+        """Reader thread of one worker: accept its connection, then route each answer to the query waiting for it"""
+        try:
+            conn = listener.accept()
+        except (OSError, EOFError):
+            return
+        finally:
+            listener.close()
+        with self._lock:
+            current, _, send_lock, _ = self._workers[i]
+            if current is not process:  # woken by _wake(): a newer worker replaced this one
+                conn.close()
+                return
+            self._workers[i] = (process, conn, send_lock, ready)
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                return
+            if message[0] == "ready":
+                ready.set()
+                continue
+            request, scores, indices = message
+            with self._lock:
+                if self._workers[i][1] is conn:
+                    self._in_flight[i] = max(0, self._in_flight[i] - 1)
+                answers = self._pending.get(request)
+            if answers is not None:
+                answers.put((i, scores, indices))
+            # otherwise a late answer to a query that already timed out: dropped
+
+    def _send(self, request, query_embs, k):
+        """Send the query to every live, ready shard; returns (sent, missing) shard ids"""
+        from instrumentation import record_error
+
+        sent, missing = [], []
+        for i in range(self.count):
+            with self._lock:
+                process, conn, send_lock, ready = self._workers[i]
+                if process.poll() is not None:
+                    record_error("retrieve.shard_down", f"shard {i} exited with {process.returncode}")
+                    if time.monotonic() - self._started[i] >= RESTART_BACKOFF_S:
+                        if conn is None:
+                            self._wake(i)
+                        self._start(i)  # back for a later query once it has loaded
+                    missing.append(i)
+                    continue
+                if not ready.is_set() or self._in_flight[i] >= MAX_IN_FLIGHT:
+                    # still loading, or stuck on earlier queries: do not pile more onto its pipe
+                    missing.append(i)
+                    continue
+                self._in_flight[i] += 1
+            try:
+                with send_lock:
+                    conn.send((request, query_embs, k))
+                sent.append(i)
+            except (BrokenPipeError, OSError):
+                with self._lock:
+                    self._in_flight[i] = max(0, self._in_flight[i] - 1)
+                missing.append(i)
+        return sent, missing
+
+    def search(self, query_embs, k, timeout_ms=None):
+        """Merged top-k over all shards: (scores, indices, missing shard ids)
+
+        scores/indices have faiss shape (n_queries, k). Each query runs on
+        all shards in parallel; concurrent queries do not wait for each other.
+        """
+        from instrumentation import record_error
+
+        timeout = (self.timeout_ms if timeout_ms is None else timeout_ms) / 1000
+        query_embs = np.ascontiguousarray(query_embs, dtype=np.float32)
+        request = next(self._requests)
+        inbox = queue.Queue()
+        with self._lock:
+            self._pending[request] = inbox
+        try:
+            sent, missing = self._send(request, query_embs, k)
+            deadline = time.perf_counter() + timeout
+            answers = {}
+            while len(answers) < len(sent):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    shard, shard_scores, shard_indices = inbox.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                answers[shard] = (shard_scores, shard_indices)
+        finally:
+            with self._lock:
+                del self._pending[request]
+        for i in sent:
+            if i not in answers:
+                missing.append(i)
+                record_error("retrieve.shard_timeout", f"shard {i}")
+
+        n = len(query_embs)
+        scores = np.full((n, k), -np.inf, dtype=np.float32)
+        indices = np.full((n, k), -1, dtype=np.int64)
+        for qi in range(n):
+            candidates = ((float(s), int(idx)) for shard_scores, shard_indices in answers.values()
+                          for s, idx in zip(shard_scores[qi], shard_indices[qi]) if idx >= 0)
+            for rank, (score, idx) in enumerate(heapq.nlargest(k, candidates)):
+                scores[qi, rank], indices[qi, rank] = score, idx
+        return scores, indices, sorted(missing)
+
+    def close(self):
+        for i, (process, conn, send_lock, _) in enumerate(self._workers):
+            if conn is None:
+                process.terminate()  # still loading; it never connected
+                self._wake(i)
+            else:
+                try:
+                    with send_lock:
+                        conn.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.terminate()
+            if conn is not None:
+                conn.close()
+
+
+def check(directory=SHARD_DIR, queries=50, k=10, delay_shard=None, timeout_ms=SHARD_TIMEOUT_MS):
+    """Compare sharded top-k against one exact search over the same vectors"""
+    import quantize
+
+    info = load_info(directory)
+    vectors = np.concatenate([np.asarray(quantize.load_vectors(shard_path(directory, i)))
+                              for i in range(info["count"])])
+    delays = {delay_shard: timeout_ms * 4} if delay_shard is not None else None
+    pool = ShardPool(directory, timeout_ms=timeout_ms, delays=delays)
+    try:
+        rng = np.random.RandomState(0)
+        sample = vectors[rng.choice(len(vectors), size=min(queries, len(vectors)), replace=False)]
+        truth = np.argsort(-(sample @ vectors.T), axis=1)[:, :k]
+        overlap, latencies, missing = [], [], set()
+        for qi, query in enumerate(sample):
+            t0 = time.perf_counter()
+            _, indices, gone = pool.search(query[None, :], k)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            missing.update(gone)
+            overlap.append(len(set(indices[0].tolist()) & set(truth[qi].tolist())) / k)
+    finally:
+        pool.close()
+    latencies.sort()
+    return {"shards": info["count"], "recall@k": float(np.mean(overlap)), "missing_shards": sorted(missing),
+            "p50_ms": latencies[len(latencies) // 2], "max_ms": latencies[-1]}
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check the sharded index against single-index search")
+    parser.add_argument("--dir", default=SHARD_DIR)
+    parser.add_argument("--check", action="store_true", help="run the sharded vs. single-index comparison")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--delay-shard", type=int, default=None, help="make this shard slower than the timeout")
+    parser.add_argument("--timeout-ms", type=float, default=SHARD_TIMEOUT_MS)
+    args = parser.parse_args(argv)
+
+    info = load_info(args.dir)
+    if info is None:
+        print(f"❌ No sharded index in {args.dir}; run index_cases.py --shards N")
+        return
+    print(f"📦 {info['count']} shards ({info['vector_mode']}), row offsets {info['offsets']}")
+    if args.check:
+        result = check(args.dir, args.queries, args.k, args.delay_shard, args.timeout_ms)
+        print(f"recall@{args.k} vs single index: {result['recall@k']:.3f}  "
+              f"p50 {result['p50_ms']:.1f} ms, max {result['max_ms']:.1f} ms  "
+              f"missing shards: {result['missing_shards'] or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
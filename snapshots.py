@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Versioned index snapshots.
+
+index_cases.py builds the index artifacts in the working directory and then
+publishes them as an immutable snapshot:
+
+    index_snapshots/
+        MANIFEST.json          # every published version, newest last
+        CURRENT                # name of the version being served
+        20260301-101500/       # case_index*.faiss, case_meta.jsonl, case_vectors.npy, ...
+
+Publishing copies the artifacts into a new version directory and then
+replaces CURRENT atomically, so a reader sees either the old or the new
+version and never a half-written one. Running processes notice the new
+CURRENT and swap to it in the background (see retriever.py).
+
+The side indexes (citation_graph.py, statute_index.py, argument_slots.py,
+case_digests.py) can be rebuilt on their own: they read the served
+snapshot's case meta and republish() it with the rebuilt artifact swapped in.
+
+    python snapshots.py list
+    python snapshots.py activate 20260301-101500   # roll back / forward
+"""
+import json
+import os
+import shutil
+import time
+
+SNAPSHOT_DIR = "index_snapshots"
+MANIFEST_FILE = "MANIFEST.json"
+CURRENT_FILE = "CURRENT"
+KEEP_SNAPSHOTS = 3  # published versions kept on disk (the current one is never pruned)
+
+# Everything retrieval reads; missing entries (e.g. an int8 index in flat mode) are skipped
+ARTIFACTS = ["case_index_info.json", "case_index.faiss", "case_index.int8.faiss", "case_index.bin.faiss",
+             "case_vectors.npy", "case_meta.jsonl", "case_meta.parquet", "citation_graph", "statute_index.json", "sentence_store",
+             "shards", "case_digests.jsonl"]
+
+
+def _write_atomic(path, text):
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_manifest(root=SNAPSHOT_DIR):
+    path = os.path.join(root, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"snapshots": []}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def current_version(root=SNAPSHOT_DIR):
+    """Version named by CURRENT, or None when no snapshot was ever published"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def snapshot_path(version, root=SNAPSHOT_DIR):
+    return os.path.join(root, version)
+
+
+def current_path(root=SNAPSHOT_DIR):
+    """(version, directory) to serve: the current snapshot, or the working directory"""
+    version = current_version(root)
+    if version and os.path.isdir(snapshot_path(version, root)):
+        return version, snapshot_path(version, root)
+    return None, "."
+
+
+def served_file(name, root=SNAPSHOT_DIR):
+    """Path of an artifact in the served snapshot (in the working directory when none is published)"""
+    return os.path.join(current_path(root)[1], name)
+
+
+def _link_or_copy(src, dst):
+    # snapshots are never modified in place, so a new one can share files with the current one
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _copy_artifact(src, dst, copy_function=shutil.copy2):
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, copy_function=copy_function)
+    elif os.path.isfile(src):
+        copy_function(src, dst)
+    else:
+        return False
+    return True
+
+
+def _new_version(root):
+    version = time.strftime("%Y%m%d-%H%M%S")
+    suffix = 1
+    while os.path.exists(snapshot_path(version, root)):
+        suffix += 1
+        version = f"{time.strftime('%Y%m%d-%H%M%S')}-{suffix}"
+    return version
+
+
+def publish(source=".", root=SNAPSHOT_DIR, keep=KEEP_SNAPSHOTS, info=None):
+    """Copy the artifacts in `source` into a new snapshot and make it current"""
+    os.makedirs(root, exist_ok=True)
+    version = _new_version(root)
+    staging = os.path.join(root, f".staging-{version}")
+    os.makedirs(staging)
+    copied = [name for name in ARTIFACTS if _copy_artifact(os.path.join(source, name), os.path.join(staging, name))]
+    return _commit(version, staging, copied, root, keep, info)
+
+
+def republish(names, source=".", root=SNAPSHOT_DIR, keep=KEEP_SNAPSHOTS):
+    """Publish the current snapshot again with the `names` artifacts taken from `source`
+
+    Every other artifact is carried over (hard-linked where possible), and a
+    name missing from `source` is dropped. Returns the new version, or None
+    when no snapshot is published (the working directory is served as is).
+    """
+    current = current_version(root)
+    if current is None or not os.path.isdir(snapshot_path(current, root)):
+        return None
+    unknown = set(names) - set(ARTIFACTS)
+    if unknown:
+        raise ValueError(f"not snapshot artifacts: {sorted(unknown)}")
+    version = _new_version(root)
+    staging = os.path.join(root, f".staging-{version}")
+    os.makedirs(staging)
+    copied = []
+    for name in ARTIFACTS:
+        if name in names:
+            kept = _copy_artifact(os.path.join(source, name), os.path.join(staging, name))
+        else:
+            kept = _copy_artifact(os.path.join(snapshot_path(current, root), name), os.path.join(staging, name),
+                                  copy_function=_link_or_copy)
+        if kept:
+            copied.append(name)
+    base = next((s for s in load_manifest(root)["snapshots"] if s["version"] == current), {})
+    info = {k: v for k, v in base.items() if k not in ("version", "created", "artifacts", "rebuilt")}
+    return _commit(version, staging, copied, root, keep, {**info, "base": current, "rebuilt": sorted(names)})
+
+
+def _commit(version, staging, copied, root, keep, info):
+    os.rename(staging, snapshot_path(version, root))
+    manifest = load_manifest(root)
+    manifest["snapshots"].append({"version": version, "created": time.time(), "artifacts": copied, **(info or {})})
+    _write_atomic(os.path.join(root, MANIFEST_FILE), json.dumps(manifest, indent=2))
+    activate(version, root)
+    prune(root, keep)
+    return version
+
+
+def activate(version, root=SNAPSHOT_DIR):
+    """Point CURRENT at a published version (atomic)"""
+    if not os.path.isdir(snapshot_path(version, root)):
+        raise ValueError(f"unknown snapshot {version}")
+    _write_atomic(os.path.join(root, CURRENT_FILE), version + "\n")
+
+
+def prune(root=SNAPSHOT_DIR, keep=KEEP_SNAPSHOTS):
+    """Delete all but the newest `keep` snapshots, never the current one.
+
+    Processes still serving a pruned version keep working: its meta is in
+    memory and memory-mapped files stay readable after unlinking.
+    """
+    manifest = load_manifest(root)
+    current = current_version(root)
+    versions = [s["version"] for s in manifest["snapshots"]]
+    stale = [v for v in versions[:-keep] if v != current] if keep else []
+    for version in stale:
+        shutil.rmtree(snapshot_path(version, root), ignore_errors=True)
+    if stale:
+        manifest["snapshots"] = [s for s in manifest["snapshots"] if s["version"] not in stale]
+        _write_atomic(os.path.join(root, MANIFEST_FILE), json.dumps(manifest, indent=2))
+    return stale
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage versioned index snapshots")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="show published snapshots")
+    publish_cmd = sub.add_parser("publish", help="snapshot the index files in the working directory")
+    publish_cmd.add_argument("--keep", type=int, default=KEEP_SNAPSHOTS)
+    activate_cmd = sub.add_parser("activate", help="serve a published snapshot")
+    activate_cmd.add_argument("version")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        current = current_version()
+        for s in load_manifest()["snapshots"]:
+            marker = "→" if s["version"] == current else " "
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(s["created"]))
+            print(f"{marker} {s['version']}  {created}  {s.get('documents', '?')} docs  {s.get('vector_mode', '')}")
+    elif args.command == "publish":
+        print(f"✅ Published snapshot {publish(keep=args.keep)}")
+    else:
+        activate(args.version)
+        print(f"✅ Serving snapshot {args.version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Inverted index from statute sections to the passages that cite them.
+
+Ingestion parses references such as "Section 44(4) of the Employment Act",
+"sections 41 and 43 of the Employment Act, 2007" or "Article 41 of the
+Constitution", normalizes them to keys like "employment act|s44(4)" and
+stores key -> passage rows (rows of case_meta.jsonl) in statute_index.json.
+A lookup is then a dict access instead of a semantic search.
+"""
+import json
+import os
+import re
+import corpus
+import snapshots
+
+STATUTE_INDEX_FILE = "statute_index.json"
+META_FILE = "case_meta.jsonl"
+ANY_ACT = "*"
+MAX_RANGE = 20  # "sections 41 to 45" is expanded; longer ranges keep only the endpoints
+
+_NUMBER = r"\d+[A-Z]?(?:\s*\(\s*\w{1,4}\s*\))*"
+# words that never start or make up an act's name ("the said Act", "provisions of the Act")
+_STOP = (r"(?:the|a|an|of|in|under|this|that|these|said|same|such|its|his|her|their|our|section|sections|"
+         r"article|articles|provisions?|and|or|to|by|with|for|on|at|from|as|is|was|be|which|pursuant|per|"
+         r"principal|above|aforesaid|relevant|s|ss|art)")
+_WORD = r"(?!" + _STOP + r"\b)[A-Za-z][\w'’]*"
+# "Employment", "Law of Contract", "Employment and Labour Relations Court"
+_NAME = _WORD + r"(?:\s+(?:(?:and|of|&)\s+)?" + _WORD + r"){0,5}"
+GENERIC_ACTS = {"act", "regulations", "rules", "code"}  # "the Act": the act named last
+REFERENCE = re.compile(
+    r"\b(?P<kind>sections?|ss?\.|articles?|art\.?)\s*"
+    r"(?P<nums>" + _NUMBER + r"(?:\s*(?:,|and|&|or|to|-|–)\s*" + _NUMBER + r")*)"
+    r"(?:\s*(?:of|under|in)\s+(?:the\s+)?"
+    r"(?P<act>(?:" + _NAME + r"\s+)?(?:Act|Constitution|Regulations|Rules|Code)\b"
+    r"(?:,?\s*(?:No\.\s*\d+\s+of\s+)?(?:19|20)\d{2})?))?",
+    re.IGNORECASE)
+ACT_MENTION = re.compile(r"\b(?:the\s+)?(" + _NAME + r"\s+(?:Act|Regulations|Rules|Code)|Constitution)\b",
+                         re.IGNORECASE)
+
+
+def normalize_act(act):
+    """'the Employment Act, 2007' -> 'employment act'"""
+    act = re.sub(r",?\s*(?:No\.\s*\d+\s+of\s+)?(?:19|20)\d{2}$", "", act.strip())
+    act = re.sub(r"^(?:the)\s+", "", act, flags=re.IGNORECASE)
+    return re.sub(r"\s+", " ", act).strip().lower()
+
+
+def _section_numbers(nums):
+    """'41 and 43' -> ['41', '43']; '44(4)' -> ['44(4)']; '41 to 45' -> ['41', ..., '45']"""
+    parts = re.split(r"\s*(,|and|&|or|to|-|–)\s*", nums)
+    numbers, expand_next = [], False
+    for part in parts:
+        if part in (",", "and", "&", "or"):
+            continue
+        if part in ("to", "-", "–"):
+            expand_next = True
+            continue
+        number = re.sub(r"\s+", "", part).lower()
+        if expand_next and numbers and numbers[-1].isdigit() and number.isdigit() \
+                and 0 < int(number) - int(numbers[-1]) <= MAX_RANGE:
+            numbers.extend(str(n) for n in range(int(numbers[-1]) + 1, int(number) + 1))
+        else:
+            numbers.append(number)
+        expand_next = False
+    return numbers
+
+
+def section_key(act, number, kind="s"):
+    """('employment act', '44(4)') -> 'employment act|s44(4)'"""
+    return f"{act}|{kind}{number}"
+
+
+def _ancestor_numbers(number):
+    """'44(4)(a)' -> ['44', '44(4)', '44(4)(a)']"""
+    parts = re.findall(r"^[^(]+|\([^)]*\)", number)
+    return ["".join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+def extract_references(text, default_act=None):
+    """Normalized statute keys cited in a text.
+
+    A reference without an act ("Section 41") or with a generic one ("section
+    12 of the Act") is attributed to the act most recently named before it
+    (articles only to the Constitution), falling back to default_act.
+    """
+    acts = [(m.start(), normalize_act(m.group(1))) for m in ACT_MENTION.finditer(text or "")]
+    keys = set()
+    for m in REFERENCE.finditer(text or ""):
+        kind = "art" if m.group("kind").lower().startswith("art") else "s"
+        act = normalize_act(m.group("act")) if m.group("act") else None
+        if act is None or act in GENERIC_ACTS:
+            previous = [a for pos, a in acts if pos < m.start() and (kind == "art") == (a == "constitution")]
+            act = previous[-1] if previous else (default_act or ANY_ACT)
+        if kind == "art" and act == ANY_ACT:
+            act = "constitution"
+        for number in _section_numbers(m.group("nums")):
+            keys.add(section_key(act, number, kind))
+    return keys
+
+
+def parse_query(reference):
+    """Keys to look up for a user query such as 'Section 44(4) Employment Act' or 's.45'"""
+    text = reference.strip()
+    act_match = ACT_MENTION.search(text)
+    act = normalize_act(act_match.group(1)) if act_match else ANY_ACT
+    m = REFERENCE.search(text) or re.search(r"(?P<kind>)(?P<nums>" + _NUMBER + r")(?P<act>)", text)
+    if not m:
+        return []
+    if m.group("act") and normalize_act(m.group("act")) not in GENERIC_ACTS:
+        act = normalize_act(m.group("act"))
+    kind = "art" if m.group("kind").lower().startswith("art") else "s"
+    if kind == "art" and act == ANY_ACT:
+        act = "constitution"
+    return [section_key(act, n, kind) for n in _section_numbers(m.group("nums"))]
+
+
+def _iter_meta(path):
+    return corpus.iter_records(path, columns=["text", "full_text"])
+
+
+def build(docs, path=STATUTE_INDEX_FILE):
+    """Build and persist the inverted index for docs in index (meta) order.
+
+    docs: a list of docs or the path of a meta JSONL (streamed). Each
+    reference is posted under its exact key, every enclosing section
+    ("s44(4)(c)" also counts as "s44(4)" and "s44") and an any-act key
+    ("*|s44(4)(c)").
+    """
+    postings = {}
+    for row, doc in enumerate(_iter_meta(docs) if isinstance(docs, str) else docs):
+        keys = extract_references(doc.get("full_text") or doc.get("text", ""))
+        expanded = set()
+        for key in keys:
+            act, section = key.split("|", 1)
+            kind = "art" if section.startswith("art") else "s"
+            number = section[len(kind):]
+            for n in _ancestor_numbers(number):
+                expanded.add(section_key(act, n, kind))
+                expanded.add(section_key(ANY_ACT, n, kind))
+        for key in expanded:
+            postings.setdefault(key, []).append(row)
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "postings": postings}, f)
+    return {"sections": sum(1 for k in postings if not k.startswith(ANY_ACT)), "postings": sum(map(len, postings.values()))}
+
+
+class StatuteIndex:
+    """Section key -> passage rows"""
+
+    def __init__(self, postings):
+        self.postings = postings
+
+    @classmethod
+    def load(cls, path=STATUTE_INDEX_FILE):
+        """The persisted index, or None if it was never built"""
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["postings"])
+
+    def rows(self, reference):
+        """Passage rows citing a section reference, in corpus order"""
+        rows = set()
+        for key in parse_query(reference):
+            rows.update(self.postings.get(key, ()))
+        return sorted(rows)
+
+    def sections(self, act=None):
+        """Indexed section keys (optionally for one act), most cited first"""
+        keys = [k for k in self.postings if not k.startswith(ANY_ACT + "|")]
+        if act:
+            keys = [k for k in keys if k.startswith(normalize_act(act) + "|")]
+        return sorted(keys, key=lambda k: len(self.postings[k]), reverse=True)
+
+
+def label(key):
+    """'employment act|s44(4)' -> 'Section 44(4), Employment Act'"""
+    act, section = key.split("|", 1)
+    name = f"Article {section[3:]}" if section.startswith("art") else f"Section {section[1:]}"
+    return name if act == ANY_ACT else f"{name}, {act.title()}"
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the statute-section index for the indexed corpus")
+    parser.add_argument("--meta", default=None, help="case meta (default: the served snapshot's)")
+    parser.add_argument("--output", default=STATUTE_INDEX_FILE)
+    parser.add_argument("--lookup", default=None, help='print the rows citing a section, e.g. "Section 44(4)"')
+    parser.add_argument("--no-snapshot", action="store_true",
+                        help="only write --output; do not republish the served snapshot with it")
+    args = parser.parse_args()
+
+    if args.lookup:
+        index = StatuteIndex.load(args.output)
+        if index is None:
+            print(f"❌ {args.output} not found; build it first")
+            return
+        print(f"{args.lookup}: rows {index.rows(args.lookup)}")
+        return
+    stats = build(args.meta or corpus.locate(snapshots.served_file(META_FILE)), args.output)
+    print(f"✅ Statute index: {stats['sections']} sections, {stats['postings']} postings")
+    if not args.no_snapshot and os.path.normpath(args.output) == STATUTE_INDEX_FILE:
+        version = snapshots.republish([STATUTE_INDEX_FILE])
+        if version:
+            print(f"Published index snapshot {version}; running apps switch to it without a restart.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import threading
+
+from moot_jobs import JobRunner
+
+
+def _blocking(started, release, log):
+    def hearing(name):
+        log.append(name)
+        started.set()
+        release.wait(5)
+        return name
+    return hearing
+
+
+def test_interactive_job_runs_before_queued_batch_jobs():
+    runner = JobRunner(max_workers=1, interactive_workers=0, interactive_slots=0)
+    started, release, order = threading.Event(), threading.Event(), []
+    hearing = _blocking(started, release, order)
+
+    first = runner.submit("b0", hearing, "batch-0", priority="batch")
+    assert started.wait(5)  # the only worker is busy from here on
+    batch = [runner.submit(f"b{i}", hearing, f"batch-{i}", priority="batch") for i in (1, 2)]
+    interactive = runner.submit("i", hearing, "interactive", priority="interactive")
+    assert runner.position(interactive)[0] == 0
+    assert runner.position(batch[0])[0] == 1
+
+    release.set()
+    for job_id in [first, *batch, interactive]:
+        runner.get(job_id).result()
+    assert order == ["batch-0", "interactive", "batch-1", "batch-2"]
+
+
+def test_batch_jobs_leave_the_reserved_worker_idle():
+    runner = JobRunner(max_workers=2, interactive_workers=1)
+    started, release, order = threading.Event(), threading.Event(), []
+    hearing = _blocking(started, release, order)
+
+    batch = [runner.submit(f"b{i}", hearing, f"batch-{i}", priority="batch") for i in range(2)]
+    assert started.wait(5)
+    assert runner.stats()["batch"] == {"queued": 1, "running": 1}
+
+    started.clear()
+    interactive = runner.submit("i", hearing, "interactive", priority="interactive")
+    assert started.wait(5)  # started at once on the reserved worker
+    assert runner.get(batch[1]).status == "queued"
+
+    release.set()
+    for job_id in [*batch, interactive]:
+        runner.get(job_id).result()
+    assert order == ["batch-0", "interactive", "batch-1"]
@@ -0,0 +1,23 @@
+import statute_index
+from statute_index import StatuteIndex, extract_references, parse_query
+
+
+def _index(texts, tmp_path):
+    path = str(tmp_path / "statute_index.json")
+    statute_index.build([{"text": t} for t in texts], path)
+    return StatuteIndex.load(path)
+
+
+def test_subsection_query_finds_deeper_citations(tmp_path):
+    index = _index(["Section 44(4)(c) of the Employment Act applies.",
+                    "Section 44(3) of the Employment Act applies."], tmp_path)
+    assert index.rows("Section 44(4)") == [0]
+    assert index.rows("Section 44") == [0, 1]
+    assert index.rows("Section 44(4)(c) Employment Act") == [0]
+
+
+def test_art_without_period_is_an_article():
+    assert extract_references("as guaranteed by Art 41 of the Constitution") == {"constitution|art41"}
+    assert extract_references("see Art 41") == {"constitution|art41"}
+    assert parse_query("Art 41") == ["constitution|art41"]
+    assert parse_query("Art. 41") == ["constitution|art41"]
@@ -2,10 +2,15 @@
 """
 Simplified LoRA training script with a smaller model
 """
+import argparse
+import functools
 import json
 import os
+import re
 import torch
 from datasets import load_dataset
+import corpus
+from role_adapters import ROLES, ANSWER_HEADERS, prompt_text, role_sections
 from transformers import AutoTokenizer, AutoModelForCausalLM, TrainingArguments, Trainer, DataCollatorForLanguageModeling
 from peft import LoraConfig, get_peft_model, TaskType
 
@@ -18,9 +23,18 @@ BASE_MODEL = "microsoft/DialoGPT-medium"  # Much smaller model
 JSONL_PATH = "training.jsonl"
 OUTPUT_DIR = "./moot_lora_simple"
 
+parser = argparse.ArgumentParser(description="LoRA fine-tuning for the moot court model")
+parser.add_argument("--roles", nargs="+", choices=ROLES, default=None,
+                    help="train one adapter per role into OUTPUT_DIR/adapters/<role> instead of one joint adapter")
+parser.add_argument("--context-k", type=int, default=4,
+                    help="precedents retrieved into each role prompt's Context block, as agents.py serves them "
+                         "(0: leave the block empty, e.g. without a built index)")
+args = parser.parse_args()
+
 # 1. Load dataset
-print(f"Loading dataset from {JSONL_PATH}...")
-dataset = load_dataset("json", data_files=JSONL_PATH)["train"]
+print(f"Loading dataset from {corpus.locate(JSONL_PATH)}...")
+data_path = corpus.locate(JSONL_PATH)  # training.jsonl or training.parquet
+dataset = load_dataset("parquet" if corpus.is_parquet(data_path) else "json", data_files=data_path)["train"]
 print(f"Dataset loaded with {len(dataset)} samples")
 
 # build text pairs: instruction + input -> output
@@ -31,6 +45,27 @@ def build_prompt(example):
     prompt = f"{instr}\n\n{inp}\n\n###\n\n{out}"
     return prompt
 
+def role_section(output, role):
+    """The part of a "Claimant: ...\nRespondent: ...\nJudge: ..." output spoken by one role"""
+    names = {"claimant": "Claimant", "respondent": "Respondent", "judge": "Judge"}
+    match = re.search(rf"(?:^|\n){names[role]}:\s*(.*?)(?=\n(?:Claimant|Respondent|Judge):|\Z)", output, re.S)
+    return match.group(1).strip() if match else ""
+
+@functools.lru_cache(maxsize=None)  # retrieved once per example, not once per role
+def context_entries(facts):
+    """The Context block agents.run_moot serves for these facts"""
+    if not args.context_k:
+        return ()
+    from retrieval_plan import RetrievalPlan
+    return tuple(RetrievalPlan.build(facts).context_entries(args.context_k))
+
+def build_role_prompt(example, role):
+    # the prompt agents.build_prompt serves (role_adapters.prompt_segments), followed by the role's answer
+    facts, output = example.get("input", ""), example.get("output", "")
+    sections = role_sections(role, facts, role_section(output, "claimant"), role_section(output, "respondent"))
+    return prompt_text(role, context_entries(facts), sections) + role_section(output, role)
+
+raw_dataset = dataset
 dataset = dataset.map(lambda x: {"text": build_prompt(x)}, remove_columns=dataset.column_names)
 
 # 2. Tokenizer and model
@@ -39,63 +74,84 @@ tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL)
 if tokenizer.pad_token is None:
     tokenizer.pad_token = tokenizer.eos_token
 
-print(f"Loading model from {BASE_MODEL}...")
-model = AutoModelForCausalLM.from_pretrained(
-    BASE_MODEL,
-    torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
-)
-print("Model loaded successfully!")
-
-# 3. PEFT LoRA config
-print("Setting up LoRA configuration...")
-lora_config = LoraConfig(
-    r=8,  # Smaller rank
-    lora_alpha=16,
-    target_modules=["c_attn", "c_proj"],  # GPT-2 style modules
-    lora_dropout=0.1,
-    bias="none",
-    task_type=TaskType.CAUSAL_LM
-)
-model = get_peft_model(model, lora_config)
-print("LoRA model created successfully!")
+def load_lora_model():
+    print(f"Loading model from {BASE_MODEL}...")
+    model = AutoModelForCausalLM.from_pretrained(
+        BASE_MODEL,
+        torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
+    )
+    print("Model loaded successfully!")
+
+    # 3. PEFT LoRA config
+    print("Setting up LoRA configuration...")
+    lora_config = LoraConfig(
+        r=8,  # Smaller rank
+        lora_alpha=16,
+        target_modules=["c_attn", "c_proj"],  # GPT-2 style modules
+        lora_dropout=0.1,
+        bias="none",
+        task_type=TaskType.CAUSAL_LM
+    )
+    model = get_peft_model(model, lora_config)
+    print("LoRA model created successfully!")
+    return model
 
 # 4. Tokenize
-print("Tokenizing dataset...")
 def tok(ex):
     return tokenizer(ex["text"], truncation=True, max_length=512, padding=True)
 
-tokenized = dataset.map(tok, batched=True, remove_columns=["text"])
 data_collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
-print(f"Dataset tokenized with {len(tokenized)} samples")
 
 # 5. Trainer
-print("Setting up training arguments...")
-training_args = TrainingArguments(
-    output_dir=OUTPUT_DIR,
-    per_device_train_batch_size=1,
-    gradient_accumulation_steps=4,
-    num_train_epochs=2,
-    learning_rate=5e-4,
-    logging_steps=5,
-    save_steps=25,
-    warmup_steps=5,
-    save_total_limit=2,
-    eval_strategy="no",
-    remove_unused_columns=False,
-)
-
-print("Creating trainer...")
-trainer = Trainer(
-    model=model,
-    args=training_args,
-    train_dataset=tokenized,
-    data_collator=data_collator,
-)
-
-print("Starting training...")
-trainer.train()
-
-print("Saving model...")
-model.save_pretrained(OUTPUT_DIR)
+def train(dataset, output_dir):
+    model = load_lora_model()
+    print("Tokenizing dataset...")
+    tokenized = dataset.map(tok, batched=True, remove_columns=["text"])
+    print(f"Dataset tokenized with {len(tokenized)} samples")
+
+    print("Setting up training arguments...")
+    training_args = TrainingArguments(
+        output_dir=output_dir,
+        per_device_train_batch_size=1,
+        gradient_accumulation_steps=4,
+        num_train_epochs=2,
+        learning_rate=5e-4,
+        logging_steps=5,
+        save_steps=25,
+        warmup_steps=5,
+        save_total_limit=2,
+        eval_strategy="no",
+        remove_unused_columns=False,
+    )
+
+    print("Creating trainer...")
+    trainer = Trainer(
+        model=model,
+        args=training_args,
+        train_dataset=tokenized,
+        data_collator=data_collator,
+    )
+
+    print("Starting training...")
+    trainer.train()
+
+    print("Saving model...")
+    model.save_pretrained(output_dir)
+    return model
+
+if args.roles:
+    # one small adapter per role over the same base; role_adapters.py serves them from one resident model
+    for role in args.roles:
+        role_dataset = raw_dataset.map(lambda x: {"text": build_role_prompt(x, role)},
+                                       remove_columns=raw_dataset.column_names)
+        role_dataset = role_dataset.filter(lambda x: not x["text"].endswith(f"{ANSWER_HEADERS[role]}:\n"))
+        if len(role_dataset) == 0:
+            print(f"⚠️ No {role} sections in {JSONL_PATH}; skipping")
+            continue
+        print(f"Training {role} adapter on {len(role_dataset)} samples...")
+        train(role_dataset, os.path.join(OUTPUT_DIR, "adapters", role))
+        print(f"Saved {role} adapter to {os.path.join(OUTPUT_DIR, 'adapters', role)}")
+else:
+    train(dataset, OUTPUT_DIR)
 tokenizer.save_pretrained(OUTPUT_DIR)
 print(f"Saved LoRA-tuned model to {OUTPUT_DIR}")